@@ -0,0 +1,279 @@
+import gc
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from typing import Any, Callable, TypedDict
+
+import pandas as pd
+
+from synthetic import generate
+
+import generate_imports as gi  # noqa: E402 (src/ is added to the path by synthetic)
+from resources.conflation import conflate
+from resources.diffing import diff_snapshots
+from resources.instrumentation import PeakMemory
+from resources.openstreetmap import overpass_to_gdf
+from resources.partitioning import BoundaryIndex, assign_partitions, group_partitions
+from resources.text_repair import TextRepair
+from resources.toronto_encoding_issues import encoding_fixes, spelling_fixes
+from resources.validation import configure_validation, get_validator
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+DEFAULT_SCALES = [1, 100]
+# stages faster than this are too noisy to report as regressions
+MIN_SECONDS = 0.25
+DEFAULT_THRESHOLD = 1.25
+
+
+class StageResult(TypedDict):
+    seconds: float
+    peak_mb: float
+    rows_in: int | None
+    rows_out: int
+
+
+def count_rows(value: Any) -> int:
+    if isinstance(value, dict):
+        return sum(len(x) for x in value.values() if isinstance(x, pd.DataFrame))
+    if isinstance(value, tuple):
+        return count_rows(value[0])
+    return len(value)
+
+
+def run_stage(
+    fn: Callable[[], Any], rows_in: int | None, repeat: int = 1
+) -> tuple[Any, StageResult]:
+    """Runs a stage repeat times, keeping the fastest time and the highest peak memory"""
+    seconds, peak = [], []
+    for _ in range(repeat):
+        gc.collect()
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            result = fn()
+            seconds.append(time.perf_counter() - start)
+        peak.append(memory.peak)
+    return result, {
+        "seconds": round(min(seconds), 4),
+        "peak_mb": round(max(peak) / 1024 / 1024, 1),
+        "rows_in": rows_in,
+        "rows_out": count_rows(result),
+    }
+
+
+def run_scale(scale: int, seed: int = 0, repeat: int = 1) -> dict[str, StageResult]:
+    """Runs each pipeline stage on synthetic data at the given scale, in pipeline order, returning the time, peak memory, and rows in and out of each stage"""
+
+    data, results = {}, {}
+
+    def stage(name: str, fn: Callable[[], Any], rows_in: int | None):
+        def run():
+            # validate every time, rather than timing skipped validation
+            if os.path.exists(get_validator().path):
+                os.remove(get_validator().path)
+            return fn()
+
+        data[name], results[name] = run_stage(run, rows_in, repeat)
+        print(f"  {name}: {results[name]['seconds']:.3f} s", file=sys.stderr)
+
+    # generated once, since it is not part of the pipeline
+    data["generate"], results["generate"] = run_stage(
+        lambda: generate(scale, seed=seed), None
+    )
+    synthetic = data["generate"]
+    pfr_washrooms = synthetic["pfr_washrooms"]
+    stage(
+        "overpass_to_gdf",
+        lambda: overpass_to_gdf(synthetic["current_washrooms"]),
+        None,
+    )
+    stage(
+        "get_pfr_facility_types",
+        lambda: gi.get_pfr_facility_types(synthetic["pfr_facilities"]),
+        len(synthetic["pfr_facilities"]),
+    )
+    stage(
+        "text_repair",
+        lambda: TextRepair(encoding_fixes, spelling_fixes).repair(pfr_washrooms),
+        len(pfr_washrooms),
+    )
+    stage(
+        "merge",
+        lambda: pd.merge(
+            data["text_repair"],
+            data["get_pfr_facility_types"].rename(
+                columns={"LOCATIONID": "parent_id", "TYPE": "parent_type"}
+            ),
+            how="left",
+            on="parent_id",
+        ),
+        len(pfr_washrooms),
+    )
+    stage(
+        "get_pfr_washrooms_osm",
+        lambda: gi.get_pfr_washrooms_osm(data["merge"]),
+        len(data["merge"]),
+    )
+    normalized = data["get_pfr_washrooms_osm"]
+    stage(
+        "get_pfr_washrooms_osm_open",
+        lambda: gi.get_pfr_washrooms_osm_open(normalized),
+        len(normalized),
+    )
+    stage(
+        "get_pfr_washrooms_osm_closed_or_alert",
+        lambda: (
+            gi.get_pfr_washrooms_osm_closed_or_alert(normalized, "0"),
+            gi.get_pfr_washrooms_osm_closed_or_alert(normalized, "2"),
+        ),
+        len(normalized),
+    )
+    open_washrooms = data["get_pfr_washrooms_osm_open"]
+    stage(
+        "assign_partitions",
+        lambda: assign_partitions(open_washrooms, BoundaryIndex(synthetic["wards"])),
+        len(open_washrooms),
+    )
+    stage(
+        "conflate",
+        lambda: conflate(data["assign_partitions"], data["overpass_to_gdf"]),
+        len(data["assign_partitions"]),
+    )
+    stage(
+        "group_partitions",
+        lambda: group_partitions(data["conflate"]),
+        len(data["conflate"]),
+    )
+
+    # compare with a copy where some washrooms were closed, moved, removed, or added
+    old = pfr_washrooms.set_index("asset_id")
+    n = len(old)
+    new = old.iloc[n // 100 :].copy()
+    new.iloc[::20, new.columns.get_loc("Status")] = "0"
+    new.iloc[::100, new.columns.get_loc("geometry")] = (
+        new.geometry.iloc[::100].translate(0.001, 0).to_numpy()
+    )
+    new = pd.concat([new, old.iloc[: n // 200].rename(index=lambda x: -x)])
+    stage("diff_snapshots", lambda: diff_snapshots(old, new), n)
+    return results
+
+
+def get_label() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=os.path.dirname(__file__) or ".",
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "local"
+
+
+def compare_results(
+    previous: dict, current: dict, threshold: float = DEFAULT_THRESHOLD
+) -> pd.DataFrame:
+    """Compares the stage timings of two benchmark results, flagging stages that became more than threshold times slower"""
+    rows = []
+    for scale, stages in current["scales"].items():
+        for name, result in stages.items():
+            before = previous["scales"].get(scale, {}).get(name)
+            if before is None:
+                continue
+            ratio = result["seconds"] / max(before["seconds"], 1e-9)
+            rows.append(
+                {
+                    "scale": scale,
+                    "stage": name,
+                    "before_s": before["seconds"],
+                    "after_s": result["seconds"],
+                    "ratio": round(ratio, 2),
+                    "regression": ratio > threshold and result["seconds"] > MIN_SECONDS,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="Time each stage of the pipeline on synthetic data at multiples of the size of source_data/, and save the results"
+    )
+    parser.add_argument(
+        "--scales",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SCALES,
+        help="Multiples of the sample size to run, e.g. 1 100 10000 (10000 needs tens of GB of memory)",
+    )
+    parser.add_argument(
+        "--label", help="Name for the saved results (default: current git commit)"
+    )
+    parser.add_argument(
+        "--output",
+        help="Path to save the results to (default: benchmarks/results/<label>.json, which git ignores)",
+    )
+    parser.add_argument(
+        "--compare",
+        help="Previous results file to compare with; exits with an error if any stage is slower by more than --threshold",
+    )
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=1,
+        help="Run each stage this many times and keep the fastest, to reduce noise",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def run_benchmarks():
+    args = parse_args()
+    label = args.label or get_label()
+    results = {
+        "label": label,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "memory": PeakMemory().method,
+        "scales": {},
+    }
+
+    # validation results are cached under the working directory, so use a temporary one
+    with tempfile.TemporaryDirectory() as tmp:
+        configure_validation(path=os.path.join(tmp, "validation.json"))
+        for scale in args.scales:
+            print(f"scale {scale}x", file=sys.stderr)
+            results["scales"][str(scale)] = run_scale(scale, args.seed, args.repeat)
+
+    path = args.output or os.path.join(RESULTS_DIR, f"{label}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+    table = pd.DataFrame(
+        [
+            {"scale": scale, "stage": name, **result}
+            for scale, stages in results["scales"].items()
+            for name, result in stages.items()
+        ]
+    )
+    print(table.to_string(index=False))
+    print(f"\nResults saved to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            comparison = compare_results(json.load(f), results, args.threshold)
+        print(f"\nCompared with {args.compare}:")
+        print(comparison.to_string(index=False))
+        if comparison["regression"].any():
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_benchmarks()
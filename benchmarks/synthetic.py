@@ -0,0 +1,219 @@
+import json
+import os
+import sys
+from argparse import ArgumentParser
+from typing import TypedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from resources.openstreetmap import iter_overpass  # noqa: E402
+from resources.partitioning import get_boundaries  # noqa: E402
+
+SOURCE_DIR = os.path.join(os.path.dirname(__file__), "..", "source_data")
+REF_TAG = "ref:open.toronto.ca:washroom-facilities:asset_id"
+# degrees that each copy of the city is shifted by, at most, so that copies overlap
+MAX_OFFSET = 0.01
+WARD_COUNT = 25
+
+
+class SyntheticData(TypedDict):
+    scale: int
+    pfr_washrooms: gpd.GeoDataFrame
+    pfr_facilities: gpd.GeoDataFrame
+    current_washrooms: str
+    wards: gpd.GeoDataFrame
+
+
+def load_samples(source_dir: str = SOURCE_DIR) -> dict:
+    """Loads the real samples in source_data/ with the dtypes that request_tod_gdf gives them"""
+
+    def read(name: str) -> gpd.GeoDataFrame:
+        path = os.path.join(source_dir, f"{name}.geojson")
+        return gpd.read_file(path).replace("None", pd.NA).convert_dtypes()
+
+    with open(os.path.join(source_dir, "current_washrooms.json")) as f:
+        current_washrooms = f.read()
+    return {
+        "pfr_washrooms": read("pfr_washrooms").astype({"parent_id": str}),
+        "pfr_facilities": read("pfr_facilities"),
+        "current_washrooms": current_washrooms,
+    }
+
+
+def get_offsets(scale: int, seed: int = 0) -> np.ndarray:
+    """Returns a (lon, lat) shift for each copy of the city, with no shift for the first copy so that scale 1 is the real data"""
+    offsets = np.random.default_rng(seed).uniform(-MAX_OFFSET, MAX_OFFSET, (scale, 2))
+    offsets[0] = 0
+    return offsets
+
+
+def get_id_stride(ids: pd.Series) -> int:
+    return 10 ** len(str(int(ids.max())))
+
+
+def scale_ids(ids: pd.Series, scale: int, stride: int) -> np.ndarray:
+    """Repeats ids once per copy, keeping them unique by adding a multiple of stride. The dtype is kept where the new ids fit."""
+    values = ids.to_numpy(dtype=np.int64)
+    scaled = (values[None, :] + np.arange(scale)[:, None] * stride).ravel()
+    dtype = ids.dtype if scaled.max() <= np.iinfo(np.int32).max else "Int64"
+    return pd.array(scaled).astype(dtype)
+
+
+def scale_labels(labels: pd.Series, scale: int) -> np.ndarray:
+    """Repeats text ids once per copy, with a copy suffix after the first copy"""
+    values = labels.astype(str).to_numpy(dtype=object)
+    return np.concatenate(
+        [values] + [values + f"-{k}" for k in range(1, scale)], dtype=object
+    )
+
+
+def scale_geometries(geometries: gpd.GeoSeries, offsets: np.ndarray) -> np.ndarray:
+    """Repeats geometries once per copy, shifted by each copy's offset"""
+    return np.concatenate(
+        [
+            shapely.transform(
+                geometries.to_numpy(), lambda x, dx=dx, dy=dy: x + [dx, dy]
+            )
+            for dx, dy in offsets
+        ]
+    )
+
+
+def scale_pfr_washrooms(
+    gdf: gpd.GeoDataFrame, offsets: np.ndarray, asset_stride: int
+) -> gpd.GeoDataFrame:
+    """Repeats Park Washroom Facilities rows once per copy, with unique _id, asset_id, and parent_id values (matching scale_pfr_facilities) and shifted geometries"""
+    scale = len(offsets)
+    repeated = gdf.iloc[np.tile(np.arange(len(gdf)), scale)].reset_index(drop=True)
+    return repeated.assign(
+        _id=scale_ids(gdf["_id"], scale, get_id_stride(gdf["_id"])),
+        asset_id=scale_ids(gdf["asset_id"], scale, asset_stride),
+        parent_id=scale_labels(gdf["parent_id"], scale),
+        geometry=scale_geometries(gdf.geometry, offsets),
+    )
+
+
+def scale_pfr_facilities(
+    gdf: gpd.GeoDataFrame, offsets: np.ndarray
+) -> gpd.GeoDataFrame:
+    """Repeats Parks and Recreation Facilities rows once per copy, with LOCATIONID values matching scale_pfr_washrooms"""
+    scale = len(offsets)
+    repeated = gdf.iloc[np.tile(np.arange(len(gdf)), scale)].reset_index(drop=True)
+    return repeated.assign(
+        _id=scale_ids(gdf["_id"], scale, get_id_stride(gdf["_id"])),
+        ASSET_ID=scale_ids(gdf["ASSET_ID"], scale, get_id_stride(gdf["ASSET_ID"])),
+        LOCATIONID=pd.array(scale_labels(gdf["LOCATIONID"], scale)).astype(
+            gdf["LOCATIONID"].dtype
+        ),
+        geometry=scale_geometries(gdf.geometry, offsets),
+    )
+
+
+def shift_element(element: dict, k: int, dx: float, dy: float, asset_stride: int):
+    shifted = {**element, "id": element["id"] + k * 10**10}
+    if "lon" in element:
+        shifted["lon"] = element["lon"] + dx
+        shifted["lat"] = element["lat"] + dy
+    if "center" in element:
+        c = element["center"]
+        shifted["center"] = {"lat": c["lat"] + dy, "lon": c["lon"] + dx}
+    if "bounds" in element:
+        b = element["bounds"]
+        shifted["bounds"] = {
+            "minlat": b["minlat"] + dy,
+            "minlon": b["minlon"] + dx,
+            "maxlat": b["maxlat"] + dy,
+            "maxlon": b["maxlon"] + dx,
+        }
+    if "geometry" in element:
+        shifted["geometry"] = [
+            {"lat": e["lat"] + dy, "lon": e["lon"] + dx} for e in element["geometry"]
+        ]
+    if "nodes" in element:
+        shifted["nodes"] = [x + k * 10**10 for x in element["nodes"]]
+    ref = element.get("tags", {}).get(REF_TAG)
+    if ref is not None and ref.isdigit():
+        shifted["tags"] = {**element["tags"], REF_TAG: str(int(ref) + k * asset_stride)}
+    return shifted
+
+
+def scale_overpass(content: str, offsets: np.ndarray, asset_stride: int) -> str:
+    """Repeats the elements of an Overpass JSON response once per copy, with unique ids, shifted coordinates, and asset_id references matching scale_pfr_washrooms"""
+    parts = []
+    for key, value in iter_overpass(content):
+        if key != "elements":
+            parts.append(f"{json.dumps(key)}: {json.dumps(value)}")
+            continue
+        elements = list(value)
+        parts.append(
+            '"elements": ['
+            + ",\n".join(
+                json.dumps(shift_element(element, k, dx, dy, asset_stride))
+                for k, (dx, dy) in enumerate(offsets)
+                for element in elements
+            )
+            + "]"
+        )
+    return "{" + ",\n".join(parts) + "}"
+
+
+def get_wards(
+    gdf: gpd.GeoDataFrame, count: int = WARD_COUNT, seed: int = 0
+) -> gpd.GeoDataFrame:
+    """Generates a ward-like partition layer: Voronoi areas around count washrooms, covering the extent of gdf"""
+    points = shapely.centroid(gdf.geometry.sample(count, random_state=seed).to_numpy())
+    extent = shapely.box(*gdf.total_bounds).buffer(MAX_OFFSET)
+    areas = shapely.get_parts(
+        shapely.voronoi_polygons(shapely.multipoints(points), extend_to=extent)
+    )
+    wards = gpd.GeoDataFrame(
+        {"name": [f"Synthetic Ward ({i + 1:02d})" for i in range(len(areas))]},
+        geometry=shapely.intersection(areas, extent),
+        crs=gdf.crs,
+    )
+    return get_boundaries(wards, "name")
+
+
+def generate(scale: int, source_dir: str = SOURCE_DIR, seed: int = 0) -> SyntheticData:
+    """Generates Park Washroom Facilities, Parks and Recreation Facilities, an Overpass response, and wards at scale times the size of the samples in source_dir. Each copy of the city is shifted slightly, so that density increases with scale while references between the datasets still match."""
+    samples = load_samples(source_dir)
+    offsets = get_offsets(scale, seed)
+    asset_stride = get_id_stride(samples["pfr_washrooms"]["asset_id"])
+    pfr_washrooms = scale_pfr_washrooms(samples["pfr_washrooms"], offsets, asset_stride)
+    return {
+        "scale": scale,
+        "pfr_washrooms": pfr_washrooms,
+        "pfr_facilities": scale_pfr_facilities(samples["pfr_facilities"], offsets),
+        "current_washrooms": scale_overpass(
+            samples["current_washrooms"], offsets, asset_stride
+        ),
+        "wards": get_wards(pfr_washrooms, seed=seed),
+    }
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="Generate synthetic washroom data at a multiple of the size of the samples in source_data/"
+    )
+    parser.add_argument("scale", type=int, help="e.g. 1, 100, or 10000")
+    parser.add_argument("output_dir")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    data = generate(args.scale, seed=args.seed)
+    os.makedirs(args.output_dir, exist_ok=True)
+    for name in ["pfr_washrooms", "pfr_facilities", "wards"]:
+        data[name].to_parquet(os.path.join(args.output_dir, f"{name}.parquet"))
+    with open(os.path.join(args.output_dir, "current_washrooms.json"), "w") as f:
+        f.write(data["current_washrooms"])
+    print(
+        f"{len(data['pfr_washrooms'])} washrooms, {len(data['pfr_facilities'])} facilities, and {len(data['wards'])} wards saved to {args.output_dir}"
+    )
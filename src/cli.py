@@ -0,0 +1,151 @@
+import json
+import sys
+from argparse import ArgumentParser
+
+# only the standard library and lightweight modules are imported here, so that
+# help, query, tags, and report start quickly; the other commands import
+# geopandas, pandas, and pandera when they run
+from resources.changesets import (
+    PROPOSAL_WIKI_LINK,
+    get_changeset_tags,
+    get_washrooms_query,
+)
+
+
+def fetch(args):
+    """Downloads (or revalidates the cached copies of) all sources, without building the import"""
+    import os
+
+    from resources.cache import configure_cache
+
+    import generate_imports
+
+    os.makedirs("source_data", exist_ok=True)
+    configure_cache(
+        offline=args.offline,
+        **({} if args.cache_ttl is None else {"ttl": args.cache_ttl}),
+    )
+    _, latencies = generate_imports.fetch_sources()
+    for name, seconds in latencies.items():
+        print(f"{name}: {seconds:.2f} seconds")
+
+
+def build(args, rest: list[str]):
+    """Runs generate_imports.py with the remaining arguments"""
+    import generate_imports
+
+    generate_imports.main(rest)
+
+
+def diff(args, rest: list[str]):
+    """Runs diff_data.py with the remaining arguments"""
+    import diff_data
+
+    diff_data.compare_files(rest)
+
+
+def query(args):
+    print(get_washrooms_query(args.bbox))
+
+
+def tags(args):
+    print(get_changeset_tags(args.subset_name, args.source_date, args.wiki_link))
+
+
+def report(args):
+    """Prints the stages of a run report, slowest first"""
+    # instrumentation imports cProfile and tracemalloc, which the report doesn't need
+    from resources.instrumentation import REPORT_PATH
+
+    path = args.path or REPORT_PATH
+    try:
+        with open(path) as f:
+            run = json.load(f)
+    except FileNotFoundError:
+        sys.exit(
+            f"No run report at {path}; run build first (from the repository root, where to_import/ is written)"
+        )
+    peak_rss = run.get("peak_rss_mb")
+    print(
+        f"Run started {run['started']}: {run['wall_seconds']:.2f} s wall, {run['cpu_seconds']:.2f} s CPU"
+        + ("" if peak_rss is None else f", {peak_rss:.1f} MB peak RSS")
+    )
+    stages = sorted(run["stages"], key=lambda x: -x["wall_seconds"])
+    print(f"{'stage':<20} {'wall_s':>8} {'cpu_s':>8} {'peak_mb':>8} {'rows_out':>9}")
+    for stage in stages[: args.top]:
+        rows_out = "" if stage.get("rows_out") is None else stage["rows_out"]
+        peak = "-" if stage.get("peak_mb") is None else f"{stage['peak_mb']:.1f}"
+        print(
+            f"{stage['name']:<20} {stage['wall_seconds']:>8.3f} {stage['cpu_seconds']:>8.3f} {peak:>8} {rows_out:>9}"
+            + (" (cached)" if stage.get("cached") else "")
+        )
+
+
+def cli(argv: list[str] | None = None):
+    parser = ArgumentParser(
+        description="Toronto public washroom import tools. Run a command with --help for its options."
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_fetch = subparsers.add_parser(
+        "fetch", help="Download all sources into source_data/ and the cache"
+    )
+    parser_fetch.add_argument(
+        "--offline", action="store_true", help="Only use cached responses"
+    )
+    parser_fetch.add_argument(
+        "--cache-ttl",
+        type=float,
+        help="Seconds before cached metadata and Overpass results are revalidated",
+    )
+    parser_fetch.set_defaults(run=fetch)
+
+    for name, description, run in [
+        (
+            "build",
+            "Build the import files (same options as generate_imports.py)",
+            build,
+        ),
+        ("diff", "Compare two source files (same options as diff_data.py)", diff),
+    ]:
+        # options, including --help, are parsed by the script itself
+        subparsers.add_parser(name, help=description, add_help=False).set_defaults(
+            run=run, delegate=True
+        )
+
+    parser_query = subparsers.add_parser(
+        "query", help="Print the Overpass query for existing toilets in a bounding box"
+    )
+    parser_query.add_argument("bbox", help="Bounding box as south,west,north,east")
+    parser_query.set_defaults(run=query)
+
+    parser_tags = subparsers.add_parser(
+        "tags", help="Print JOSM changeset tags for a subset"
+    )
+    parser_tags.add_argument("subset_name", help='e.g. "Davenport (09)"')
+    parser_tags.add_argument(
+        "--source-date", required=True, help="Date of the source data, YYYY-MM-DD"
+    )
+    parser_tags.add_argument("--wiki-link", default=PROPOSAL_WIKI_LINK)
+    parser_tags.set_defaults(run=tags)
+
+    parser_report = subparsers.add_parser(
+        "report", help="Summarize the run report of the last build"
+    )
+    parser_report.add_argument("--path", help="Default: to_import/run_report.json")
+    parser_report.add_argument(
+        "--top", type=int, help="Only show this many of the slowest stages"
+    )
+    parser_report.set_defaults(run=report)
+
+    args, rest = parser.parse_known_args(argv)
+    if getattr(args, "delegate", False):
+        args.run(args, rest)
+    elif rest:
+        parser.error(f"unrecognized arguments: {' '.join(rest)}")
+    else:
+        args.run(args)
+
+
+if __name__ == "__main__":
+    cli()
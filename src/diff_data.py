@@ -1,30 +1,58 @@
-from argparse import ArgumentParser
+from argparse import ArgumentParser, Namespace
 from pathlib import Path
 
 import geopandas as gpd
 import pandas as pd
 
+from resources.diffing import MOVE_TOLERANCE, diff_snapshots, get_diff_records
+from resources.snapshots import get_source_columns, read_source
 
-def parse_gdf(input: str):
+
+REF_COLUMN = "ref:open.toronto.ca:washroom-facilities:asset_id"
+
+
+def parse_gdf(input: str, columns: list[str] | None = None):
     if input is None:
         return None
-    # test filename is real?
-    # test is real GeoJSON?
-    gdf = gpd.read_file(input)
+    if columns is not None:
+        # always load the column used to match rows between files
+        available = get_source_columns(input)
+        columns = [*columns, *[x for x in [REF_COLUMN, "asset_id"]
+                               if x in available and x not in columns]]
+    # GeoParquet snapshots are memory mapped and only the requested columns are read
+    # dtypes are converted so that GeoJSON files and typed snapshots can be compared
+    gdf = read_source(input, columns).convert_dtypes()
     return gdf
 
 
 # add typing
-def get_files_to_compare() -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+def get_files_to_compare(
+    argv: list[str] | None = None
+) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, Namespace]:
     parser = ArgumentParser()
     parser.add_argument(
-        "file_one", type=parse_gdf, help="Earlier file in GeoJSON format"
+        "file_one", help="Earlier file in GeoJSON or GeoParquet format"
+    )
+    parser.add_argument(
+        "file_two", help="Later file in GeoJSON or GeoParquet format"
+    )
+    parser.add_argument(
+        "--columns", nargs="+", help="Only load and compare these columns"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=MOVE_TOLERANCE,
+        help="Only report geometries that moved further than this, in metres"
     )
     parser.add_argument(
-        "file_two", type=parse_gdf, help="Later file in GeoJSON format"
+        "--json", help="Also save each change as a JSON record to this file"
     )
-    args = parser.parse_args()
-    return (args.file_one, args.file_two)
+    parser.add_argument(
+        "--csv", help="Also save each change as a CSV row to this file"
+    )
+    args = parser.parse_args(argv)
+    return (parse_gdf(args.file_one, args.columns),
+            parse_gdf(args.file_two, args.columns),
+            args)
 
 
 def print_rows(gdf: gpd.GeoDataFrame):
@@ -32,29 +60,34 @@ def print_rows(gdf: gpd.GeoDataFrame):
         print("\n", index, values, sep="\n")
 
 
-def compare_files():
-    file_one, file_two = get_files_to_compare()
+def compare_files(argv: list[str] | None = None):
+    file_one, file_two, args = get_files_to_compare(argv)
     file_one = (file_one.rename(columns={
-        "ref:open.toronto.ca:washroom-facilities:asset_id": "asset_id"}).set_index("asset_id"))
+        REF_COLUMN: "asset_id"}).set_index("asset_id"))
     file_two = (file_two.rename(columns={
-        "ref:open.toronto.ca:washroom-facilities:asset_id": "asset_id"}).set_index("asset_id"))
-    inter_index = file_one.index.intersection(file_two.index)
-    inter_cols = file_one.columns.intersection(file_two.columns)
-    comparison_one = file_one.loc[inter_index][inter_cols].sort_index()
-    comparison_two = file_two.loc[inter_index][inter_cols].sort_index()
-    comparison = comparison_one.compare(comparison_two, align_axis="index")
-    removed = file_one[~file_one.index.isin(file_two.index)]
-    added = file_two[~file_two.index.isin(file_one.index)]
+        REF_COLUMN: "asset_id"}).set_index("asset_id"))
+    diff = diff_snapshots(file_one, file_two, tolerance=args.tolerance)
 
     print("\n\n===CHANGED VALUES===")
-    print("asset_id: ", comparison.index.values)
-    print_rows(comparison)
+    print("asset_id: ", diff["changed"]["asset_id"].unique())
+    print("\n", diff["changed"].to_string(index=False), sep="\n")
+    print("\n\n===MOVED GEOMETRIES===")
+    print("asset_id: ", diff["moved"]["asset_id"].to_numpy())
+    print("\n", diff["moved"].to_string(index=False), sep="\n")
     print("\n\n===REMOVED VALUES===")
-    print("asset_id: ", removed.index.values)
-    print_rows(removed)
+    print("asset_id: ", diff["removed"].index.to_numpy())
+    print_rows(diff["removed"])
     print("\n\n===ADDED VALUES===")
-    print("asset_id: ", added.index.values)
-    print_rows(added)
+    print("asset_id: ", diff["added"].index.to_numpy())
+    print_rows(diff["added"])
+
+    # machine-readable output with one row per change, e.g. for automated alerts
+    records = get_diff_records(diff)
+    if args.json:
+        records.to_json(args.json, orient="records", indent=2,
+                        default_handler=str)
+    if args.csv:
+        records.to_csv(args.csv, index=False)
 
 
 if __name__ == "__main__":
@@ -1,159 +1,518 @@
 import json
 import os
-import re
-from typing import Literal
+import shutil
+import sys
+import warnings
+from argparse import ArgumentParser
+from collections import Counter
+from contextlib import closing
+from functools import cache
+from typing import Callable, Iterable, Literal
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import pandera as pa
 
+import resources.conflation
+import resources.openstreetmap
+import resources.osm_store
+import resources.partitioning
+import resources.text_repair
+import resources.toronto_encoding_issues
+from resources.boundaries import StoredBoundaries, get_stored_boundaries
+from resources.changesets import (
+    PROPOSAL_WIKI_LINK,
+    get_changeset_tags,
+    get_washrooms_query,
+)
+from resources.conflation import MATCH_COLUMNS, conflate
+from resources.cache import DEFAULT_MAX_BYTES, DEFAULT_TTL, configure_cache
+from resources.dtypes import as_text, compact_columns, constant_columns
+from resources.fetch import run_concurrently
+from resources.geojson import EXTENSIONS, GeoJSONFormat, save_geojson, write_geojson
+from resources.history import connect as connect_history, record_snapshot
+from resources.incremental import (
+    Manifest,
+    code_version,
+    fingerprint_rows,
+    frame_fingerprint,
+    load_manifest,
+    normalize_incremental,
+    save_manifest,
+    write_if_changed,
+)
+from resources.instrumentation import REPORT_PATH, RunReport
+from resources.partitioning import (
+    DEFAULT_CELL_SIZE,
+    PARTITION_BBOX,
+    PARTITION_COLUMNS,
+    PARTITION_NAME,
+    assign_partitions,
+    get_boundaries,
+    get_grid,
+    group_partitions,
+    parse_bbox,
+)
 from resources.openstreetmap import (
-    query_overpass,
-    feature_from_element,
+    WASHROOM_TAGS,
+    overpass_to_gdf,
+    query_overpass_content,
+    write_overpass_json,
 )
+from resources.osm_export import get_changes, write_import_osm, write_import_osmchange
+from resources.osm_store import OSMStore
+from resources.osm_xml import save_xml
+from resources.pipeline import Pipeline, fingerprint_value
+from resources.snapshots import save_snapshot
 from resources.torontoopendata import request_tod_gdf, TODResponse
+from resources.text_repair import TextRepair
 from resources.toronto_encoding_issues import encoding_fixes, spelling_fixes
-
-PROPOSAL_WIKI_LINK = (
-    "https://wiki.openstreetmap.org/wiki/Import/Toronto_Public_Washroom_Import"
+from resources.validation import (
+    DEFAULT_SAMPLE_SIZE,
+    check_any_tag,
+    check_list_values,
+    check_num_geometries,
+    configure_validation,
+    get_validator,
 )
+from resources.watch import poll_versions, watch
 
+OPENING_HOURS_RULES_PATH = os.path.join(
+    os.path.dirname(__file__), "resources", "opening_hours_rules.csv"
+)
 
-def generate_imports():
-    """Main script function to get, transform, and save data"""
+PARTITION_FOLDERS = {
+    "wards": "to_import/by_ward",
+    "grid": "to_import/by_grid",
+}
+BOUNDARY_PARTITION_FOLDER = "to_import/by_area"
+WINTER_HOURS_FOLDER = "to_import/winter_hours"
+# every folder that changeset folders are written to, so that switching partitioning schemes removes the old scheme's folders
+CHANGESET_ROOTS = [
+    *PARTITION_FOLDERS.values(),
+    BOUNDARY_PARTITION_FOLDER,
+    WINTER_HOURS_FOLDER,
+]
+
+# open.toronto.ca resources used by fetch_sources
+CKAN_SOURCES = {
+    "pfr_washrooms": {
+        "dataset_name": "washroom-facilities",
+        "resource_id": "6d848f38-45a3-41e8-9783-804385ec5a16",
+    },
+    "pfr_facilities": {
+        "dataset_name": "parks-and-recreation-facilities",
+        "resource_id": "f6cdcd50-da7b-4ede-8e60-c3cdba70b559",
+    },
+    "wards": {
+        "dataset_name": "city-wards",
+        "resource_id": "737b29e0-8329-4260-b6af-21555ab24f28",
+    },
+    "ccbs": {
+        "dataset_name": "community-council-boundaries",
+        "resource_id": "cc935c56-dbcd-4035-b156-a7f8f8eae68b",
+    },
+}
+# sources polled by --watch; boundaries are checked on their own schedule
+WATCHED_SOURCES = ["pfr_washrooms", "pfr_facilities"]
+DEFAULT_WATCH_INTERVAL = 5 * 60  # seconds
+
+# seconds to wait for the server on each connection attempt or read
+SOURCE_TIMEOUTS = {
+    "current_washrooms": 60,
+    "pfr_washrooms": 30,
+    "pfr_facilities": 30,
+    "wards": 30,
+    "ccbs": 30,
+}
+# low-cardinality city columns stored as categoricals with --compact-dtypes
+COMPACT_COLUMNS = ["type", "Status", "hours", "accessible", "parent_type"]
+
+
+def generate_imports(
+    incremental: bool = False,
+    geojson_format: GeoJSONFormat = "pretty",
+    workers: int | None = None,
+    partition_by: str = "wards",
+    boundary_name_column: str | None = None,
+    grid_size: float = DEFAULT_CELL_SIZE,
+    max_changeset_size: int | None = None,
+    profile: list[str] | None = None,
+    trace_memory: bool = False,
+    compact_dtypes: bool = False,
+    memo: dict | None = None,
+):
+    """Main script function to get, transform, and save data, as a pipeline of stages (see resources.pipeline.Pipeline) whose outputs are saved in source_data/cache/stages. If incremental is True, stages whose inputs and code are unchanged since they were last run are loaded instead of run, normalization is only re-run for washrooms that changed since the previous run, and changeset folders whose content is unchanged are skipped. geojson_format sets how to_import GeoJSON files are written (see resources.geojson.write_geojson), and workers sets the number of threads used to save changeset folders.
+
+    Open washrooms are organized into changesets by ward by default. partition_by can instead be "grid" (square cells grid_size metres wide) or the path to any boundary file readable by geopandas, with area names taken from boundary_name_column. If max_changeset_size is given, changesets with more washrooms than that (including winter hours changesets) are split into balanced parts.
+
+    With compact_dtypes, low-cardinality city columns (COMPACT_COLUMNS), constant tags (CONSTANT_TAGS), and partition names are kept as categoricals through the pipeline, storing each distinct value once; output files are unchanged.
+
+    A long-running process can pass the same memo dict to each call to keep unchanged stage outputs in memory between runs (see resources.pipeline.Pipeline).
+
+    The wall time, CPU time, peak memory, and rows in and out of each stage are saved to to_import/run_report.json. Stages named in profile (or "all") are also profiled with cProfile, and with trace_memory the largest allocation sites of each stage are reported (see resources.instrumentation.RunReport).
+    """
 
     # generate output directories if needed
     os.makedirs("source_data", exist_ok=True)
     os.makedirs("to_import", exist_ok=True)
 
-    # get amenity=toilets currently in openstreetmap
-    current_washrooms = get_current_washrooms()
-    current_washrooms_gdf = get_current_washrooms_gdf(current_washrooms)
+    report = RunReport(profile=profile, trace_memory=trace_memory)
+    # stages share the process, so profile and trace memory one stage at a time
+    pipeline = Pipeline(
+        report,
+        reuse=incremental,
+        workers=1 if profile or trace_memory else workers,
+        memo=memo,
+    )
+    version = code_version(sys.modules[__name__], OPENING_HOURS_RULES_PATH)
+
+    # get amenity=toilets currently in openstreetmap and city open data
+    def fetch() -> dict:
+        sources, fetch_latencies = fetch_sources()
+        return {**sources, "seconds_by_source": fetch_latencies}
+
+    pipeline.add(
+        "fetch",
+        fetch,
+        key=get_sources_key,
+        detail=lambda x: {"seconds_by_source": x["seconds_by_source"]},
+    )
 
-    # get city open data
-    pfr_washrooms = get_pfr_washrooms()
-    pfr_facilities = get_pfr_facilities()
-    pfr_facility_types = get_pfr_facility_types(pfr_facilities["gdf"])
+    # record city data in the history store, where unchanged rows are only stored once
+    def history(sources: dict):
+        pfr_washrooms = sources["pfr_washrooms"]
+        with closing(connect_history()) as con:
+            try:
+                record_snapshot(
+                    con,
+                    pfr_washrooms["gdf"],
+                    "pfr_washrooms",
+                    pfr_washrooms["metadata"]["last_modified"],
+                )
+            except ValueError as e:
+                warnings.warn(f"Park Washroom Facilities history not updated: {e}")
 
-    pfr_washrooms_corrected = (
-        pfr_washrooms["gdf"]
-        .replace(encoding_fixes, regex=True)
-        .replace(spelling_fixes, regex=True)
+    pipeline.add("history", history, ["fetch"], persist=False)
+
+    pipeline.add(
+        "convert_osm",
+        lambda sources: get_current_washrooms_gdf(sources["current_washrooms"]),
+        ["fetch"],
+        code=[get_current_washrooms_gdf, resources.openstreetmap],
+    )
+    pipeline.add(
+        "osm_store",
+        lambda sources: OSMStore.from_overpass(sources["current_washrooms"]),
+        ["fetch"],
+        code=[resources.osm_store, resources.openstreetmap],
+    )
+    pipeline.add(
+        "facility_types",
+        lambda sources: get_pfr_facility_types(sources["pfr_facilities"]["gdf"]),
+        ["fetch"],
+        code=[get_pfr_facility_types],
+    )
+
+    def repair(sources: dict) -> tuple[gpd.GeoDataFrame, Counter]:
+        text_repair = TextRepair(encoding_fixes, spelling_fixes)
+        return text_repair.repair(sources["pfr_washrooms"]["gdf"]), text_repair.fired
+
+    pipeline.add(
+        "text_repair",
+        repair,
+        ["fetch"],
+        code=[resources.text_repair, resources.toronto_encoding_issues],
+        detail=lambda x: {"fixes_fired": dict(x[1])},
     )
 
     # merge facility info into city washrooms dataset
-    pfr_washrooms_type = pd.merge(
-        pfr_washrooms_corrected,
-        pfr_facility_types.rename(
-            columns={"LOCATIONID": "parent_id", "TYPE": "parent_type"}
-        ),
-        how="left",
-        on="parent_id",
+    def merge(
+        repaired: tuple[gpd.GeoDataFrame, Counter],
+        pfr_facility_types: gpd.GeoDataFrame,
+    ) -> gpd.GeoDataFrame:
+        merged = pd.merge(
+            repaired[0],
+            pfr_facility_types.rename(
+                columns={"LOCATIONID": "parent_id", "TYPE": "parent_type"}
+            ),
+            how="left",
+            on="parent_id",
+        )
+        return compact_columns(merged, COMPACT_COLUMNS) if compact_dtypes else merged
+
+    pipeline.add(
+        "merge",
+        merge,
+        ["text_repair", "facility_types"],
+        params={"compact_dtypes": compact_dtypes},
     )
 
     # normalize city washroom data into osm tags
-    pfr_washrooms_osm = get_pfr_washrooms_osm_open(pfr_washrooms_type)
-    pfr_washrooms_osm_status0 = get_pfr_washrooms_osm_closed_or_alert(
-        pfr_washrooms_type, status="0"
-    )
-    pfr_washrooms_osm_status2 = get_pfr_washrooms_osm_closed_or_alert(
-        pfr_washrooms_type, status="2"
-    )
-
-    # organize status 1 washrooms into ward-level changesets
-    wards = get_wards_gdf()
-    pfr_washrooms_wards = pfr_washrooms_osm.sjoin(wards, how="left").drop(
-        ["index_right", "ward_code", "ward_name"], axis=1
-    )
-    pfr_by_ward = {k: v for k, v in pfr_washrooms_wards.groupby("ward_full")}
-
-    # save files to use in JOSM import
-    for ward_full, ward_gdf in pfr_by_ward.items():
-        os.makedirs(f"to_import/by_ward/{ward_full}/", exist_ok=True)
-        with open(
-            f"to_import/by_ward/{ward_full}/{ward_full}_washrooms.geojson", "w"
-        ) as f:
-            f.write(
-                ward_gdf.drop(["ward_full", "ward_bbox"], axis=1).to_json(
-                    na="drop",
-                    drop_id=True,
-                    indent=2,
-                )
-            )
-        with open(
-            f"to_import/by_ward/{ward_full}/{ward_full}_toilets_query.txt", "w"
-        ) as f:
-            f.write(get_washrooms_query(ward_gdf["ward_bbox"].iloc[0]))
-        with open(
-            f"to_import/by_ward/{ward_full}/{ward_full}_changeset_tags.txt", "w"
-        ) as f:
-            f.write(
-                get_changeset_tags(
-                    subset_name=ward_full,
-                    source_date=pfr_washrooms["metadata"]["last_modified"][0:10],
-                    wiki_link=PROPOSAL_WIKI_LINK,
-                )
+    def normalize(
+        pfr_washrooms_type: gpd.GeoDataFrame,
+    ) -> tuple[gpd.GeoDataFrame, dict[str, str]]:
+        fingerprints = fingerprint_rows(pfr_washrooms_type)
+        pfr_washrooms_osm_all = normalize_incremental(
+            pfr_washrooms_type,
+            lambda gdf: get_pfr_washrooms_osm(gdf, compact=compact_dtypes),
+            "washrooms",
+            fingerprints,
+            version,
+            reuse=incremental,
+        )
+        asset_fingerprints = dict(
+            zip(pfr_washrooms_type["asset_id"].astype(str), fingerprints)
+        )
+        return pfr_washrooms_osm_all, asset_fingerprints
+
+    pipeline.add(
+        "normalize",
+        normalize,
+        ["merge"],
+        code=[sys.modules[__name__], OPENING_HOURS_RULES_PATH],
+        params={"compact_dtypes": compact_dtypes},
+    )
+
+    # split by status
+    def split_status(
+        normalized: tuple[gpd.GeoDataFrame, dict[str, str]],
+    ) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame]:
+        return (
+            get_pfr_washrooms_osm_open(normalized[0]),
+            get_pfr_washrooms_osm_closed_or_alert(normalized[0], status="0"),
+            get_pfr_washrooms_osm_closed_or_alert(normalized[0], status="2"),
+        )
+
+    pipeline.add(
+        "split_status",
+        split_status,
+        ["normalize"],
+        code=[get_pfr_washrooms_osm_open, get_pfr_washrooms_osm_closed_or_alert],
+    )
+
+    def write_status_files(
+        by_status: tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame],
+    ):
+        ext = EXTENSIONS[geojson_format]
+        paths = [
+            f"to_import/pfr_to_import{ext}",
+            f"to_import/pfr_status_0_to_review{ext}",
+            f"to_import/pfr_status_2_to_review{ext}",
+        ]
+        for path, gdf in zip(paths, by_status):
+            save_geojson(path, gdf, geojson_format)
+
+    pipeline.add(
+        "write_status_files", write_status_files, ["split_status"], persist=False
+    )
+
+    # organize status 1 washrooms into changesets by ward (or another boundary layer)
+    def spatial_join(
+        by_status: tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame],
+        sources: dict,
+    ) -> gpd.GeoDataFrame:
+        pfr_washrooms_osm = by_status[0]
+        if partition_by == "wards":
+            boundaries = sources["wards"]["index"]
+        elif partition_by == "grid":
+            boundaries = get_grid(pfr_washrooms_osm, grid_size)
+        else:
+            boundaries = get_boundaries(
+                gpd.read_file(partition_by).to_crs(pfr_washrooms_osm.crs),
+                boundary_name_column,
             )
+        partitioned = assign_partitions(
+            pfr_washrooms_osm, boundaries, max_changeset_size
+        )
+        if compact_dtypes:
+            partitioned = compact_columns(partitioned, [PARTITION_NAME])
+        return partitioned
+
+    pipeline.add(
+        "spatial_join",
+        spatial_join,
+        ["split_status", "fetch"],
+        code=[
+            resources.partitioning,
+            *([partition_by] if os.path.isfile(partition_by) else []),
+        ],
+        params={
+            "partition_by": partition_by,
+            "boundary_name_column": boundary_name_column,
+            "grid_size": grid_size,
+            "max_changeset_size": max_changeset_size,
+            "compact_dtypes": compact_dtypes,
+        },
+    )
+
+    # pre-conflate with amenity=toilets and building=toilets already in openstreetmap
+    pipeline.add(
+        "conflate",
+        conflate,
+        ["spatial_join", "convert_osm"],
+        code=[resources.conflation],
+    )
+    pipeline.add(
+        "partition",
+        group_partitions,
+        ["conflate"],
+        code=[resources.partitioning],
+        detail=lambda x: {"changesets": len(x)},
+    )
 
     # filter and organize status 0 washrooms into winter hours changesets
     # logic only valid if run during winter season
-    ccbs = get_community_council_boundaries_gdf()
-    washrooms_winter_closed = pfr_washrooms_osm_status0[
-        pfr_washrooms_osm_status0["DELETE_Status_Reason"].str.contains(
-            "closed for the season", case=False
+    def winter_hours(
+        by_status: tuple[gpd.GeoDataFrame, gpd.GeoDataFrame, gpd.GeoDataFrame],
+        sources: dict,
+        current_washrooms_gdf: gpd.GeoDataFrame,
+    ) -> tuple[gpd.GeoDataFrame, dict[str, gpd.GeoDataFrame], gpd.GeoDataFrame]:
+        pfr_washrooms_osm_status0 = by_status[1]
+        washrooms_winter_closed = pfr_washrooms_osm_status0[
+            pfr_washrooms_osm_status0["DELETE_Status_Reason"].str.contains(
+                "closed for the season", case=False
+            )
+        ].assign(
+            opening_hours=pfr_washrooms_osm_status0["opening_hours"].str.replace(
+                "May-Oct 09:00-22:00", "May-Oct 09:00-22:00; Nov-Apr off"
+            ),
+            note=pfr_washrooms_osm_status0["note"].str.replace(
+                "Please survey to determine: Is this washroom open in the winter? opening_hours if yes are likely May-Oct 09:00-22:00; Nov-Apr 09:00-20:00, if no likely May-Oct 09:00-22:00; Nov-Apr off",
+                "",
+            ),
         )
-    ].assign(
-        opening_hours=pfr_washrooms_osm_status0["opening_hours"].str.replace(
-            "May-Oct 09:00-22:00", "May-Oct 09:00-22:00; Nov-Apr off"
-        ),
-        note=pfr_washrooms_osm_status0["note"].str.replace(
-            "Please survey to determine: Is this washroom open in the winter? opening_hours if yes are likely May-Oct 09:00-22:00; Nov-Apr 09:00-20:00, if no likely May-Oct 09:00-22:00; Nov-Apr off",
-            "",
-        ),
-    )
-    # no current reliable way to determine washrooms_winter_open
-    washrooms_winter = pd.concat([washrooms_winter_closed])
-    washrooms_winter_ccbs = washrooms_winter.sjoin(ccbs, how="left").drop(
-        columns=["index_right"]
+        # no current reliable way to determine washrooms_winter_open
+        washrooms_winter = pd.concat([washrooms_winter_closed])
+        washrooms_winter_ccbs = assign_partitions(
+            washrooms_winter, sources["ccbs"]["index"], max_changeset_size
+        )
+        if compact_dtypes:
+            washrooms_winter_ccbs = compact_columns(
+                washrooms_winter_ccbs, [PARTITION_NAME]
+            )
+        washrooms_winter_ccbs = conflate(washrooms_winter_ccbs, current_washrooms_gdf)
+        return (
+            washrooms_winter,
+            group_partitions(washrooms_winter_ccbs),
+            washrooms_winter_closed,
+        )
+
+    pipeline.add(
+        "winter_hours",
+        winter_hours,
+        ["split_status", "fetch", "convert_osm"],
+        code=[resources.partitioning, resources.conflation],
+        params={
+            "max_changeset_size": max_changeset_size,
+            "compact_dtypes": compact_dtypes,
+        },
+        detail=lambda x: {"changesets": len(x[1])},
     )
-    washrooms_winter_by_ccb = {
-        k: v for k, v in washrooms_winter_ccbs.groupby("ccb_name")
-    }
 
-    # save files to use in JOSM import
-    for ccb_name, ccb_gdf in washrooms_winter_by_ccb.items():
-        os.makedirs(f"to_import/winter_hours/{ccb_name}/", exist_ok=True)
-        with open(
-            f"to_import/winter_hours/{ccb_name}/{ccb_name}_washrooms_winter.geojson",
-            "w",
-        ) as f:
-            f.write(
-                ccb_gdf.drop(columns=["ccb_name", "ccb_bbox"]).to_json(
-                    na="drop",
-                    drop_id=True,
-                    indent=2,
-                )
+    # files to use in JOSM import, saved in parallel once all changesets are organized
+    def write_changesets(
+        pfr_by_partition: dict[str, gpd.GeoDataFrame],
+        winter: tuple[gpd.GeoDataFrame, dict[str, gpd.GeoDataFrame], gpd.GeoDataFrame],
+        normalized: tuple[gpd.GeoDataFrame, dict[str, str]],
+        sources: dict,
+        osm_store: OSMStore,
+    ) -> dict[str, int]:
+        # compare with the previous run to find changed washrooms
+        manifest = load_manifest()
+        if manifest["code_version"] != version:
+            manifest = {"code_version": version, "assets": {}, "partitions": {}}
+        asset_fingerprints = normalized[1]
+        changed_assets = [
+            k for k, v in asset_fingerprints.items() if manifest["assets"].get(k) != v
+        ]
+
+        source_date = sources["pfr_washrooms"]["metadata"]["last_modified"][0:10]
+        folder = PARTITION_FOLDERS.get(partition_by, BOUNDARY_PARTITION_FOLDER)
+        changesets = [
+            (f"{folder}/{name}", name, "washrooms", name, gdf)
+            for name, gdf in pfr_by_partition.items()
+        ] + [
+            (
+                f"{WINTER_HOURS_FOLDER}/{name}",
+                name,
+                "washrooms_winter",
+                f"{name} (Winter Hours)",
+                gdf,
             )
-        with open(
-            f"to_import/winter_hours/{ccb_name}/{ccb_name}_toilets_query.txt", "w"
-        ) as f:
-            f.write(get_washrooms_query(ccb_gdf["ccb_bbox"].iloc[0]))
-        with open(
-            f"to_import/winter_hours/{ccb_name}/{ccb_name}_changeset_tags.txt", "w"
-        ) as f:
-            f.write(
-                get_changeset_tags(
-                    subset_name=f"{ccb_name} (Winter Hours)",
-                    source_date=pfr_washrooms["metadata"]["last_modified"][0:10],
-                    wiki_link=PROPOSAL_WIKI_LINK,
-                )
+            for name, gdf in winter[1].items()
+        ]
+        partitions = {
+            path: (
+                get_partition_files(
+                    prefix=name,
+                    layer=layer,
+                    gdf=gdf.drop(columns=PARTITION_COLUMNS),
+                    bbox=gdf[PARTITION_BBOX].iloc[0],
+                    subset_name=subset_name,
+                    source_date=source_date,
+                    geojson_format=geojson_format,
+                    osm_store=osm_store,
+                ),
+                frame_fingerprint(
+                    gdf, source_date, geojson_format, osm_store.timestamp
+                ),
             )
+            for path, name, layer, subset_name, gdf in changesets
+        }
+        partitions_written = save_partitions(partitions, manifest, incremental, workers)
+        partitions_removed = remove_stale_partitions(
+            partitions, CHANGESET_ROOTS, manifest
+        )
+        manifest["assets"] = asset_fingerprints
+        save_manifest(manifest)
+        return {
+            "folders": len(partitions),
+            "folders_rewritten": partitions_written,
+            "folders_removed": partitions_removed,
+            "changed_assets": len(changed_assets),
+        }
+
+    pipeline.add(
+        "write_changesets",
+        write_changesets,
+        ["partition", "winter_hours", "normalize", "fetch", "osm_store"],
+        persist=False,
+        detail=lambda x: x,
+    )
+
+    outputs = pipeline.run(
+        [
+            "history",
+            "write_status_files",
+            "write_changesets",
+            "text_repair",
+            "conflate",
+        ]
+    )
+    sources = outputs["fetch"]
+    pfr_washrooms = sources["pfr_washrooms"]
+    pfr_facilities = sources["pfr_facilities"]
+    fetch_latencies = sources["seconds_by_source"]
+    fixes_fired = outputs["text_repair"][1]
+    pfr_washrooms_osm, pfr_washrooms_osm_status0, pfr_washrooms_osm_status2 = outputs[
+        "split_status"
+    ]
+    pfr_washrooms_matched = outputs["conflate"]
+    pfr_by_partition = outputs["partition"]
+    washrooms_winter, washrooms_winter_by_ccb, washrooms_winter_closed = outputs[
+        "winter_hours"
+    ]
+    written = outputs["write_changesets"]
 
     # generate summary statistics
     changesets = pd.DataFrame(
         {
-            "ward_full": [k for k in pfr_by_ward.keys()],
-            "size": [len(v) for v in pfr_by_ward.values()],
+            "ward_full" if partition_by == "wards" else "partition": [
+                k for k in pfr_by_partition.keys()
+            ],
+            "size": [len(v) for v in pfr_by_partition.values()],
         }
     )
     changesets_winter = pd.DataFrame(
@@ -177,6 +536,20 @@ def generate_imports():
     summary.append(
         f"{len(pfr_washrooms_osm_status2)} data points with Status 2 (service alert)"
     )
+    summary.append(
+        f"{sum(fixes_fired.values())} encoding and spelling fixes applied"
+        + "".join(f"\n  {pattern}: {n}" for pattern, n in fixes_fired.most_common())
+    )
+    summary.append("")
+    summary.append(
+        "Pre-conflation of normalized import dataset with OpenStreetMap: "
+        + ", ".join(
+            f"{n} {status}"
+            for status, n in pfr_washrooms_matched["DELETE_match_status"]
+            .value_counts()
+            .items()
+        )
+    )
     summary.append("")
     summary.append(
         f"{len(changesets)} changesets generated, largest has {changesets['size'].max()} points, and smallest has {changesets['size'].min()} points"
@@ -187,10 +560,224 @@ def generate_imports():
         f"{len(changesets_winter)} winter hours changesets generated, largest has {changesets_winter['size'].max()} points, and smallest has {changesets_winter['size'].min()} points"
     )
     summary.append(changesets_winter.to_string(index=False))
+    summary.append("")
+    summary.append(
+        f"{written['changed_assets']} washrooms changed since the previous run; {written['folders_rewritten']} of {written['folders']} changeset folders rewritten, {written['folders_removed']} stale folders removed"
+    )
+    summary.append("")
+    summary.append(
+        f"Fetched {len(fetch_latencies)} sources in {max(fetch_latencies.values()):.2f} seconds"
+    )
+    summary.extend(
+        [
+            f"  {name}: {seconds:.2f} seconds"
+            for name, seconds in fetch_latencies.items()
+        ]
+    )
+    summary.append("")
+    summary.append(
+        "Slowest stages: "
+        + ", ".join(
+            f"{x['name']} {x['wall_seconds']:.2f} s"
+            for x in sorted(report.stages, key=lambda x: -x["wall_seconds"])[:3]
+        )
+        + f"; run report saved to {REPORT_PATH}"
+    )
+    cached = [x["name"] for x in report.stages if x.get("cached")]
+    if cached:
+        summary.append(f"Reused {len(cached)} unchanged stages: " + ", ".join(cached))
     print("\n".join(summary))
 
+    # machine-readable report, e.g. for graphing performance across runs
+    write_if_changed(
+        REPORT_PATH,
+        json.dumps(
+            report.to_dict(
+                options={
+                    "incremental": incremental,
+                    "geojson_format": geojson_format,
+                    "workers": workers,
+                    "partition_by": partition_by,
+                    "max_changeset_size": max_changeset_size,
+                    "validation": get_validator().mode,
+                },
+                source_versions={
+                    "pfr_washrooms": pfr_washrooms["metadata"]["last_modified"],
+                    "pfr_facilities": pfr_facilities["metadata"]["last_modified"],
+                },
+                validation=get_validator().records,
+            ),
+            indent=2,
+        ),
+    )
+
+
+def get_partition_files(
+    prefix: str,
+    layer: str,
+    gdf: gpd.GeoDataFrame,
+    bbox: str,
+    subset_name: str,
+    source_date: str,
+    geojson_format: GeoJSONFormat = "pretty",
+    osm_store: OSMStore | None = None,
+) -> dict[str, Callable[[str], bool]]:
+    """Returns the files for one changeset folder (the washrooms layer with and without pre-conflation columns, the Overpass query, and the changeset tags) as a mapping of file name to a function that writes the file, for use with save_partition. If osm_store is given, the folder also gets the current toilets in OpenStreetMap, the same data layer with the import applied, and the import as an osmChange file."""
+
+    ext = EXTENSIONS[geojson_format]
+    files = {
+        f"{prefix}_{layer}{ext}": lambda path: save_geojson(
+            path, gdf.drop(columns=MATCH_COLUMNS), geojson_format
+        ),
+        f"{prefix}_matches{ext}": lambda path: save_geojson(path, gdf, geojson_format),
+        f"{prefix}_toilets_query.txt": lambda path: write_if_changed(
+            path, get_washrooms_query(bbox)
+        ),
+        f"{prefix}_changeset_tags.txt": lambda path: write_if_changed(
+            path,
+            get_changeset_tags(
+                subset_name=subset_name,
+                source_date=source_date,
+                wiki_link=PROPOSAL_WIKI_LINK,
+            ),
+        ),
+    }
+    if osm_store is not None:
+        # only worked out if the folder is saved, then shared by both files
+        changes = cache(lambda: get_changes(gdf, osm_store))
+        files[f"{prefix}_toilets.osm"] = lambda path: save_xml(
+            path, lambda f: osm_store.write_osm(f, parse_bbox(bbox))
+        )
+        files[f"{prefix}_import.osm"] = lambda path: save_xml(
+            path,
+            lambda f: write_import_osm(f, changes(), osm_store, parse_bbox(bbox)),
+        )
+        files[f"{prefix}_import.osc"] = lambda path: save_xml(
+            path, lambda f: write_import_osmchange(f, changes())
+        )
+    return files
+
 
-def get_current_washrooms():
+def save_partitions(
+    partitions: dict[str, tuple[dict[str, Callable[[str], bool]], str]],
+    manifest: Manifest,
+    incremental: bool,
+    workers: int | None = None,
+) -> int:
+    """Saves changeset folders in a thread pool, given as a mapping of folder to the files and fingerprint arguments of save_partition. Returns the number of folders with rewritten files."""
+
+    results, _ = run_concurrently(
+        {
+            folder: lambda folder=folder, files=files, fingerprint=fingerprint: save_partition(
+                folder, files, fingerprint, manifest, incremental
+            )
+            for folder, (files, fingerprint) in partitions.items()
+        },
+        max_workers=workers,
+    )
+    return sum(results.values())
+
+
+def save_partition(
+    folder: str,
+    files: dict[str, Callable[[str], bool]],
+    fingerprint: str,
+    manifest: Manifest,
+    incremental: bool,
+) -> bool:
+    """Saves the files for one changeset folder, given as a mapping of file name to a function that writes the file to a given path and returns whether it was rewritten. If incremental is True and the folder's fingerprint matches the manifest from the previous run, content generation is skipped. Only files whose content changed are rewritten. Returns whether any file was rewritten."""
+
+    unchanged = manifest["partitions"].get(folder) == fingerprint and all(
+        os.path.exists(os.path.join(folder, name)) for name in files
+    )
+    manifest["partitions"][folder] = fingerprint
+    if incremental and unchanged:
+        return False
+    os.makedirs(folder, exist_ok=True)
+    written = [write(os.path.join(folder, name)) for name, write in files.items()]
+    return any(written)
+
+
+def remove_stale_partitions(
+    folders: Iterable[str], roots: list[str], manifest: Manifest
+) -> int:
+    """Removes changeset folders that are not in folders (e.g. for wards that were renamed or removed since the previous run, parts from a different maximum changeset size, or another partitioning scheme), and their manifest entries. Stale folders are those in the manifest and any other folder directly under roots, and roots left empty are removed too. Returns the number of folders removed."""
+
+    current = {os.path.normpath(x) for x in folders}
+    stale = {os.path.normpath(x) for x in manifest["partitions"]} - current
+    for root in roots:
+        if os.path.isdir(root):
+            stale |= {
+                os.path.normpath(x.path) for x in os.scandir(root) if x.is_dir()
+            } - current
+    removed = [x for x in sorted(stale) if os.path.isdir(x)]
+    for folder in removed:
+        shutil.rmtree(folder)
+    for root in roots:
+        if os.path.isdir(root) and not os.listdir(root):
+            os.rmdir(root)
+    manifest["partitions"] = {
+        k: v
+        for k, v in manifest["partitions"].items()
+        if os.path.normpath(k) in current
+    }
+    return len(removed)
+
+
+def fetch_sources(
+    timeouts: dict[str, float] = SOURCE_TIMEOUTS,
+) -> tuple[dict, dict[str, float]]:
+    """Retrieves OpenStreetMap and city open data concurrently, since each source is an independent download. Returns the results and the time taken for each source in seconds, keyed by source name."""
+
+    return run_concurrently(
+        {
+            "current_washrooms": lambda: get_current_washrooms(
+                timeout=timeouts["current_washrooms"]
+            ),
+            "pfr_washrooms": lambda: get_pfr_washrooms(
+                timeout=timeouts["pfr_washrooms"]
+            ),
+            "pfr_facilities": lambda: get_pfr_facilities(
+                timeout=timeouts["pfr_facilities"]
+            ),
+            "wards": lambda: get_wards(timeout=timeouts["wards"]),
+            "ccbs": lambda: get_community_council_boundaries(timeout=timeouts["ccbs"]),
+        }
+    )
+
+
+def watch_sources(
+    interval: float = DEFAULT_WATCH_INTERVAL,
+    max_polls: int | None = None,
+    **options,
+):
+    """Runs generate_imports incrementally (with the given options) on start and then whenever a watched CKAN resource's last_modified value or the Overpass timestamp_osm_base changes, polling their metadata every interval seconds. Imported modules, stored boundaries, and unchanged stage outputs stay in memory between runs."""
+    memo = {}
+    watch(
+        poll=lambda: poll_versions(
+            {name: CKAN_SOURCES[name] for name in WATCHED_SOURCES},
+            timeout=SOURCE_TIMEOUTS["pfr_washrooms"],
+        ),
+        rebuild=lambda: generate_imports(**{**options, "incremental": True}, memo=memo),
+        interval=interval,
+        max_polls=max_polls,
+    )
+
+
+def get_sources_key(sources: dict) -> str:
+    """Hashes the content of the data from fetch_sources, so that later stages are keyed by what was downloaded rather than when. Boundary layers are keyed by their version and the code that formatted them."""
+    return fingerprint_value(
+        {
+            "current_washrooms": sources["current_washrooms"],
+            "pfr_washrooms": sources["pfr_washrooms"]["gdf"],
+            "pfr_facilities": sources["pfr_facilities"]["gdf"],
+            "wards": [sources["wards"]["version"], sources["wards"]["code"]],
+            "ccbs": [sources["ccbs"]["version"], sources["ccbs"]["code"]],
+        }
+    )
+
+
+def get_current_washrooms(timeout: float | None = None):
     """Retrieves amenity=toilets that are currently in OpenStreetMap within the City of Toronto. Saves output to source_data/current_washrooms.json"""
 
     washroom_query = """
@@ -201,42 +788,42 @@ def get_current_washrooms():
         nwr["building"="toilets"](area.toArea);
         );
         out geom meta;
+        >;
+        out meta;
     """
-    current_washrooms = query_overpass(washroom_query)
+    current_washrooms = query_overpass_content(washroom_query, timeout=timeout)
     with open("source_data/current_washrooms.json", "w") as f:
-        json.dump(current_washrooms, f, indent=2)
+        write_overpass_json(current_washrooms, f)
     return current_washrooms
 
 
-def get_current_washrooms_gdf(current_washrooms):
-    """Converts the output from get_current_washrooms into a GeoDataFrame. Saves output to source_data/current_washrooms.geojson"""
-    current_washrooms_gdf = gpd.GeoDataFrame.from_features(
+def get_current_washrooms_gdf(current_washrooms: str):
+    """Converts the output from get_current_washrooms into a GeoDataFrame, parsing one element at a time. Saves output to source_data/current_washrooms.geojson and a GeoParquet snapshot to source_data/current_washrooms.parquet"""
+    current_washrooms_gdf = overpass_to_gdf(current_washrooms, WASHROOM_TAGS)
+
+    # confirm that rows are only the elements selected by the query, once each, and not tagged members (e.g. entrance nodes) output by ">;"
+    schema = pa.DataFrameSchema(
         {
-            "type": "FeatureCollection",
-            "features": [
-                feature_from_element(x) for x in current_washrooms["elements"]
-            ],
+            "_type": pa.Column(required=True),
+            "_id": pa.Column(required=True),
+            **{k: pa.Column(nullable=True, required=False) for k in WASHROOM_TAGS},
         },
-        crs=current_washrooms["crs"]["properties"]["name"],
+        checks=pa.Check(check_any_tag(WASHROOM_TAGS), name="washroom_tags"),
+        unique=["_type", "_id"],
+    )
+    get_validator().validate(
+        schema, current_washrooms_gdf, "current_washrooms", lazy=True
     )
     with open("source_data/current_washrooms.geojson", "w") as f:
-        f.write(
-            current_washrooms_gdf.to_json(
-                na="drop",
-                drop_id=True,
-                indent=2,
-            )
-        )
+        write_geojson(current_washrooms_gdf, f)
+    save_snapshot(current_washrooms_gdf, "source_data/current_washrooms.parquet")
     return current_washrooms_gdf
 
 
-def get_pfr_washrooms() -> TODResponse:
-    """Retrieves, validates, and saves data from the Park Washroom Facilities dataset on open.toronto.ca. Saves gdf output to source_data/pfr_washrooms.geojson and metadata output to source_data/pfr_washrooms_meta.json"""
+def get_pfr_washrooms(timeout: float | None = None) -> TODResponse:
+    """Retrieves, validates, and saves data from the Park Washroom Facilities dataset on open.toronto.ca. Saves gdf output to source_data/pfr_washrooms.geojson (and a GeoParquet snapshot to source_data/pfr_washrooms.parquet) and metadata output to source_data/pfr_washrooms_meta.json"""
 
-    pfr_washrooms = request_tod_gdf(
-        dataset_name="washroom-facilities",
-        resource_id="6d848f38-45a3-41e8-9783-804385ec5a16",
-    )
+    pfr_washrooms = request_tod_gdf(**CKAN_SOURCES["pfr_washrooms"], timeout=timeout)
     pfr_washrooms["gdf"] = (
         pfr_washrooms["gdf"]
         .rename(columns={"id": "parent_id"})
@@ -244,21 +831,16 @@ def get_pfr_washrooms() -> TODResponse:
     )
 
     # validate city data and throw errors if input assumptions have changed
-    def check_accessible(accessible: pd.Series):
-        known_values = [
-            pd.NA,
-            "Entrance at Grade",
-            "Accessible Stall",
-            "Child Change Table",
-            "Entrance Access Ramp",
-            "Automatic Door Opener",
-            "Adult Change Table",
-            # known error; ignored by the get_wheelchair_description function:
-            "9 a.m. to 10 p.m.",
-        ]
-        accessible_lists = accessible.replace("", pd.NA).str.split(", ")
-        return accessible_lists.apply(lambda x: pd.Series(x).isin(known_values).all())
-
+    known_accessible_values = [
+        "Entrance at Grade",
+        "Accessible Stall",
+        "Child Change Table",
+        "Entrance Access Ramp",
+        "Automatic Door Opener",
+        "Adult Change Table",
+        # known error; ignored by the get_wheelchair_description function:
+        "9 a.m. to 10 p.m.",
+    ]
     schema = pa.DataFrameSchema(
         {
             # REQUIRED COLUMNS
@@ -273,27 +855,17 @@ def get_pfr_washrooms() -> TODResponse:
                 str,
                 nullable=True,
                 required=True,
-                checks=pa.Check(check_accessible),
+                checks=pa.Check(
+                    check_list_values(known_accessible_values),
+                    name="known_accessible_values",
+                ),
             ),
             "hours": pa.Column(
                 str,
                 nullable=True,
                 required=True,
-                checks=pa.Check.isin(
-                    [
-                        "9 a.m. to 10 p.m.",
-                        "View centre hours",
-                        "View outdoor rink hours",
-                        "View outdoor pool hours",
-                        "View facility hours",
-                        "9 a.m. to 5 p.m.",
-                        "9 a.m. to 7:30 p.m.",
-                        "View centre hours.",
-                        "6:30 a.m. to 11:30 p.m.",
-                        "View the facility hours",
-                        "View arena hours",
-                    ]
-                ),
+                # known values are listed in resources/opening_hours_rules.csv
+                checks=pa.Check.isin(load_opening_hours_rules()["hours"].unique()),
             ),
             "location_details": pa.Column(str, required=True),
             "AssetName": pa.Column(str, required=True),
@@ -301,7 +873,7 @@ def get_pfr_washrooms() -> TODResponse:
                 "geometry",
                 required=True,
                 # check that there is only one coordinate pair per MultiPoint
-                checks=pa.Check(lambda s: s.apply(lambda x: len(x.geoms) == 1)),
+                checks=pa.Check(check_num_geometries(1), name="single_point"),
             ),
             "Reason": pa.Column(str, nullable=True, required=True),
             "Comments": pa.Column(str, nullable=True, required=True),
@@ -319,31 +891,28 @@ def get_pfr_washrooms() -> TODResponse:
             "PostedDate": pa.Column("datetime64"),
         }
     )
-    schema.validate(pfr_washrooms["gdf"], lazy=True)
+    get_validator().validate(schema, pfr_washrooms["gdf"], "pfr_washrooms", lazy=True)
 
     # save validated city data
     with open("source_data/pfr_washrooms.geojson", "w") as f:
-        f.write(
-            pfr_washrooms["gdf"]
-            .assign(
+        write_geojson(
+            pfr_washrooms["gdf"].assign(
                 PostedDate=pfr_washrooms["gdf"]["PostedDate"].dt.strftime(
                     "%Y-%m-%dT%H:%M:%S.%f%z"
                 )
-            )
-            .to_json(na="drop", drop_id=True, indent=2)
+            ),
+            f,
         )
+    save_snapshot(pfr_washrooms["gdf"], "source_data/pfr_washrooms.parquet")
     with open("source_data/pfr_washrooms_meta.json", "w") as f:
         json.dump(pfr_washrooms["metadata"], f, indent=2)
     return pfr_washrooms
 
 
-def get_pfr_facilities() -> TODResponse:
-    """Retrieves, validates, and saves data from the Parks and Recreation Facilities dataset on open.toronto.ca. Saves gdf output to source_data/pfr_facilities.geojson and metadata output to source_data/pfr_facilities_meta.json"""
+def get_pfr_facilities(timeout: float | None = None) -> TODResponse:
+    """Retrieves, validates, and saves data from the Parks and Recreation Facilities dataset on open.toronto.ca. Saves gdf output to source_data/pfr_facilities.geojson (and a GeoParquet snapshot to source_data/pfr_facilities.parquet) and metadata output to source_data/pfr_facilities_meta.json"""
 
-    pfr_facilities = request_tod_gdf(
-        dataset_name="parks-and-recreation-facilities",
-        resource_id="f6cdcd50-da7b-4ede-8e60-c3cdba70b559",
-    )
+    pfr_facilities = request_tod_gdf(**CKAN_SOURCES["pfr_facilities"], timeout=timeout)
 
     # validate data
     schema = pa.DataFrameSchema(
@@ -354,11 +923,12 @@ def get_pfr_facilities() -> TODResponse:
             ),
         }
     )
-    schema.validate(pfr_facilities["gdf"])
+    get_validator().validate(schema, pfr_facilities["gdf"], "pfr_facilities")
 
     # save validated city data
     with open("source_data/pfr_facilities.geojson", "w") as f:
-        f.write(pfr_facilities["gdf"].to_json(na="drop", drop_id=True, indent=2))
+        write_geojson(pfr_facilities["gdf"], f)
+    save_snapshot(pfr_facilities["gdf"], "source_data/pfr_facilities.parquet")
     with open("source_data/pfr_facilities_meta.json", "w") as f:
         json.dump(pfr_facilities["metadata"], f, indent=2)
     return pfr_facilities
@@ -381,110 +951,178 @@ def get_access(asset_id):
     return "customers" if asset_id == 58062 else "yes"
 
 
-def pattern_search(pattern):
-    def f(asset_name):
-        match = re.search(pattern, asset_name, re.IGNORECASE)
-        return "yes" if match != None else pd.NA
-
-    return f
+def pattern_search(values: pd.Series, pattern: str) -> pd.Series:
+    """Returns "yes" where the regex pattern matches (ignoring case), otherwise NA"""
+    match = values.str.contains(pattern, case=False, regex=True).fillna(False)
+    return pd.Series(np.where(match, "yes", pd.NA), index=values.index, dtype=object)
+
+
+# accessibility features listed in the "accessible" column, in the order used for wheelchair:description
+ACCESSIBLE_FEATURES = [
+    "Entrance at Grade",
+    "Entrance Access Ramp",
+    "Automatic Door Opener",
+    "Accessible Stall",
+    "Child Change Table",
+    "Adult Change Table",
+]
+
+
+def parse_accessible(accessible: pd.Series) -> pd.DataFrame:
+    """Parses the "accessible" column into a boolean matrix with one column per known accessibility feature. Each distinct value is only parsed once."""
+    codes, uniques = pd.factorize(as_text(accessible))
+    unique_features = np.array(
+        [[feature in value for feature in ACCESSIBLE_FEATURES] for value in uniques],
+        dtype=bool,
+    ).reshape(len(uniques), len(ACCESSIBLE_FEATURES))
+    return pd.DataFrame(
+        unique_features[codes], columns=ACCESSIBLE_FEATURES, index=accessible.index
+    )
 
 
-def get_changing_table(accessible: str):
-    return "yes" if "Child Change Table" in accessible else pd.NA
+def get_accessibility_tags(accessible: pd.Series) -> dict[str, pd.Series]:
+    """Derives changing_table, changing_table:adult, wheelchair, toilets:wheelchair, and wheelchair:description tags from the "accessible" column"""
+    features = parse_accessible(accessible)
 
+    def yes_if(condition: pd.Series) -> pd.Series:
+        return pd.Series(
+            np.where(condition, "yes", pd.NA), index=accessible.index, dtype=object
+        )
 
-def get_changing_table_adult(accessible: str):
-    return "yes" if "Adult Change Table" in accessible else pd.NA
+    wheelchair_yes = (
+        features["Entrance at Grade"] | features["Entrance Access Ramp"]
+    ) & features["Accessible Stall"]
+    wheelchair = yes_if(wheelchair_yes).mask(as_text(accessible) == "None", "no")
 
+    # the description only depends on which features are present, so build it once per combination
+    combination_codes, combinations = pd.factorize(
+        features.to_numpy() @ (1 << np.arange(len(ACCESSIBLE_FEATURES)))
+    )
+    descriptions = np.array(
+        [
+            "Accessible features: "
+            + ", ".join(
+                feature.lower()
+                for i, feature in enumerate(ACCESSIBLE_FEATURES)
+                if combination & (1 << i)
+            )
+            for combination in combinations
+        ],
+        dtype=object,
+    )
+    wheelchair_description = pd.Series(
+        np.where(wheelchair_yes, descriptions[combination_codes], pd.NA),
+        index=accessible.index,
+        dtype=object,
+    )
 
-def get_wheelchair(accessible: str):
-    if accessible == "None":
-        return "no"
-    if (
-        ("Entrance at Grade" in accessible) or ("Entrance Access Ramp" in accessible)
-    ) and ("Accessible Stall" in accessible):
-        return "yes"
-    else:
-        return pd.NA
+    return {
+        "changing_table": yes_if(features["Child Change Table"]),
+        "changing_table:adult": yes_if(features["Adult Change Table"]),
+        "wheelchair": wheelchair,
+        "toilets:wheelchair": yes_if(features["Accessible Stall"]),
+        "wheelchair:description": wheelchair_description,
+    }
 
 
-def get_toilets_wheelchair(accessible: str):
-    return "yes" if "Accessible Stall" in accessible else pd.NA
+def load_opening_hours_rules(
+    path: str = OPENING_HOURS_RULES_PATH,
+) -> pd.DataFrame:
+    """Loads the table mapping city "hours" and "parent_type" values to opening_hours tags and survey prompts for the note tag. Every known "hours" value must appear in the table. Rules are checked in order and a blank parent_type matches any parent type; the first matching rule sets opening_hours (blank for none), and the survey prompts of all matching rules are combined into the note."""
+    return pd.read_csv(path, dtype=str, keep_default_na=False)
 
 
-def get_wheelchair_description(accessible: str):
-    if str(get_wheelchair(accessible)) != "yes":
-        return pd.NA
-    features = [
-        "entrance at grade" if "Entrance at Grade" in accessible else None,
-        "entrance access ramp" if "Entrance Access Ramp" in accessible else None,
-        "automatic door opener" if "Automatic Door Opener" in accessible else None,
-        "accessible stall" if "Accessible Stall" in accessible else None,
-        "child change table" if "Child Change Table" in accessible else None,
-        "adult change table" if "Adult Change Table" in accessible else None,
+def get_rule_matches(
+    hours: pd.Series, parent_type: pd.Series, rules: pd.DataFrame
+) -> list[np.ndarray]:
+    """Returns one boolean array per rule indicating which rows it matches"""
+    hours_values = as_text(hours).to_numpy(dtype=object)
+    parent_type_values = as_text(parent_type).to_numpy(dtype=object)
+    return [
+        (hours_values == rule.hours)
+        & ((rule.parent_type == "") | (parent_type_values == rule.parent_type))
+        for rule in rules.itertuples()
     ]
-    return f"Accessible features: {', '.join([x for x in features if x is not None])}"
-
-
-def get_opening_hours(row):
-    hours = row["hours"]
-    parent_type = row["parent_type"]
-    if hours == "9 a.m. to 10 p.m." and parent_type == "Park":
-        return "May-Oct 09:00-22:00"
-    elif hours == "9 a.m. to 10 p.m." and parent_type == "Community Centre":
-        return "09:00-22:00"
-    elif hours == "9 a.m. to 10 p.m." and parent_type == "Community Centre|Park":
-        return pd.NA
-    # Riverdale Farm:
-    elif hours == "9 a.m. to 5 p.m.":
-        return "09:00-17:00"
-    # Coronation Park, 711 Lake Shore Blvd  W:
-    elif hours == "9 a.m. to 7:30 p.m.":
-        return "09:00-19:30"
-    # Jack Layton Ferry terminal:
-    elif hours == "6:30 a.m. to 11:30 p.m.":
-        return "06:30-23:30"
-    else:
-        return pd.NA
 
 
-def get_note(row):
-    prompts = []
-    if row["hours"] == "9 a.m. to 10 p.m." and row["parent_type"] == "Park":
-        prompts.append(
-            "Is this washroom open in the winter? opening_hours if yes are likely May-Oct 09:00-22:00; Nov-Apr 09:00-20:00, if no likely May-Oct 09:00-22:00; Nov-Apr off"
-        )
-    if (
-        row["hours"] == "9 a.m. to 10 p.m."
-        and row["parent_type"] == "Community Centre|Park"
+def get_opening_hours(
+    hours: pd.Series, parent_type: pd.Series, rules: pd.DataFrame
+) -> pd.Series:
+    values = rules["opening_hours"].replace("", pd.NA).to_list()
+    return pd.Series(
+        np.select(get_rule_matches(hours, parent_type, rules), values, pd.NA),
+        index=hours.index,
+        dtype=object,
+    )
+
+
+def get_note(
+    hours: pd.Series, parent_type: pd.Series, rules: pd.DataFrame
+) -> pd.Series:
+    prompts = np.full(len(hours), "", dtype=object)
+    for matches, prompt in zip(
+        get_rule_matches(hours, parent_type, rules), rules["survey_prompt"]
     ):
-        prompts.append("opening_hours")
-    prompt_string = "; ".join(prompts)
-    if len(prompt_string) > 0:
-        return f"Please survey to determine: {prompt_string}"
-    else:
-        return pd.NA
+        if prompt == "":
+            continue
+        prompts = np.where(
+            matches, np.where(prompts == "", prompt, prompts + "; " + prompt), prompts
+        )
+    return pd.Series(
+        np.where(prompts == "", pd.NA, "Please survey to determine: " + prompts),
+        index=hours.index,
+        dtype=object,
+    )
 
 
-def get_pfr_washrooms_osm_open(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
-    """Transforms output from get_pfr_washrooms into OpenStreetMap tags for washrooms with status 1 (open). Requires that a "parent_type" column be joined onto the get_pfr_washrooms output to indicate whether the washroom is in a park or a community centre. Saves output to to_import/pfr_to_import.geojson"""
+STATUS_COLUMNS = [
+    "DELETE_Status_PostedDate",
+    "DELETE_Status_Reason",
+    "DELETE_Status_Comments",
+]
+OSM_TAG_COLUMNS = [
+    "amenity",
+    "access",
+    "fee",
+    "male",
+    "female",
+    "toilets:disposal",
+    "toilets:handwashing",
+    "changing_table",
+    "changing_table:adult",
+    "wheelchair",
+    "toilets:wheelchair",
+    "wheelchair:description",
+    "operator",
+    "opening_hours",
+    "description",
+    "note",
+    "ref:open.toronto.ca:washroom-facilities:asset_id",
+]
+
+
+# tags with the same value for every washroom
+CONSTANT_TAGS = {
+    "amenity": "toilets",
+    "fee": "no",
+    "toilets:disposal": "flush",
+    "toilets:handwashing": "yes",
+    "operator": "City of Toronto",
+}
+
+
+def get_pfr_washrooms_osm(
+    gdf: gpd.GeoDataFrame, rules: pd.DataFrame | None = None, compact: bool = False
+) -> gpd.GeoDataFrame:
+    """Transforms output from get_pfr_washrooms into OpenStreetMap tags for all washroom buildings regardless of status, in a single pass. Requires that a "parent_type" column be joined onto the get_pfr_washrooms output to indicate whether the washroom is in a park or a community centre. Keeps the "Status" column and DELETE_Status_* columns so the output can be split with get_pfr_washrooms_osm_open and get_pfr_washrooms_osm_closed_or_alert. If compact is True, CONSTANT_TAGS are stored as single-category columns rather than repeated in every row."""
 
-    original_cols = gdf.columns.drop("geometry")
+    if rules is None:
+        rules = load_opening_hours_rules()
 
-    # filter city data and confirm that (a) filtered data does not contain Reason or Comments columns and (b) that the input data contains an appropriate "parent_type" column
-    gdf_filtered = gdf[(gdf["type"] == "Washroom Building") & (gdf["Status"] == "1")]
+    # filter city data and confirm that the input data contains an appropriate "parent_type" column
+    gdf_filtered = gdf[gdf["type"] == "Washroom Building"]
     schema = pa.DataFrameSchema(
         {
-            "Reason": pa.Column(
-                str,
-                nullable=True,
-                checks=pa.Check.equal_to(pd.NA),
-            ),
-            "Comments": pa.Column(
-                str,
-                nullable=True,
-                checks=pa.Check.equal_to(pd.NA),
-            ),
             "parent_type": pa.Column(
                 str,
                 required=True,
@@ -495,60 +1133,51 @@ def get_pfr_washrooms_osm_open(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
             ),
         }
     )
-    schema.validate(gdf_filtered, lazy=True)
+    get_validator().validate(schema, gdf_filtered, "washrooms_parent_type", lazy=True)
 
     gdf_normalized = (
         gdf_filtered.assign(
             **{
-                "amenity": "toilets",
-                "access": gdf_filtered["asset_id"].apply(get_access),
-                "fee": "no",
-                "male": gdf_filtered["AssetName"].apply(
-                    pattern_search(r"\bmen's\b|\bmale\b")
-                ),
-                "female": gdf_filtered["AssetName"].apply(
-                    pattern_search(r"\bwomen's\b|\bfemale\b")
-                ),
-                "toilets:disposal": "flush",
-                "toilets:handwashing": "yes",
-                "changing_table": (
-                    gdf_filtered["accessible"].astype(str).apply(get_changing_table)
-                ),
-                "changing_table:adult": (
-                    gdf_filtered["accessible"]
-                    .astype(str)
-                    .apply(get_changing_table_adult)
+                "DELETE_Status_PostedDate": gdf_filtered["PostedDate"].dt.strftime(
+                    "%Y-%m-%dT%H:%M:%S.%f%z"
                 ),
-                "wheelchair": (
-                    gdf_filtered["accessible"].astype(str).apply(get_wheelchair)
+                "DELETE_Status_Reason": gdf_filtered["Reason"],
+                "DELETE_Status_Comments": gdf_filtered["Comments"],
+                **(
+                    constant_columns(CONSTANT_TAGS, gdf_filtered.index)
+                    if compact
+                    else CONSTANT_TAGS
                 ),
-                "toilets:wheelchair": (
-                    gdf_filtered["accessible"].astype(str).apply(get_toilets_wheelchair)
+                "access": gdf_filtered["asset_id"].apply(get_access),
+                "male": pattern_search(
+                    gdf_filtered["AssetName"], r"\bmen's\b|\bmale\b"
                 ),
-                "wheelchair:description": (
-                    gdf_filtered["accessible"]
-                    .astype(str)
-                    .apply(get_wheelchair_description)
+                "female": pattern_search(
+                    gdf_filtered["AssetName"], r"\bwomen's\b|\bfemale\b"
                 ),
-                "operator": "City of Toronto",
-                "opening_hours": (
-                    gdf_filtered[["hours", "parent_type"]]
-                    .astype(str)
-                    .apply(get_opening_hours, axis=1)
+                **get_accessibility_tags(gdf_filtered["accessible"]),
+                "opening_hours": get_opening_hours(
+                    gdf_filtered["hours"], gdf_filtered["parent_type"], rules
                 ),
                 "description": gdf_filtered["location_details"].str.strip(),
-                "note": (
-                    gdf_filtered[["AssetName", "hours", "parent_type"]]
-                    .astype(str)
-                    .apply(get_note, axis=1)
+                "note": get_note(
+                    gdf_filtered["hours"], gdf_filtered["parent_type"], rules
                 ),
                 "ref:open.toronto.ca:washroom-facilities:asset_id": (
                     gdf_filtered["asset_id"].astype(str)
                 ),
             }
+        )[["Status", *STATUS_COLUMNS, *OSM_TAG_COLUMNS, "geometry"]].explode(
+            index_parts=False
+        )  # convert MultiPoint to Point
+        # keep a string dtype even if every value is missing (e.g. for small subsets)
+        .astype(
+            {
+                "wheelchair:description": "string",
+                "description": "string",
+                "note": "string",
+            }
         )
-        .drop(original_cols, axis=1)
-        .explode(index_parts=False)  # convert MultiPoint to Point
     )
 
     # ensure variable length tag values do not exceed 255 char limit
@@ -571,153 +1200,67 @@ def get_pfr_washrooms_osm_open(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
             ),
         }
     )
-    output_schema.validate(gdf_normalized)
+    get_validator().validate(output_schema, gdf_normalized, "washrooms_osm")
 
-    with open("to_import/pfr_to_import.geojson", "w") as f:
-        f.write(
-            gdf_normalized.to_json(
-                na="drop",
-                drop_id=True,
-                indent=2,
-            )
-        )
     return gdf_normalized
 
 
-def get_pfr_washrooms_osm_closed_or_alert(
-    gdf: gpd.GeoDataFrame, status: Literal["0", "2"]
-) -> gpd.GeoDataFrame:
-    """Transforms output from get_pfr_washrooms into OpenStreetMap tags for washrooms with status 0 (closed) or status 2 (service alert). Requires that a "parent_type" column be joined onto the get_pfr_washrooms output to indicate whether the washroom is in a park or a community centre. Saves output to to_import/pfr_status_<#>_to_review.geojson"""
+def get_pfr_washrooms_osm_open(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Selects washrooms with status 1 (open) from the output of get_pfr_washrooms_osm, keeping only OpenStreetMap tags. Output is saved by generate_imports to to_import/pfr_to_import.geojson"""
 
-    original_cols = gdf.columns.drop("geometry")
+    gdf_open = gdf[gdf["Status"] == "1"]
 
-    # filter city data and confirm that the input data contains an appropriate "parent_type" column
-    gdf_filtered = gdf[(gdf["type"] == "Washroom Building") & (gdf["Status"] == status)]
+    # confirm that open washrooms do not have Reason or Comments values
     schema = pa.DataFrameSchema(
         {
-            "parent_type": pa.Column(
+            "DELETE_Status_Reason": pa.Column(
                 str,
-                required=True,
                 nullable=True,
-                checks=pa.Check.isin(
-                    ["Park", "Community Centre", "Community Centre|Park"]
-                ),
-            ),
-        }
-    )
-    schema.validate(gdf_filtered, lazy=True)
-
-    gdf_normalized = (
-        gdf_filtered.assign(
-            **{
-                "DELETE_Status_PostedDate": gdf_filtered["PostedDate"].dt.strftime(
-                    "%Y-%m-%dT%H:%M:%S.%f%z"
-                ),
-                "DELETE_Status_Reason": gdf_filtered["Reason"],
-                "DELETE_Status_Comments": gdf_filtered["Comments"],
-                "amenity": "toilets",
-                "access": gdf_filtered["asset_id"].apply(get_access),
-                "fee": "no",
-                "male": gdf_filtered["AssetName"].apply(
-                    pattern_search(r"\bmen's\b|\bmale\b")
-                ),
-                "female": gdf_filtered["AssetName"].apply(
-                    pattern_search(r"\bwomen's\b|\bfemale\b")
-                ),
-                "toilets:disposal": "flush",
-                "toilets:handwashing": "yes",
-                "changing_table": (
-                    gdf_filtered["accessible"].astype(str).apply(get_changing_table)
-                ),
-                "changing_table:adult": (
-                    gdf_filtered["accessible"]
-                    .astype(str)
-                    .apply(get_changing_table_adult)
-                ),
-                "wheelchair": (
-                    gdf_filtered["accessible"].astype(str).apply(get_wheelchair)
-                ),
-                "toilets:wheelchair": (
-                    gdf_filtered["accessible"].astype(str).apply(get_toilets_wheelchair)
-                ),
-                "wheelchair:description": (
-                    gdf_filtered["accessible"]
-                    .astype(str)
-                    .apply(get_wheelchair_description)
-                ),
-                "operator": "City of Toronto",
-                "opening_hours": (
-                    gdf_filtered[["hours", "parent_type"]]
-                    .astype(str)
-                    .apply(get_opening_hours, axis=1)
-                ),
-                "description": gdf_filtered["location_details"].str.strip(),
-                "note": (
-                    gdf_filtered[["AssetName", "hours", "parent_type"]]
-                    .astype(str)
-                    .apply(get_note, axis=1)
-                ),
-                "ref:open.toronto.ca:washroom-facilities:asset_id": (
-                    gdf_filtered["asset_id"].astype(str)
-                ),
-            }
-        )
-        .drop(original_cols, axis=1)
-        .explode(index_parts=False)  # convert MultiPoint to Point
-    )
-
-    # ensure variable length tag values do not exceed 255 char limit
-    output_schema = pa.DataFrameSchema(
-        {
-            "wheelchair:description": pa.Column(
-                str,
-                nullable=True,
-                checks=pa.Check.str_length(max_value=255),
-            ),
-            "description": pa.Column(
-                str,
-                nullable=True,
-                checks=pa.Check.str_length(max_value=255),
+                checks=pa.Check.equal_to(pd.NA),
             ),
-            "note": pa.Column(
+            "DELETE_Status_Comments": pa.Column(
                 str,
                 nullable=True,
-                checks=pa.Check.str_length(max_value=255),
+                checks=pa.Check.equal_to(pd.NA),
             ),
         }
     )
-    output_schema.validate(gdf_normalized)
+    get_validator().validate(schema, gdf_open, "washrooms_osm_open", lazy=True)
 
-    with open(f"to_import/pfr_status_{status}_to_review.geojson", "w") as f:
-        f.write(
-            gdf_normalized.to_json(
-                na="drop",
-                drop_id=True,
-                indent=2,
-            )
-        )
-    return gdf_normalized
+    return gdf_open[[*OSM_TAG_COLUMNS, "geometry"]]
+
+
+def get_pfr_washrooms_osm_closed_or_alert(
+    gdf: gpd.GeoDataFrame, status: Literal["0", "2"]
+) -> gpd.GeoDataFrame:
+    """Selects washrooms with status 0 (closed) or status 2 (service alert) from the output of get_pfr_washrooms_osm, keeping OpenStreetMap tags and the DELETE_Status_* columns for review. Output is saved by generate_imports to to_import/pfr_status_<#>_to_review.geojson"""
+
+    return gdf[gdf["Status"] == status][[*STATUS_COLUMNS, *OSM_TAG_COLUMNS, "geometry"]]
 
 
-def get_wards_gdf() -> gpd.GeoDataFrame:
-    """Retrieves, simplifies, and saves data from the City Wards dataset from open.toronto.ca"""
+def get_wards(timeout: float | None = None) -> StoredBoundaries:
+    """Retrieves and simplifies data from the City Wards dataset from open.toronto.ca, with a spatial index of the wards. Saved to source_data/cache/boundaries/wards.pkl and only downloaded again when the dataset changes."""
 
-    wards = request_tod_gdf(
-        dataset_name="city-wards",
-        resource_id="737b29e0-8329-4260-b6af-21555ab24f28",
+    return get_stored_boundaries(
+        name="wards",
+        **CKAN_SOURCES["wards"],
+        format=format_wards_gdf,
+        name_column="ward_full",
+        timeout=timeout,
     )
+
+
+def format_wards_gdf(gdf: gpd.GeoDataFrame) -> gpd.GeoDataFrame:
+    """Simplifies data from the City Wards dataset"""
+
     wards_formatted = (
-        wards["gdf"][["AREA_SHORT_CODE", "AREA_NAME", "geometry"]]
+        gdf[["AREA_SHORT_CODE", "AREA_NAME", "geometry"]]
         .assign(
-            ward_full=[
-                f"{x.AREA_NAME} ({x.AREA_SHORT_CODE})"
-                for x in wards["gdf"].itertuples()
-            ]
+            ward_full=[f"{x.AREA_NAME} ({x.AREA_SHORT_CODE})" for x in gdf.itertuples()]
         )
         .assign(
             ward_bbox=[
-                f"{x.miny},{x.minx},{x.maxy},{x.maxx}"
-                for x in wards["gdf"].bounds.itertuples()
+                f"{x.miny},{x.minx},{x.maxy},{x.maxx}" for x in gdf.bounds.itertuples()
             ]
         )
         .rename(
@@ -730,22 +1273,31 @@ def get_wards_gdf() -> gpd.GeoDataFrame:
     return wards_formatted
 
 
-def get_community_council_boundaries_gdf() -> gpd.GeoDataFrame:
-    """Retrieves, simplifies, and saves data from the Community Council Boundaries dataset from open.toronto.ca"""
+def get_community_council_boundaries(
+    timeout: float | None = None,
+) -> StoredBoundaries:
+    """Retrieves and simplifies data from the Community Council Boundaries dataset from open.toronto.ca, with a spatial index of the community councils. Saved to source_data/cache/boundaries/ccbs.pkl and only downloaded again when the dataset changes."""
 
-    ccbs = request_tod_gdf(
-        dataset_name="community-council-boundaries",
-        resource_id="cc935c56-dbcd-4035-b156-a7f8f8eae68b",
+    return get_stored_boundaries(
+        name="ccbs",
+        **CKAN_SOURCES["ccbs"],
+        format=format_community_council_boundaries_gdf,
+        name_column="ccb_name",
+        timeout=timeout,
     )
+
+
+def format_community_council_boundaries_gdf(
+    gdf: gpd.GeoDataFrame,
+) -> gpd.GeoDataFrame:
+    """Simplifies data from the Community Council Boundaries dataset"""
+
     ccbs_formatted = (
-        ccbs["gdf"][["AREA_NAME", "geometry"]]
+        gdf[["AREA_NAME", "geometry"]]
         .assign(
-            ccb_name=ccbs["gdf"]["AREA_NAME"]
-            .str.removesuffix("Community Council")
-            .str.strip(),
+            ccb_name=gdf["AREA_NAME"].str.removesuffix("Community Council").str.strip(),
             ccb_bbox=[
-                f"{x.miny},{x.minx},{x.maxy},{x.maxx}"
-                for x in ccbs["gdf"].bounds.itertuples()
+                f"{x.miny},{x.minx},{x.maxy},{x.maxx}" for x in gdf.bounds.itertuples()
             ],
         )
         .drop(columns=["AREA_NAME"])
@@ -753,37 +1305,139 @@ def get_community_council_boundaries_gdf() -> gpd.GeoDataFrame:
     return ccbs_formatted
 
 
-def get_washrooms_query(bbox: str) -> str:
-    """Generates a query to retrieve amenity=toilets that are currently in OpenStreetMap within a custom bounding box"""
-
-    return f"""[out:xml][timeout:30][bbox:{bbox}];
-area["official_name"="City of Toronto"]->.toArea;
-(
-  nwr["amenity"="toilets"](area.toArea);
-  nwr["building"="toilets"](area.toArea);
-);
-(._;>;); 
-out meta;"""
+def parse_args(argv: list[str] | None = None):
+    parser = ArgumentParser(
+        description="Get, transform, and save City of Toronto washroom data for import into OpenStreetMap"
+    )
+    parser.add_argument(
+        "--offline",
+        action="store_true",
+        help="Replay cached responses from source_data/cache instead of using the network",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=DEFAULT_TTL,
+        help="Seconds before cached CKAN metadata and Overpass results are revalidated",
+    )
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=DEFAULT_MAX_BYTES / 1024 / 1024,
+        help="Size limit for source_data/cache; least recently used responses are evicted first",
+    )
+    parser.add_argument(
+        "--validation",
+        choices=["full", "sample"],
+        default="full",
+        help="Validate every row of source data and normalized output (full), or a random sample of rows for very large inputs (sample). Either way, validation is skipped for inputs that already passed (see source_data/cache/validation.json).",
+    )
+    parser.add_argument(
+        "--validation-sample-size",
+        type=int,
+        default=DEFAULT_SAMPLE_SIZE,
+        help="Number of rows validated per input when --validation is sample",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only re-normalize washrooms and rewrite changeset folders that changed since the previous run",
+    )
+    parser.add_argument(
+        "--geojson-format",
+        choices=list(EXTENSIONS),
+        default="pretty",
+        help="Write to_import GeoJSON indented (pretty), on one line (compact), or as newline-delimited GeoJSONSeq files (seq, saved as .geojsonl)",
+    )
+    parser.add_argument(
+        "--partition-by",
+        default="wards",
+        help='Organize open washrooms into changesets by "wards" (default), a "grid", or the areas in a boundary file (e.g. neighbourhoods) readable by geopandas',
+    )
+    parser.add_argument(
+        "--boundary-name-column",
+        help="Column with area names when --partition-by is a boundary file (required in that case)",
+    )
+    parser.add_argument(
+        "--grid-size",
+        type=float,
+        default=DEFAULT_CELL_SIZE,
+        help="Width in metres of grid cells when --partition-by is grid",
+    )
+    parser.add_argument(
+        "--max-changeset-size",
+        type=int,
+        help="Split changesets with more washrooms than this into balanced parts",
+    )
+    parser.add_argument(
+        "--profile",
+        nargs="+",
+        metavar="STAGE",
+        help='Profile these stages (or "all") with cProfile, saving stats to to_import/profiles/<stage>.prof',
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Measure memory with tracemalloc and list the largest allocation sites of each stage in the run report (slower)",
+    )
+    parser.add_argument(
+        "--compact-dtypes",
+        action="store_true",
+        help="Keep low-cardinality columns, constant tags, and partition names as categoricals in memory and in source_data/cache/stages, to save memory on large inputs (output files are unchanged)",
+    )
+    parser.add_argument(
+        "--watch",
+        nargs="?",
+        type=float,
+        const=DEFAULT_WATCH_INTERVAL,
+        metavar="SECONDS",
+        help=f"Keep running, and rebuild incrementally whenever the Park Washroom Facilities or Parks and Recreation Facilities data or OpenStreetMap changes, polling their metadata every SECONDS (default {DEFAULT_WATCH_INTERVAL})",
+    )
+    parser.add_argument(
+        "--max-polls",
+        type=int,
+        help="With --watch, stop after this many polls (e.g. for testing)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of threads used to run independent stages and save changeset folders. With 1, the peak memory of every stage is measured.",
+    )
+    args = parser.parse_args(argv)
+    if args.partition_by not in ["wards", "grid"] and args.boundary_name_column is None:
+        parser.error(
+            "--boundary-name-column is required when --partition-by is a boundary file"
+        )
+    return args
 
 
-def get_changeset_tags(
-    subset_name: str,
-    source_date: str,
-    wiki_link: str,
-) -> str:
-    """Generates changeset tags to use in JOSM"""
-
-    tags = {
-        "comment": f"Toronto Public Washroom Import, subset {subset_name}",
-        "import": "yes",
-        "source": "City of Toronto",
-        "source:url": "https://open.toronto.ca/dataset/washroom-facilities/",
-        "source:date": source_date,
-        "import:page": wiki_link,
-        "source:license": "Open Government License - Toronto",
-    }
-    return "\n".join([k + "\t" + v for k, v in tags.items()])
+def main(argv: list[str] | None = None):
+    args = parse_args(argv)
+    configure_cache(
+        offline=args.offline,
+        # when watching, a change was just seen, so cached responses are always revalidated
+        ttl=0 if args.watch is not None else args.cache_ttl,
+        max_bytes=int(args.cache_max_mb * 1024 * 1024),
+    )
+    configure_validation(mode=args.validation, sample_size=args.validation_sample_size)
+    options = dict(
+        incremental=args.incremental,
+        geojson_format=args.geojson_format,
+        workers=args.workers,
+        partition_by=args.partition_by,
+        boundary_name_column=args.boundary_name_column,
+        grid_size=args.grid_size,
+        max_changeset_size=args.max_changeset_size,
+        profile=args.profile,
+        trace_memory=args.trace_memory,
+        compact_dtypes=args.compact_dtypes,
+    )
+    if args.watch is None:
+        generate_imports(**options)
+    else:
+        watch_sources(args.watch, args.max_polls, **options)
 
 
 if __name__ == "__main__":
-    generate_imports()
+    main()
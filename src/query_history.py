@@ -0,0 +1,80 @@
+from argparse import ArgumentParser
+from contextlib import closing
+
+import pandas as pd
+
+from resources.history import (
+    HISTORY_PATH,
+    SEASONAL_PATTERN,
+    backfill,
+    connect,
+    get_first_last_seen,
+    get_seasonal_closures,
+    get_status_runs,
+)
+
+
+def parse_args():
+    parser = ArgumentParser(
+        description="Query the history of Park Washroom Facilities assets recorded by generate_imports"
+    )
+    parser.add_argument("--db", default=HISTORY_PATH, help="Path to the history store")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser(
+        "backfill",
+        help="Record the dated copies in source_data/<date>/ that are not in the history store yet",
+    )
+    timeline = subparsers.add_parser(
+        "timeline", help="Show the Status and Reason history of an asset"
+    )
+    timeline.add_argument("asset_id")
+    subparsers.add_parser("seen", help="Show when each asset was first and last seen")
+    current = subparsers.add_parser(
+        "current", help="Show how long assets have had their current Status"
+    )
+    current.add_argument("--status", help="Only show assets with this Status, e.g. 0")
+    seasonal = subparsers.add_parser(
+        "seasonal",
+        help="Show closures with a seasonal Reason, by the month they were first seen",
+    )
+    seasonal.add_argument(
+        "--pattern",
+        default=SEASONAL_PATTERN,
+        help="Text to look for in Reason (case insensitive)",
+    )
+    return parser.parse_args()
+
+
+def query_history():
+    args = parse_args()
+    with closing(connect(args.db)) as con:
+        if args.command == "backfill":
+            print(f"{backfill(con)} snapshots added")
+        elif args.command == "timeline":
+            print(get_status_runs(con, asset_id=args.asset_id).to_string(index=False))
+        elif args.command == "seen":
+            print(get_first_last_seen(con).to_string(index=False))
+        elif args.command == "current":
+            runs = get_status_runs(con)
+            runs = runs[runs["current"]]
+            if args.status is not None:
+                runs = runs[runs["status"] == args.status]
+            print(
+                runs.assign(
+                    days=(
+                        pd.to_datetime(runs["last_seen"], format="ISO8601")
+                        - pd.to_datetime(runs["first_seen"], format="ISO8601")
+                    ).dt.days
+                )
+                .drop(columns=["current"])
+                .to_string(index=False)
+            )
+        elif args.command == "seasonal":
+            closures = get_seasonal_closures(con, pattern=args.pattern)
+            print(closures.to_string(index=False))
+            print("\nAssets closed by month first seen:")
+            print(closures.groupby("month")["asset_id"].nunique().to_string())
+
+
+if __name__ == "__main__":
+    query_history()
@@ -0,0 +1,94 @@
+import os
+import threading
+import time
+from typing import Callable, TypedDict
+
+import geopandas as gpd
+import pandas as pd
+
+import resources.partitioning
+from resources.cache import HTTPCache, get_cache
+from resources.incremental import code_version
+from resources.partitioning import BoundaryIndex, get_boundaries
+from resources.torontoopendata import request_tod_gdf, request_tod_metadata
+
+BOUNDARIES_DIR = "source_data/cache/boundaries"
+# seconds before open.toronto.ca is checked for new boundaries, which change about once per election cycle
+DEFAULT_MAX_AGE = 7 * 24 * 60 * 60
+
+
+class StoredBoundaries(TypedDict):
+    version: str
+    code: str
+    checked_at: float
+    gdf: gpd.GeoDataFrame
+    index: BoundaryIndex
+
+
+# boundaries already loaded by this process, with the modification time of their file
+_loaded: dict[str, tuple[int, StoredBoundaries]] = {}
+
+
+def load_stored_boundaries(name: str) -> StoredBoundaries | None:
+    """Loads a stored boundary layer, reusing the copy in memory if its file has not changed since (e.g. between runs of a long-running process)"""
+    path = os.path.join(BOUNDARIES_DIR, f"{name}.pkl")
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    if name in _loaded and _loaded[name][0] == mtime:
+        return _loaded[name][1]
+    stored = pd.read_pickle(path)
+    _loaded[name] = (mtime, stored)
+    return stored
+
+
+def save_stored_boundaries(name: str, stored: StoredBoundaries):
+    os.makedirs(BOUNDARIES_DIR, exist_ok=True)
+    path = os.path.join(BOUNDARIES_DIR, f"{name}.pkl")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pd.to_pickle(stored, tmp_path)
+    os.replace(tmp_path, path)
+    _loaded[name] = (os.stat(path).st_mtime_ns, stored)
+
+
+def get_stored_boundaries(
+    name: str,
+    dataset_name: str,
+    resource_id: str,
+    format: Callable[[gpd.GeoDataFrame], gpd.GeoDataFrame],
+    name_column: str,
+    max_age: float = DEFAULT_MAX_AGE,
+    cache: HTTPCache | None = None,
+    timeout: float | None = None,
+) -> StoredBoundaries:
+    """Returns a boundary layer from open.toronto.ca, formatted by the given function, together with a BoundaryIndex of its areas (named from name_column) for assign_partitions.
+
+    Both are persisted under source_data/cache/boundaries/<name>.pkl, keyed by the resource's last_modified value and by code, a hash of the format function, the partitioning module, and name_column. The stored layer is used without any network access if it was checked within max_age seconds (or in offline mode); otherwise it is only downloaded and indexed again if the resource's last_modified value has changed. If the code has changed, the layer is always formatted and indexed again (from the HTTP cache if the resource has not changed).
+    """
+
+    cache = cache or get_cache()
+    code = f"{code_version(format, resources.partitioning)}:{name_column}"
+    stored = load_stored_boundaries(name)
+    if stored is not None and stored.get("code") != code:
+        stored = None
+    if stored is not None and (
+        cache.offline or time.time() - stored["checked_at"] < max_age
+    ):
+        return stored
+
+    metadata = request_tod_metadata(dataset_name, resource_id, cache, timeout)
+    if stored is None or stored["version"] != metadata["last_modified"]:
+        response = request_tod_gdf(dataset_name, resource_id, cache, timeout)
+        gdf = format(response["gdf"])
+        stored = {
+            "version": response["metadata"]["last_modified"],
+            "code": code,
+            "checked_at": time.time(),
+            "gdf": gdf,
+            "index": BoundaryIndex(get_boundaries(gdf, name_column)),
+        }
+    else:
+        stored["checked_at"] = time.time()
+    save_stored_boundaries(name, stored)
+    return stored
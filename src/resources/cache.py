@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import TypedDict
+
+import requests
+
+from resources.fetch import create_session
+
+CACHE_DIR = "source_data/cache"
+DEFAULT_TTL = 60 * 60  # seconds
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class CacheMissError(LookupError):
+    """Raised in offline mode when a response has not been cached yet"""
+
+
+class CacheEntry(TypedDict):
+    sha256: str
+    size: int
+    url: str
+    etag: str | None
+    last_modified: str | None
+    version: str | None
+    fetched_at: float
+    accessed_at: float
+
+
+def cache_key(*parts: str) -> str:
+    """Builds a stable cache key from identifying parts, e.g. a dataset name and resource id or the text of a query"""
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class HTTPCache:
+    """Content-addressed on-disk cache for HTTP responses.
+
+    Responses are stored once per distinct body under blobs/ and referenced from index.json by key. An entry is reused without any network access if it is younger than the TTL or if the caller supplies a version (e.g. a CKAN last_modified value) that matches the cached one; otherwise it is revalidated with If-None-Match / If-Modified-Since. In offline mode only cached bytes are replayed.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = CACHE_DIR,
+        ttl: float = DEFAULT_TTL,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        offline: bool = False,
+        session: requests.Session | None = None,
+    ):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.session = session or create_session()
+        self._index_path = os.path.join(cache_dir, "index.json")
+        self._lock = threading.RLock()
+        self._index: dict[str, CacheEntry] = self._load_index()
+
+    def _load_index(self) -> dict[str, CacheEntry]:
+        try:
+            with open(self._index_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self._index_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._index, f, indent=2)
+        os.replace(tmp_path, self._index_path)
+
+    def _blob_path(self, sha256: str) -> str:
+        return os.path.join(self.cache_dir, "blobs", sha256[:2], sha256)
+
+    def lookup(self, key: str) -> CacheEntry | None:
+        """Returns the index entry for a key if its content is still on disk"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None or not os.path.exists(self._blob_path(entry["sha256"])):
+                return None
+            return entry
+
+    def is_fresh(self, key: str, ttl: float | None = None) -> bool:
+        """Whether a cached entry can be used without contacting the server"""
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        if self.offline:
+            return True
+        ttl = self.ttl if ttl is None else ttl
+        return time.time() - entry["fetched_at"] < ttl
+
+    def read(self, key: str) -> bytes:
+        """Replays the cached body for a key"""
+        with self._lock:
+            entry = self.lookup(key)
+            if entry is None:
+                raise CacheMissError(f"No cached response for key {key}")
+            with open(self._blob_path(entry["sha256"]), "rb") as f:
+                content = f.read()
+            entry["accessed_at"] = time.time()
+            self._save_index()
+        return content
+
+    def set_version(self, key: str, version: str | None):
+        """Records the upstream version (e.g. Overpass timestamp_osm_base) of a cached response"""
+        with self._lock:
+            if key in self._index:
+                self._index[key]["version"] = version
+                self._save_index()
+
+    def store(
+        self,
+        key: str,
+        content: bytes,
+        url: str,
+        etag: str | None = None,
+        last_modified: str | None = None,
+        version: str | None = None,
+    ):
+        """Adds a response body to the cache and evicts old entries if the size limit is exceeded"""
+        sha256 = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(sha256)
+        with self._lock:
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                tmp_path = f"{blob_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(content)
+                os.replace(tmp_path, blob_path)
+            now = time.time()
+            previous = self._index.get(key)
+            self._index[key] = {
+                "sha256": sha256,
+                "size": len(content),
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "version": version,
+                "fetched_at": now,
+                "accessed_at": now,
+            }
+            # a changed response replaces the previous body, which is otherwise never counted again
+            if previous is not None and previous["sha256"] != sha256:
+                self._remove_unused_blob(previous["sha256"])
+            self._evict(keep=key)
+            self._save_index()
+
+    def _evict(self, keep: str):
+        """Drops least recently accessed entries until the unique blobs fit within max_bytes"""
+        blob_sizes = {e["sha256"]: e["size"] for e in self._index.values()}
+        total = sum(blob_sizes.values())
+        by_access = sorted(self._index.items(), key=lambda kv: kv[1]["accessed_at"])
+        for key, entry in by_access:
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            del self._index[key]
+            if self._remove_unused_blob(entry["sha256"]):
+                total -= blob_sizes[entry["sha256"]]
+
+    def _remove_unused_blob(self, sha256: str) -> bool:
+        """Deletes a blob if no index entry refers to it. Returns whether it was unused."""
+        if any(e["sha256"] == sha256 for e in self._index.values()):
+            return False
+        try:
+            os.remove(self._blob_path(sha256))
+        except FileNotFoundError:
+            pass
+        return True
+
+    def fetch(
+        self,
+        key: str,
+        method: str,
+        url: str,
+        params: dict | None = None,
+        data: str | None = None,
+        version: str | None = None,
+        ttl: float | None = None,
+        timeout: float | None = None,
+    ) -> bytes:
+        """Returns the response body for a request, using the cache where possible.
+
+        If version is given, a cached entry with the same version is always reused; otherwise the TTL decides whether the entry needs revalidation.
+        """
+        entry = self.lookup(key)
+        if entry is not None and (
+            self.offline or (version is None and self.is_fresh(key, ttl))
+        ):
+            return self.read(key)
+        if entry is not None and version is not None and entry["version"] == version:
+            with self._lock:
+                entry["fetched_at"] = time.time()
+            return self.read(key)
+        if self.offline:
+            raise CacheMissError(
+                f"Offline mode: no cached response for {method} {url} (key {key})"
+            )
+
+        headers = {}
+        if entry is not None:
+            if entry["etag"]:
+                headers["If-None-Match"] = entry["etag"]
+            if entry["last_modified"]:
+                headers["If-Modified-Since"] = entry["last_modified"]
+        response = self.session.request(
+            method, url, params=params, data=data, headers=headers, timeout=timeout
+        )
+        if response.status_code == 304 and entry is not None:
+            with self._lock:
+                entry["fetched_at"] = time.time()
+                if version is not None:
+                    entry["version"] = version
+                self._save_index()
+            return self.read(key)
+        response.raise_for_status()
+        self.store(
+            key,
+            response.content,
+            url=response.url,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+            version=version,
+        )
+        return response.content
+
+
+_default_cache: HTTPCache | None = None
+
+
+def get_cache() -> HTTPCache:
+    """Returns the shared cache used by the request functions, creating it with default settings if needed"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = HTTPCache()
+    return _default_cache
+
+
+def configure_cache(**kwargs) -> HTTPCache:
+    """Replaces the shared cache, e.g. configure_cache(offline=True)"""
+    global _default_cache
+    _default_cache = HTTPCache(**kwargs)
+    return _default_cache
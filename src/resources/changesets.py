@@ -0,0 +1,35 @@
+PROPOSAL_WIKI_LINK = (
+    "https://wiki.openstreetmap.org/wiki/Import/Toronto_Public_Washroom_Import"
+)
+
+
+def get_washrooms_query(bbox: str) -> str:
+    """Generates a query to retrieve amenity=toilets that are currently in OpenStreetMap within a custom bounding box"""
+
+    return f"""[out:xml][timeout:30][bbox:{bbox}];
+area["official_name"="City of Toronto"]->.toArea;
+(
+  nwr["amenity"="toilets"](area.toArea);
+  nwr["building"="toilets"](area.toArea);
+);
+(._;>;); 
+out meta;"""
+
+
+def get_changeset_tags(
+    subset_name: str,
+    source_date: str,
+    wiki_link: str,
+) -> str:
+    """Generates changeset tags to use in JOSM"""
+
+    tags = {
+        "comment": f"Toronto Public Washroom Import, subset {subset_name}",
+        "import": "yes",
+        "source": "City of Toronto",
+        "source:url": "https://open.toronto.ca/dataset/washroom-facilities/",
+        "source:date": source_date,
+        "import:page": wiki_link,
+        "source:license": "Open Government License - Toronto",
+    }
+    return "\n".join([k + "\t" + v for k, v in tags.items()])
@@ -0,0 +1,218 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+# NAD83(CSRS) / MTM zone 10, used by the City of Toronto for distances in metres
+PROJECTED_CRS = "EPSG:2952"
+REF_TAG = "ref:open.toronto.ca:washroom-facilities:asset_id"
+MATCH_DISTANCE = 50  # metres
+AMBIGUITY_MARGIN = 0.1  # candidates scoring within this of the best are ambiguous
+DISTANCE_WEIGHT = 0.6
+TAG_WEIGHT = 0.4
+COMPARE_TAGS = [
+    "amenity",
+    "access",
+    "fee",
+    "operator",
+    "male",
+    "female",
+    "toilets:disposal",
+    "toilets:handwashing",
+    "changing_table",
+    "changing_table:adult",
+    "wheelchair",
+    "toilets:wheelchair",
+    "opening_hours",
+]
+# tags for mappers reviewing the import (e.g. survey prompts), never added to elements already in OpenStreetMap
+REVIEW_TAGS = ["note"]
+MATCH_COLUMNS = [
+    "DELETE_match_status",
+    "DELETE_match_osm",
+    "DELETE_match_url",
+    "DELETE_match_distance_m",
+    "DELETE_match_score",
+    "DELETE_match_candidates",
+    "DELETE_match_conflicts",
+]
+
+
+def get_values(gdf: gpd.GeoDataFrame, columns: list[str]) -> np.ndarray:
+    """Returns the given columns as an object array with missing values as None, so that they can be compared elementwise"""
+    values = gdf.reindex(columns=columns).astype(object)
+    return values.where(values.notna(), None).to_numpy(dtype=object)
+
+
+def get_candidate_pairs(
+    import_geoms: np.ndarray,
+    osm_gdf: gpd.GeoDataFrame,
+    import_refs: np.ndarray,
+    max_distance: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Finds (import, osm) positional index pairs that are within max_distance of each other or share the same asset_id ref"""
+
+    near_import, near_osm = osm_gdf.sindex.query(
+        import_geoms, predicate="dwithin", distance=max_distance
+    )
+    ref_pairs = pd.merge(
+        pd.DataFrame({"ref": import_refs, "import_pos": np.arange(len(import_refs))}),
+        pd.DataFrame(
+            {
+                "ref": get_values(osm_gdf, [REF_TAG])[:, 0],
+                "osm_pos": np.arange(len(osm_gdf)),
+            }
+        ).dropna(),
+        on="ref",
+    )
+    pairs = np.unique(
+        np.concatenate(
+            [
+                np.stack([near_import, near_osm], axis=1),
+                ref_pairs[["import_pos", "osm_pos"]].to_numpy(dtype=np.int64),
+            ]
+        ),
+        axis=0,
+    )
+    return pairs[:, 0], pairs[:, 1]
+
+
+def score_pairs(
+    import_gdf: gpd.GeoDataFrame,
+    osm_gdf: gpd.GeoDataFrame,
+    import_pos: np.ndarray,
+    osm_pos: np.ndarray,
+    distances: np.ndarray,
+    max_distance: float,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Scores candidate pairs from 0 to 1 by distance and tag similarity. Pairs that share an asset_id ref score 2 so they always win; pairs where the OSM element is already linked to a different asset_id score -1."""
+
+    distance_score = np.clip(1 - distances / max_distance, 0, 1)
+
+    tags = [t for t in COMPARE_TAGS if t in import_gdf.columns]
+    import_tags = get_values(import_gdf, tags)[import_pos]
+    osm_tags = get_values(osm_gdf, tags)[osm_pos]
+    import_present = import_tags != None
+    same = import_present & (import_tags == osm_tags)
+    tag_score = same.sum(axis=1) / np.maximum(import_present.sum(axis=1), 1)
+
+    import_refs = get_values(import_gdf, [REF_TAG])[import_pos, 0]
+    osm_refs = get_values(osm_gdf, [REF_TAG])[osm_pos, 0]
+    ref_match = (osm_refs != None) & (import_refs == osm_refs)
+    ref_conflict = (osm_refs != None) & ~ref_match
+
+    score = DISTANCE_WEIGHT * distance_score + TAG_WEIGHT * tag_score
+    score = np.where(ref_match, 2.0, np.where(ref_conflict, -1.0, score))
+    return score, ref_match
+
+
+def get_conflicts(
+    import_gdf: gpd.GeoDataFrame, osm_gdf: gpd.GeoDataFrame, osm_pos: np.ndarray
+) -> np.ndarray:
+    """Lists the tags of each import feature whose value differs from the one already on its matched OpenStreetMap element (at osm_pos, or -1 for none), as "key: osm value (city: import value)" separated by "; ", or None if there are no conflicts. DELETE_ columns and REVIEW_TAGS are not compared."""
+
+    tags = [
+        c
+        for c in import_gdf.columns
+        if c in osm_gdf.columns
+        and c != import_gdf.geometry.name
+        and not c.startswith("DELETE_")
+        and c not in REVIEW_TAGS
+    ]
+    matched = osm_pos >= 0
+    import_tags = get_values(import_gdf, tags)[matched]
+    osm_tags = get_values(osm_gdf, tags)[osm_pos[matched]]
+    conflicts = np.full(len(import_gdf), None, dtype=object)
+    for row, import_values, osm_values in zip(
+        np.flatnonzero(matched), import_tags, osm_tags
+    ):
+        differing = [
+            f"{k}: {b} (city: {a})"
+            for k, a, b in zip(tags, import_values, osm_values)
+            if a is not None and b is not None and str(a) != str(b)
+        ]
+        if differing:
+            conflicts[row] = "; ".join(differing)
+    return conflicts
+
+
+def conflate(
+    import_gdf: gpd.GeoDataFrame,
+    osm_gdf: gpd.GeoDataFrame,
+    max_distance: float = MATCH_DISTANCE,
+) -> gpd.GeoDataFrame:
+    """Matches normalized city washrooms to amenity=toilets / building=toilets elements already in OpenStreetMap (as returned by get_current_washrooms_gdf).
+
+    Adds DELETE_match_* columns labelling each feature as "new", "matched_node", "matched_way", or "ambiguous", along with the matched element, its distance in metres, the match score, and the tags whose values conflict with those already on a matched element (see get_conflicts), which the import keeps as they are in OpenStreetMap.
+    """
+
+    import_proj = import_gdf.geometry.to_crs(PROJECTED_CRS).to_numpy()
+    osm_proj = osm_gdf.set_geometry(osm_gdf.geometry.to_crs(PROJECTED_CRS))
+    import_refs = get_values(import_gdf, [REF_TAG])[:, 0]
+    osm_proj = osm_proj.reindex(
+        columns=osm_proj.columns.union([REF_TAG], sort=False)
+    ).reset_index(drop=True)
+
+    import_pos, osm_pos = get_candidate_pairs(
+        import_proj, osm_proj, import_refs, max_distance
+    )
+    distances = shapely.distance(
+        import_proj[import_pos], osm_proj.geometry.to_numpy()[osm_pos]
+    )
+    score, ref_match = score_pairs(
+        import_gdf, osm_proj, import_pos, osm_pos, distances, max_distance
+    )
+    candidates = pd.DataFrame(
+        {
+            "import_pos": import_pos,
+            "osm_pos": osm_pos,
+            "distance": distances,
+            "score": score,
+            "ref_match": ref_match,
+        }
+    )
+    candidates = candidates[candidates["score"] > 0].sort_values(
+        ["import_pos", "score", "distance"], ascending=[True, False, True]
+    )
+
+    # best candidate per import feature, and whether a runner-up is too close to call
+    group = candidates.groupby("import_pos", sort=False)
+    candidates["rank"] = group.cumcount()
+    candidates["count"] = group["score"].transform("size")
+    candidates["runner_up"] = group["score"].shift(-1)
+    best = candidates[candidates["rank"] == 0].copy()
+    best["ambiguous"] = ~best["ref_match"] & (
+        best["score"] - best["runner_up"] < AMBIGUITY_MARGIN
+    )
+
+    # an OSM element can only be matched to one import feature
+    best = best.sort_values(["osm_pos", "score"], ascending=[True, False])
+    best["ambiguous"] |= best.duplicated("osm_pos", keep="first")
+
+    osm_type = osm_proj["_type"].to_numpy(dtype=object)[best["osm_pos"]]
+    osm_id = osm_proj["_id"].astype(str).to_numpy(dtype=object)[best["osm_pos"]]
+    best["status"] = np.where(
+        best["ambiguous"],
+        "ambiguous",
+        np.where(osm_type == "node", "matched_node", "matched_way"),
+    )
+    best["osm"] = osm_type + "/" + osm_id
+    best["url"] = osm_proj["_url_nwr"].to_numpy(dtype=object)[best["osm_pos"]]
+    best = best.set_index("import_pos").reindex(np.arange(len(import_gdf)))
+    matched_pos = np.where(
+        best["status"].isin(["matched_node", "matched_way"]),
+        best["osm_pos"].fillna(-1),
+        -1,
+    ).astype(np.int64)
+
+    return import_gdf.assign(
+        **{
+            "DELETE_match_status": best["status"].fillna("new").to_numpy(),
+            "DELETE_match_osm": best["osm"].to_numpy(),
+            "DELETE_match_url": best["url"].to_numpy(),
+            "DELETE_match_distance_m": best["distance"].round(1).to_numpy(),
+            "DELETE_match_score": best["score"].round(3).to_numpy(),
+            "DELETE_match_candidates": best["count"].fillna(0).astype(int).to_numpy(),
+            "DELETE_match_conflicts": get_conflicts(import_gdf, osm_proj, matched_pos),
+        }
+    )
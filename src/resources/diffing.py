@@ -0,0 +1,117 @@
+from typing import TypedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from resources.conflation import PROJECTED_CRS
+
+MOVE_TOLERANCE = 1.0  # metres
+
+
+class DiffResult(TypedDict):
+    added: gpd.GeoDataFrame
+    removed: gpd.GeoDataFrame
+    changed: pd.DataFrame
+    moved: pd.DataFrame
+
+
+def hash_attributes(df: pd.DataFrame) -> np.ndarray:
+    """Hashes each row's attribute values, so that unchanged rows can be found without comparing every value"""
+    return pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy()
+
+
+def hash_geometries(gs: gpd.GeoSeries) -> np.ndarray:
+    """Hashes each geometry by its WKB representation"""
+    return pd.util.hash_pandas_object(
+        pd.Series(shapely.to_wkb(gs.to_numpy())), index=False
+    ).to_numpy()
+
+
+def get_changed_values(old: pd.DataFrame, new: pd.DataFrame) -> pd.DataFrame:
+    """Compares two aligned frames value by value and returns every difference as a row of (key, column, old, new)"""
+    old_values = old.astype(object)
+    new_values = new.astype(object)
+    different = ~(
+        (old_values == new_values).fillna(False) | (old.isna() & new.isna())
+    ).to_numpy(dtype=bool)
+    rows, cols = np.nonzero(different)
+    return pd.DataFrame(
+        {
+            old.index.name: old.index.to_numpy()[rows],
+            "column": old.columns.to_numpy()[cols],
+            "old": old_values.to_numpy()[rows, cols],
+            "new": new_values.to_numpy()[rows, cols],
+        }
+    )
+
+
+def get_moves(old: gpd.GeoSeries, new: gpd.GeoSeries) -> np.ndarray:
+    """Returns the distance in metres between the centroids of aligned geometries"""
+    old_points = shapely.centroid(old.to_crs(PROJECTED_CRS).to_numpy())
+    new_points = shapely.centroid(new.to_crs(PROJECTED_CRS).to_numpy())
+    return shapely.distance(old_points, new_points)
+
+
+def diff_snapshots(
+    old: gpd.GeoDataFrame,
+    new: gpd.GeoDataFrame,
+    tolerance: float = MOVE_TOLERANCE,
+) -> DiffResult:
+    """Compares two snapshots indexed by asset_id. Rows are first compared by a hash of their attributes and geometry, and only rows whose hashes differ are compared value by value.
+
+    Returns the added and removed rows, the changed attribute values (one row per asset_id and column), and geometries that moved by more than tolerance metres.
+    """
+
+    old = old[~old.index.duplicated()]
+    new = new[~new.index.duplicated()]
+    common = old.index.intersection(new.index).sort_values()
+    columns = old.columns.intersection(new.columns).drop(
+        [old.geometry.name], errors="ignore"
+    )
+    old_common = old.loc[common]
+    new_common = new.loc[common]
+
+    attributes_changed = hash_attributes(old_common[columns]) != hash_attributes(
+        new_common[columns]
+    )
+    changed = get_changed_values(
+        old_common.loc[attributes_changed, columns],
+        new_common.loc[attributes_changed, columns],
+    )
+
+    geometry_changed = hash_geometries(old_common.geometry) != hash_geometries(
+        new_common.geometry
+    )
+    distances = get_moves(
+        old_common.geometry[geometry_changed], new_common.geometry[geometry_changed]
+    )
+    moved = pd.DataFrame(
+        {
+            old.index.name: common[geometry_changed],
+            "distance_m": distances.round(1),
+        }
+    )
+    moved = moved[moved["distance_m"] > tolerance].reset_index(drop=True)
+
+    return {
+        "added": new[~new.index.isin(old.index)],
+        "removed": old[~old.index.isin(new.index)],
+        "changed": changed,
+        "moved": moved,
+    }
+
+
+def get_diff_records(diff: DiffResult) -> pd.DataFrame:
+    """Flattens a diff into one row per change (added, removed, changed, or moved), e.g. for saving as CSV or JSON"""
+    key = diff["changed"].columns[0]
+    return pd.concat(
+        [
+            pd.DataFrame({"change": "added", key: diff["added"].index.to_numpy()}),
+            pd.DataFrame({"change": "removed", key: diff["removed"].index.to_numpy()}),
+            diff["changed"].assign(change="changed"),
+            diff["moved"].assign(change="moved"),
+        ],
+        ignore_index=True,
+    ).reindex(columns=["change", key, "column", "old", "new", "distance_m"])
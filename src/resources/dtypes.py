@@ -0,0 +1,36 @@
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+
+def compact_columns(df: pd.DataFrame, columns: Iterable[str]) -> pd.DataFrame:
+    """Converts the given columns (those present in df) to categoricals, so that each distinct value is stored once and rows only hold small integer codes. Categories keep the column's original dtype, so expand_categoricals restores it exactly."""
+    present = [x for x in columns if x in df.columns]
+    return df.astype({x: "category" for x in present}) if present else df
+
+
+def constant_columns(values: dict[str, str], index: pd.Index) -> dict[str, pd.Series]:
+    """Returns a single-category column for each constant value, for use with DataFrame.assign in place of broadcasting the value to every row"""
+    codes = np.zeros(len(index), dtype=np.int8)
+    return {
+        name: pd.Series(
+            pd.Categorical.from_codes(codes, categories=[value]), index=index
+        )
+        for name, value in values.items()
+    }
+
+
+def expand_categoricals(df: pd.DataFrame) -> pd.DataFrame:
+    """Converts categorical columns back to the dtype of their categories (e.g. "string" or object), so that they validate and hash like the uncompacted columns"""
+    categorical = {
+        name: column.cat.categories.dtype
+        for name, column in df.items()
+        if isinstance(column.dtype, pd.CategoricalDtype)
+    }
+    return df.astype(categorical) if categorical else df
+
+
+def as_text(s: pd.Series) -> pd.Series:
+    """Converts string-like values (including categoricals) to Python strings, with missing values as "<NA>" as for the "string" dtype"""
+    return s.astype("string").astype(str)
@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, TypeVar
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+T = TypeVar("T")
+
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 1.0  # seconds, doubled on each retry
+DEFAULT_POOL_SIZE = 10
+
+
+def create_session(
+    retries: int = DEFAULT_RETRIES,
+    backoff_factor: float = DEFAULT_BACKOFF,
+    pool_size: int = DEFAULT_POOL_SIZE,
+) -> requests.Session:
+    """Creates a pooled HTTP session that retries connection errors, timeouts, and server errors with exponential backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=None,  # Overpass queries are POSTs but are safe to repeat
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def run_concurrently(
+    tasks: dict[str, Callable[[], T]], max_workers: int | None = None
+) -> tuple[dict[str, T], dict[str, float]]:
+    """Runs independent tasks in a thread pool and returns their results and wall clock latencies in seconds, both keyed by task name. Raises the first error encountered, in task order."""
+
+    def timed(task: Callable[[], T]) -> tuple[T, float]:
+        start = time.perf_counter()
+        result = task()
+        return result, time.perf_counter() - start
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(tasks) or 1) as executor:
+        futures = {name: executor.submit(timed, task) for name, task in tasks.items()}
+        outcomes = {name: future.result() for name, future in futures.items()}
+    results = {name: outcome[0] for name, outcome in outcomes.items()}
+    latencies = {name: outcome[1] for name, outcome in outcomes.items()}
+    return results, latencies
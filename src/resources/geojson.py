@@ -0,0 +1,94 @@
+import filecmp
+import json
+import os
+import threading
+import warnings
+from typing import Literal, TextIO
+
+import geopandas as gpd
+
+GeoJSONFormat = Literal["pretty", "compact", "seq"]
+EXTENSIONS: dict[GeoJSONFormat, str] = {
+    "pretty": ".geojson",
+    "compact": ".geojson",
+    "seq": ".geojsonl",
+}
+
+
+def get_crs_member(gdf: gpd.GeoDataFrame) -> dict | None:
+    """Returns the "crs" member that GeoDataFrame.to_json would add for data that is not in WGS84, or None"""
+    if gdf.crs is None or gdf.crs.equals("epsg:4326"):
+        return None
+    auth_crsdef = gdf.crs.to_authority()
+    if auth_crsdef is None or auth_crsdef[0] not in [
+        "EDCS",
+        "EPSG",
+        "OGC",
+        "SI",
+        "UCUM",
+    ]:
+        warnings.warn(
+            "GeoDataFrame's CRS is not representable in URN OGC format. Resulting JSON will contain no CRS information.",
+            stacklevel=3,
+        )
+        return None
+    authority, code = auth_crsdef
+    return {
+        "type": "name",
+        "properties": {"name": f"urn:ogc:def:crs:{authority}::{code}"},
+    }
+
+
+def write_geojson(gdf: gpd.GeoDataFrame, f: TextIO, fmt: GeoJSONFormat = "pretty"):
+    """Writes a GeoDataFrame to an open text file one feature at a time, with missing properties dropped and no feature ids.
+
+    "pretty" output is byte-identical to gdf.to_json(na="drop", drop_id=True, indent=2) and "compact" output to gdf.to_json(na="drop", drop_id=True). "seq" writes newline-delimited GeoJSON (GeoJSONSeq), with one feature per line and no FeatureCollection wrapper.
+    """
+
+    features = gdf.iterfeatures(na="drop", drop_id=True)
+    if fmt == "seq":
+        for feature in features:
+            f.write(json.dumps(feature))
+            f.write("\n")
+        return
+
+    crs = get_crs_member(gdf)
+    if fmt == "compact":
+        f.write('{"type": "FeatureCollection", "features": [')
+        for i, feature in enumerate(features):
+            if i > 0:
+                f.write(", ")
+            f.write(json.dumps(feature))
+        f.write("]")
+        if crs is not None:
+            f.write(f', "crs": {json.dumps(crs)}')
+        f.write("}")
+        return
+
+    f.write('{\n  "type": "FeatureCollection",\n  "features": [')
+    empty = True
+    for feature in features:
+        f.write("\n    " if empty else ",\n    ")
+        f.write(json.dumps(feature, indent=2).replace("\n", "\n    "))
+        empty = False
+    f.write("]" if empty else "\n  ]")
+    if crs is not None:
+        f.write(',\n  "crs": ' + json.dumps(crs, indent=2).replace("\n", "\n  "))
+    f.write("\n}")
+
+
+def save_geojson(
+    path: str, gdf: gpd.GeoDataFrame, fmt: GeoJSONFormat = "pretty"
+) -> bool:
+    """Streams a GeoDataFrame to a temporary file next to path, then replaces path only if the content changed, so unchanged files keep their modification times. Returns whether the file was written."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            write_geojson(gdf, f, fmt)
+        if os.path.exists(path) and filecmp.cmp(tmp_path, path, shallow=False):
+            return False
+        os.replace(tmp_path, path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,339 @@
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+HISTORY_PATH = "source_data/history.sqlite"
+# CKAN datastore row numbers change on every refresh, so they are not part of an asset's history
+IGNORED_COLUMNS = ["_id"]
+DATE_FORMAT = "%Y-%m-%dT%H:%M:%S.%f%z"
+SEASONAL_PATTERN = "season"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    snapshot_id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    taken_at TEXT NOT NULL,
+    UNIQUE (dataset, taken_at)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    version_id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    row_hash TEXT NOT NULL,
+    status TEXT,
+    reason TEXT,
+    properties TEXT NOT NULL,
+    geometry BLOB,
+    UNIQUE (dataset, asset_id, row_hash)
+);
+CREATE TABLE IF NOT EXISTS intervals (
+    dataset TEXT NOT NULL,
+    asset_id TEXT NOT NULL,
+    version_id INTEGER NOT NULL REFERENCES versions,
+    first_snapshot INTEGER NOT NULL REFERENCES snapshots,
+    last_snapshot INTEGER NOT NULL REFERENCES snapshots
+);
+CREATE INDEX IF NOT EXISTS intervals_asset ON intervals (dataset, asset_id);
+CREATE INDEX IF NOT EXISTS intervals_last ON intervals (dataset, last_snapshot);
+"""
+
+INTERVALS_QUERY = """
+SELECT i.asset_id, v.status, v.reason, i.first_snapshot, i.last_snapshot,
+    f.taken_at AS first_seen, l.taken_at AS last_seen
+FROM intervals i
+JOIN versions v USING (version_id)
+JOIN snapshots f ON f.snapshot_id = i.first_snapshot
+JOIN snapshots l ON l.snapshot_id = i.last_snapshot
+WHERE i.dataset = :dataset AND (:asset_id IS NULL OR i.asset_id = :asset_id)
+ORDER BY i.asset_id, i.first_snapshot
+"""
+
+
+def connect(path: str = HISTORY_PATH) -> sqlite3.Connection:
+    """Opens the history store, creating its tables if needed"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    con = sqlite3.connect(path)
+    con.executescript(SCHEMA)
+    return con
+
+
+def get_row_versions(gdf: gpd.GeoDataFrame, key: str) -> pd.DataFrame:
+    """Serializes each row's attributes (as sorted JSON, with missing values dropped) and geometry (as WKB), with a hash of both to identify unchanged rows"""
+
+    attributes = gdf.drop(
+        columns=[key, gdf.geometry.name, *IGNORED_COLUMNS], errors="ignore"
+    )
+    attributes = attributes.assign(
+        **{
+            c: attributes[c].dt.strftime(DATE_FORMAT)
+            for c in attributes.select_dtypes(["datetime", "datetimetz"]).columns
+        }
+    ).astype(object)
+    properties = [
+        json.dumps(
+            {k: v for k, v in row.items() if not pd.isna(v)},
+            sort_keys=True,
+            default=str,
+        )
+        for row in attributes.to_dict("records")
+    ]
+    geometry = shapely.to_wkb(gdf.geometry.to_numpy())
+    return pd.DataFrame(
+        {
+            "asset_id": gdf[key].astype(str).to_numpy(),
+            "row_hash": [
+                hashlib.sha256(p.encode("utf-8") + (g or b"")).hexdigest()
+                for p, g in zip(properties, geometry)
+            ],
+            "status": (
+                gdf["Status"].astype("string").to_numpy(dtype=object)
+                if "Status" in gdf
+                else None
+            ),
+            "reason": (
+                gdf["Reason"].astype("string").to_numpy(dtype=object)
+                if "Reason" in gdf
+                else None
+            ),
+            "properties": properties,
+            "geometry": geometry,
+        }
+    ).replace({pd.NA: None})
+
+
+def store_versions(
+    con: sqlite3.Connection, gdf: gpd.GeoDataFrame, dataset: str, key: str
+) -> pd.DataFrame:
+    """Adds any new row versions in gdf to the history store and returns the version_id of each asset's row"""
+    rows = get_row_versions(gdf[~gdf[key].duplicated()], key)
+    con.executemany(
+        "INSERT OR IGNORE INTO versions (dataset, asset_id, row_hash, status, reason, properties, geometry) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(dataset, *x) for x in rows.itertuples(index=False)],
+    )
+    version_ids = pd.read_sql_query(
+        "SELECT asset_id, row_hash, version_id FROM versions WHERE dataset = ?",
+        con,
+        params=(dataset,),
+    )
+    return rows[["asset_id", "row_hash"]].merge(
+        version_ids, on=["asset_id", "row_hash"]
+    )[["asset_id", "version_id"]]
+
+
+def record_snapshot(
+    con: sqlite3.Connection,
+    gdf: gpd.GeoDataFrame,
+    dataset: str,
+    taken_at: str,
+    key: str = "asset_id",
+) -> bool:
+    """Appends a snapshot of a dataset to the history store. Row versions are stored once and each asset's history is kept as intervals of consecutive snapshots with the same version, so unchanged rows only extend an interval. Snapshots must be recorded in order of taken_at (see backfill for older copies). Returns False if the snapshot was already recorded."""
+
+    latest = con.execute(
+        "SELECT snapshot_id, taken_at FROM snapshots WHERE dataset = ? ORDER BY taken_at DESC LIMIT 1",
+        (dataset,),
+    ).fetchone()
+    if latest is not None and taken_at <= latest[1]:
+        if taken_at == latest[1]:
+            return False
+        raise ValueError(
+            f"Cannot record {dataset} snapshot from {taken_at} after the snapshot from {latest[1]}"
+        )
+
+    with con:
+        current = store_versions(con, gdf, dataset, key)
+        snapshot_id = con.execute(
+            "INSERT INTO snapshots (dataset, taken_at) VALUES (?, ?)",
+            (dataset, taken_at),
+        ).lastrowid
+        open_intervals = pd.read_sql_query(
+            "SELECT rowid, asset_id, version_id FROM intervals WHERE dataset = ? AND last_snapshot = ?",
+            con,
+            params=(dataset, latest[0] if latest is not None else -1),
+        )
+        merged = current.merge(
+            open_intervals, on=["asset_id", "version_id"], how="left"
+        )
+        unchanged = merged["rowid"].notna()
+        con.executemany(
+            "UPDATE intervals SET last_snapshot = ? WHERE rowid = ?",
+            [(snapshot_id, int(x)) for x in merged.loc[unchanged, "rowid"]],
+        )
+        con.executemany(
+            "INSERT INTO intervals (dataset, asset_id, version_id, first_snapshot, last_snapshot) VALUES (?, ?, ?, ?, ?)",
+            [
+                (dataset, x.asset_id, int(x.version_id), snapshot_id, snapshot_id)
+                for x in merged[~unchanged].itertuples()
+            ],
+        )
+    return True
+
+
+def get_memberships(con: sqlite3.Connection, dataset: str) -> pd.DataFrame:
+    """Expands the intervals of a dataset into the version_id of each asset in each snapshot"""
+    return pd.read_sql_query(
+        """
+        SELECT s.taken_at, i.asset_id, i.version_id
+        FROM intervals i
+        JOIN snapshots f ON f.snapshot_id = i.first_snapshot
+        JOIN snapshots l ON l.snapshot_id = i.last_snapshot
+        JOIN snapshots s ON s.dataset = i.dataset
+            AND s.taken_at BETWEEN f.taken_at AND l.taken_at
+        WHERE i.dataset = ?
+        """,
+        con,
+        params=(dataset,),
+    )
+
+
+def rewrite_intervals(con: sqlite3.Connection, dataset: str, memberships: pd.DataFrame):
+    """Replaces the snapshots and intervals of a dataset given the version_id of each asset in each snapshot, e.g. after inserting snapshots older than the latest one"""
+
+    snapshots = pd.DataFrame(
+        {"taken_at": memberships["taken_at"].drop_duplicates().sort_values()}
+    ).reset_index(drop=True)
+    con.execute("DELETE FROM intervals WHERE dataset = ?", (dataset,))
+    con.execute("DELETE FROM snapshots WHERE dataset = ?", (dataset,))
+    snapshots["snapshot_id"] = [
+        con.execute(
+            "INSERT INTO snapshots (dataset, taken_at) VALUES (?, ?)",
+            (dataset, x),
+        ).lastrowid
+        for x in snapshots["taken_at"]
+    ]
+    snapshots["position"] = snapshots.index
+
+    m = memberships.merge(snapshots, on="taken_at").sort_values(
+        ["asset_id", "position"]
+    )
+    # a new interval starts when the asset, its version, or an unbroken run of snapshots changes
+    new_interval = (
+        (m["asset_id"] != m["asset_id"].shift())
+        | (m["version_id"] != m["version_id"].shift())
+        | (m["position"] != m["position"].shift() + 1)
+    )
+    intervals = m.groupby(new_interval.cumsum()).agg(
+        asset_id=("asset_id", "first"),
+        version_id=("version_id", "first"),
+        first_snapshot=("snapshot_id", "first"),
+        last_snapshot=("snapshot_id", "last"),
+    )
+    con.executemany(
+        "INSERT INTO intervals (dataset, asset_id, version_id, first_snapshot, last_snapshot) VALUES (?, ?, ?, ?, ?)",
+        [(dataset, *x) for x in intervals.itertuples(index=False)],
+    )
+
+
+def backfill(
+    con: sqlite3.Connection,
+    source_dir: str = "source_data",
+    dataset: str = "pfr_washrooms",
+    key: str = "asset_id",
+) -> int:
+    """Records the dated copies of a dataset (e.g. source_data/2024-09-01/pfr_washrooms.geojson) in the history store, using last_modified from each copy's metadata file. Copies older than the latest recorded snapshot are merged into the existing history. Returns the number of snapshots added."""
+
+    copies = {}
+    for meta_path in glob.glob(os.path.join(source_dir, "*", f"{dataset}_meta.json")):
+        with open(meta_path) as f:
+            taken_at = json.load(f)["last_modified"]
+        copies[taken_at] = meta_path.removesuffix("_meta.json") + ".geojson"
+    recorded = set(
+        x[0]
+        for x in con.execute(
+            "SELECT taken_at FROM snapshots WHERE dataset = ?", (dataset,)
+        )
+    )
+    latest = max(recorded, default=None)
+    new = sorted(x for x in copies if x not in recorded)
+    older = [x for x in new if latest is not None and x < latest]
+
+    if older:
+        with con:
+            memberships = [get_memberships(con, dataset)]
+            for taken_at in older:
+                versions = store_versions(
+                    con, gpd.read_file(copies[taken_at]), dataset, key
+                )
+                memberships.append(versions.assign(taken_at=taken_at))
+            rewrite_intervals(con, dataset, pd.concat(memberships))
+    for taken_at in new:
+        if taken_at not in older:
+            record_snapshot(
+                con, gpd.read_file(copies[taken_at]), dataset, taken_at, key
+            )
+    return len(new)
+
+
+def get_status_runs(
+    con: sqlite3.Connection, dataset: str = "pfr_washrooms", asset_id=None
+) -> pd.DataFrame:
+    """Returns each asset's history as runs of consecutive snapshots with the same Status and Reason, with the first and last time each run was seen and whether it is still current"""
+
+    intervals = pd.read_sql_query(
+        INTERVALS_QUERY,
+        con,
+        params={
+            "dataset": dataset,
+            "asset_id": None if asset_id is None else str(asset_id),
+        },
+    )
+    latest = con.execute(
+        "SELECT MAX(snapshot_id) FROM snapshots WHERE dataset = ?", (dataset,)
+    ).fetchone()[0]
+    labels = intervals[["asset_id", "status", "reason"]].fillna("")
+    new_run = (labels != labels.shift()).any(axis=1)
+    return (
+        intervals.groupby(new_run.cumsum(), sort=False)
+        .agg(
+            asset_id=("asset_id", "first"),
+            status=("status", "first"),
+            reason=("reason", "first"),
+            first_seen=("first_seen", "first"),
+            last_seen=("last_seen", "last"),
+            last_snapshot=("last_snapshot", "last"),
+        )
+        .assign(current=lambda df: df["last_snapshot"] == latest)
+        .drop(columns=["last_snapshot"])
+        .reset_index(drop=True)
+    )
+
+
+def get_first_last_seen(
+    con: sqlite3.Connection, dataset: str = "pfr_washrooms"
+) -> pd.DataFrame:
+    """Returns when each asset was first and last seen in the dataset"""
+    return pd.read_sql_query(
+        """
+        SELECT i.asset_id, MIN(f.taken_at) AS first_seen, MAX(l.taken_at) AS last_seen
+        FROM intervals i
+        JOIN snapshots f ON f.snapshot_id = i.first_snapshot
+        JOIN snapshots l ON l.snapshot_id = i.last_snapshot
+        WHERE i.dataset = ?
+        GROUP BY i.asset_id
+        ORDER BY i.asset_id
+        """,
+        con,
+        params=(dataset,),
+    )
+
+
+def get_seasonal_closures(
+    con: sqlite3.Connection,
+    dataset: str = "pfr_washrooms",
+    pattern: str = SEASONAL_PATTERN,
+) -> pd.DataFrame:
+    """Returns runs where an asset was closed (Status 0) with a Reason containing pattern, with the month each closure was first seen, e.g. to find washrooms that close every winter"""
+    runs = get_status_runs(con, dataset)
+    closures = runs[
+        (runs["status"] == "0")
+        & runs["reason"].str.contains(pattern, case=False, na=False)
+    ]
+    return closures.assign(
+        month=pd.to_datetime(closures["first_seen"], format="ISO8601").dt.month
+    ).reset_index(drop=True)
@@ -0,0 +1,132 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+from types import ModuleType
+from typing import Callable, TypedDict
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from resources.dtypes import expand_categoricals
+
+MANIFEST_PATH = "to_import/manifest.json"
+NORMALIZED_DIR = "source_data/cache/normalized"
+REF_TAG = "ref:open.toronto.ca:washroom-facilities:asset_id"
+
+
+class Manifest(TypedDict):
+    code_version: str
+    assets: dict[str, str]
+    partitions: dict[str, str]
+
+
+def code_version(*sources: ModuleType | Callable | str) -> str:
+    """Hashes the source code of the given modules or functions and the content of any given data file paths, so that cached results are discarded when the transformation logic changes"""
+    digest = hashlib.sha256()
+    for source in sources:
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                digest.update(f.read())
+        else:
+            digest.update(inspect.getsource(source).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def fingerprint_rows(gdf: gpd.GeoDataFrame) -> pd.Series:
+    """Returns a hash of each row's attributes and geometry (as WKB) as a hex string. Categorical columns are hashed by value, so rows hash alike with or without compact dtypes."""
+    attributes = pd.util.hash_pandas_object(
+        expand_categoricals(gdf.drop(columns=gdf.geometry.name)).astype(str),
+        index=False,
+    ).to_numpy()
+    geometry = pd.util.hash_pandas_object(
+        pd.Series(shapely.to_wkb(gdf.geometry.to_numpy())), index=False
+    ).to_numpy()
+    combined = pd.util.hash_array(attributes ^ (geometry * np.uint64(31)))
+    return pd.Series([f"{x:016x}" for x in combined], index=gdf.index)
+
+
+def frame_fingerprint(gdf: gpd.GeoDataFrame, *extra: str) -> str:
+    """Hashes a whole GeoDataFrame (column names, row order, attributes, and geometries) together with any extra strings"""
+    digest = hashlib.sha256()
+    digest.update("\x1f".join([*map(str, gdf.columns), *extra]).encode("utf-8"))
+    digest.update("".join(fingerprint_rows(gdf)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Manifest:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {"code_version": "", "assets": {}, "partitions": {}}
+
+
+def save_manifest(manifest: Manifest, path: str = MANIFEST_PATH):
+    write_if_changed(path, json.dumps(manifest, indent=2, sort_keys=True))
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """Writes a text file only if its content would change, so unchanged files keep their modification times. The file is written to a temporary path and renamed into place, so it is never left half-written. Returns whether the file was written."""
+    encoded = content.encode("utf-8")
+    try:
+        with open(path, "rb") as f:
+            if f.read() == encoded:
+                return False
+    except FileNotFoundError:
+        pass
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(encoded)
+    os.replace(tmp_path, path)
+    return True
+
+
+def normalize_incremental(
+    gdf: gpd.GeoDataFrame,
+    normalize: Callable[[gpd.GeoDataFrame], gpd.GeoDataFrame],
+    name: str,
+    fingerprints: pd.Series,
+    version: str,
+    reuse: bool = True,
+) -> gpd.GeoDataFrame:
+    """Applies a normalization function only to rows that changed since the previous run, reusing the previous normalized output (saved under source_data/cache/normalized/<name>.pkl) for rows with the same fingerprint and code version. With reuse=False every row is normalized, but the output is still saved for the next run.
+
+    Rows are matched to previous output by asset_id, and the result has the same index and row order as normalizing all of gdf at once.
+    """
+
+    cache_path = os.path.join(NORMALIZED_DIR, f"{name}.pkl")
+    asset_ids = gdf["asset_id"].astype(str)
+    current = pd.Series(fingerprints.to_numpy(), index=asset_ids.to_numpy())
+    reused = None
+    if reuse and os.path.exists(cache_path):
+        previous = pd.read_pickle(cache_path)
+        if previous["version"] == version:
+            previous_gdf: gpd.GeoDataFrame = previous["gdf"]
+            refs = previous_gdf[REF_TAG]
+            same = refs.map(previous["fingerprints"]) == refs.map(current)
+            reused = previous_gdf[same.fillna(False).to_numpy(dtype=bool)].copy()
+            reused.index = pd.Index(
+                reused[REF_TAG]
+                .map(pd.Series(asset_ids.index, index=asset_ids.to_numpy()))
+                .to_numpy(),
+                name=gdf.index.name,
+            )
+
+    if reused is None or len(reused) == 0:
+        result = normalize(gdf)
+    else:
+        fresh = normalize(gdf[~asset_ids.isin(reused[REF_TAG])])
+        result = pd.concat([reused, fresh]) if len(fresh) > 0 else reused
+        order = np.argsort(gdf.index.get_indexer(result.index), kind="stable")
+        result = result.iloc[order]
+
+    os.makedirs(NORMALIZED_DIR, exist_ok=True)
+    pd.to_pickle(
+        {"version": version, "fingerprints": current.to_dict(), "gdf": result},
+        cache_path,
+    )
+    return result
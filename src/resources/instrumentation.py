@@ -0,0 +1,174 @@
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Iterator, Literal, TypedDict
+
+REPORT_PATH = "to_import/run_report.json"
+PROFILE_DIR = "to_import/profiles"
+TOP_ALLOCATIONS = 10
+
+
+def read_memory_status() -> dict[str, int]:
+    """Reads the current and peak resident set size of this process in bytes (Linux only)"""
+    with open("/proc/self/status") as f:
+        return {
+            k: int(v.split()[0]) * 1024
+            for k, v in (line.split(":", 1) for line in f)
+            if k in ("VmRSS", "VmHWM")
+        }
+
+
+def reset_peak_rss() -> bool:
+    """Resets the peak resident set size of this process, returning False where that is not supported"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class PeakMemory:
+    """Measures how far memory use rose above its starting point while a block ran. Both methods are process-wide, so blocks must not overlap (see RunReport.stage). With the "rss" method (the default on Linux) the process's peak resident set size is reset first, which includes memory allocated by GEOS and other native code; with "tracemalloc" (the default elsewhere) Python and NumPy allocations are traced, and the largest allocation sites are kept in top_allocations."""
+
+    def __init__(self, method: Literal["rss", "tracemalloc"] | None = None):
+        self.method = method or ("rss" if reset_peak_rss() else "tracemalloc")
+        self.peak = 0
+        self.top_allocations: list[dict] = []
+
+    def __enter__(self):
+        if self.method == "rss":
+            reset_peak_rss()
+            self.start = read_memory_status()["VmRSS"]
+        else:
+            tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.method == "rss":
+            self.peak = read_memory_status()["VmHWM"] - self.start
+        else:
+            self.peak = tracemalloc.get_traced_memory()[1]
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            tracemalloc.stop()
+            self.top_allocations = [
+                {"location": str(x.traceback), "mb": round(x.size / 1024 / 1024, 2)}
+                for x in statistics[:TOP_ALLOCATIONS]
+            ]
+
+
+class StageRecord(TypedDict, total=False):
+    name: str
+    wall_seconds: float
+    cpu_seconds: float
+    peak_mb: float | None
+    rows_in: int | None
+    rows_out: int | None
+    cached: bool
+    profile: str
+    top_allocations: list[dict]
+    detail: dict[str, Any]
+
+
+class RunReport:
+    """Records the wall time, CPU time (of all threads), peak memory, and rows in and out of each stage of a run, for saving as a JSON report.
+
+    Stages named in profile (or every stage, if profile includes "all") are also profiled with cProfile, with stats saved to profile_dir/<stage>.prof for use with e.g. snakeviz or pstats. cProfile only sees the thread that runs the stage, so work done in thread pools (e.g. fetching) shows up as waiting. With trace_memory, peak memory is measured with tracemalloc instead of the resident set size, and the largest allocation sites of each stage are included in the report.
+
+    Memory can only be measured for the whole process, so a stage's peak memory is only reported if no other stage ran at the same time (e.g. when stages run in a thread pool), and is None otherwise. Stages that start while another is running are not measured, so they cannot reset another stage's measurement. The peak resident set size of the whole run is reported as peak_rss_mb (Linux only).
+    """
+
+    def __init__(
+        self,
+        profile: list[str] | None = None,
+        trace_memory: bool = False,
+        profile_dir: str = PROFILE_DIR,
+    ):
+        self.profile = profile or []
+        self.trace_memory = trace_memory
+        self.memory_method = "tracemalloc" if trace_memory else PeakMemory().method
+        self.profile_dir = profile_dir
+        self.stages: list[StageRecord] = []
+        # stages that are running, by id, with whether another stage ran at the same time
+        self.active: dict[int, bool] = {}
+        self.lock = threading.Lock()
+        self.peak_rss = 0
+        self.started = datetime.now(timezone.utc)
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+
+    @contextmanager
+    def stage(self, name: str, rows_in: int | None = None) -> Iterator[StageRecord]:
+        """Measures the block as a stage. The block can set rows_out and add details to the yielded record."""
+        record: StageRecord = {"name": name, "rows_in": rows_in, "rows_out": None}
+        profiler = None
+        if name in self.profile or "all" in self.profile:
+            profiler = cProfile.Profile()
+        with self.lock:
+            overlapped = bool(self.active)
+            for other in self.active:
+                self.active[other] = True
+            self.active[id(record)] = overlapped
+            memory = None if overlapped else PeakMemory(self.memory_method)
+            if memory is not None:
+                # keep the run's peak before a stage resets it
+                self.update_peak_rss()
+                memory.__enter__()
+        try:
+            start_wall = time.perf_counter()
+            start_cpu = time.process_time()
+            if profiler is not None:
+                profiler.enable()
+            try:
+                yield record
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+                record["wall_seconds"] = round(time.perf_counter() - start_wall, 4)
+                record["cpu_seconds"] = round(time.process_time() - start_cpu, 4)
+        finally:
+            with self.lock:
+                overlapped = self.active.pop(id(record))
+                if memory is not None:
+                    memory.__exit__(None, None, None)
+                    self.update_peak_rss()
+        if memory is None or overlapped:
+            record["peak_mb"] = None
+        else:
+            record["peak_mb"] = round(memory.peak / 1024 / 1024, 1)
+            if memory.top_allocations:
+                record["top_allocations"] = memory.top_allocations
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            record["profile"] = os.path.join(self.profile_dir, f"{name}.prof")
+            profiler.dump_stats(record["profile"])
+        self.stages.append(record)
+
+    def update_peak_rss(self):
+        """Keeps the highest peak resident set size seen so far, which stages reset"""
+        try:
+            self.peak_rss = max(self.peak_rss, read_memory_status()["VmHWM"])
+        except (OSError, KeyError):
+            pass
+
+    def peak_rss_mb(self) -> float | None:
+        """Returns the peak resident set size of the run so far, or None where it cannot be read"""
+        with self.lock:
+            self.update_peak_rss()
+        return round(self.peak_rss / 1024 / 1024, 1) if self.peak_rss else None
+
+    def to_dict(self, **extra: Any) -> dict:
+        """Returns the report as JSON-serializable data, with any extra top-level entries (e.g. options or validation results)"""
+        return {
+            "started": self.started.isoformat(),
+            "wall_seconds": round(time.perf_counter() - self.start_wall, 4),
+            "cpu_seconds": round(time.process_time() - self.start_cpu, 4),
+            "memory_method": self.memory_method,
+            "peak_rss_mb": self.peak_rss_mb(),
+            **extra,
+            "stages": self.stages,
+        }
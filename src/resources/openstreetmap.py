@@ -1,61 +1,256 @@
-import requests
-from datetime import datetime
+import json
+import os
+import re
+from typing import Any, Iterable, Iterator, TextIO
 
-API_URL = r"http://overpass-api.de/api/interpreter"
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+from resources.cache import HTTPCache, cache_key, get_cache
+
+API_URL = os.environ.get("OVERPASS_API_URL", r"http://overpass-api.de/api/interpreter")
 CRS = "EPSG:4326"
+TIMESTAMP_QUERY = "[out:json][timeout:25];out;"
+
+
+def get_timestamp_osm_base(
+    cache: HTTPCache | None = None, timeout: float | None = None
+) -> str:
+    """Retrieves the timestamp of the OpenStreetMap data currently loaded in Overpass using an empty query"""
+    cache = cache or get_cache()
+    response = cache.session.post(API_URL, data=TIMESTAMP_QUERY, timeout=timeout)
+    response.raise_for_status()
+    return response.json()["osm3s"]["timestamp_osm_base"]
+
 
+def query_overpass_content(
+    query: str, cache: HTTPCache | None = None, timeout: float | None = None
+) -> str:
+    """Returns the body of an Overpass API response as text without decoding the JSON, so that it can be parsed incrementally with iter_overpass"""
+    cache = cache or get_cache()
+    key = cache_key("overpass", API_URL, query)
+    # once the TTL has passed, only download again if the OSM data has changed
+    version = None
+    if cache.lookup(key) is not None and not cache.is_fresh(key):
+        version = get_timestamp_osm_base(cache, timeout)
+    content = cache.fetch(
+        key, "POST", API_URL, data=query, version=version, timeout=timeout
+    ).decode("utf-8")
+    osm3s = next((v for (k, v) in iter_overpass(content) if k == "osm3s"), {})
+    cache.set_version(key, osm3s.get("timestamp_osm_base"))
+    return content
 
-def query_overpass(query: str) -> dict:
-    response = requests.post(API_URL, data=query)
-    data = response.json()
-    data["crs"] = {"type": "name", "properties": {"name": CRS}}
+
+def query_overpass(
+    query: str, cache: HTTPCache | None = None, timeout: float | None = None
+) -> dict:
+    data = json.loads(query_overpass_content(query, cache, timeout))
+    data["crs"] = CRS_MEMBER
     return data
 
 
+CRS_MEMBER = {"type": "name", "properties": {"name": CRS}}
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"[ \t\n\r]*")
+
+
+def _skip(content: str, pos: int, expected: str | None = None) -> tuple[str, int]:
+    pos = _whitespace.match(content, pos).end()
+    char = content[pos : pos + 1]
+    if expected is not None and char not in expected:
+        raise json.JSONDecodeError(f"Expecting one of {expected!r}", content, pos)
+    return char, pos
+
+
+def iter_overpass(content: str) -> Iterator[tuple[str, Any]]:
+    """Incrementally parses an Overpass JSON response, yielding its top-level members as (key, value) pairs in order. The "elements" array is never decoded as a whole: its value is an iterator that decodes one element at a time, and must be consumed before the next pair is requested (anything left is skipped)."""
+
+    _, pos = _skip(content, 0, "{")
+    char, pos = _skip(content, pos + 1)
+    while char != "}":
+        key, pos = _decoder.raw_decode(content, pos)
+        _, pos = _skip(content, pos, ":")
+        _, pos = _skip(content, pos + 1)
+        if key == "elements":
+            end = [pos]
+
+            def iter_elements():
+                _, pos = _skip(content, end[0], "[")
+                char, pos = _skip(content, pos + 1)
+                while char != "]":
+                    element, pos = _decoder.raw_decode(content, pos)
+                    char, pos = _skip(content, pos, ",]")
+                    if char == ",":
+                        char, pos = _skip(content, pos + 1)
+                    end[0] = pos
+                    yield element
+                end[0] = pos + 1
+
+            values = iter_elements()
+            yield key, values
+            for _ in values:
+                pass
+            pos = end[0]
+        else:
+            value, pos = _decoder.raw_decode(content, pos)
+            yield key, value
+        char, pos = _skip(content, pos, ",}")
+        if char == ",":
+            char, pos = _skip(content, pos + 1)
+
+
+def write_overpass_json(content: str, f: TextIO):
+    """Writes an Overpass JSON response to a file with a "crs" member added, formatted the same as json.dump(query_overpass(...), f, indent=2) but one element at a time"""
+    f.write("{")
+    separator = "\n  "
+    for key, value in _iter_with_crs(content):
+        f.write(separator + json.dumps(key) + ": ")
+        separator = ",\n  "
+        if key != "elements":
+            f.write(json.dumps(value, indent=2).replace("\n", "\n  "))
+            continue
+        element_separator = "[\n    "
+        for element in value:
+            f.write(element_separator)
+            f.write(json.dumps(element, indent=2).replace("\n", "\n    "))
+            element_separator = ",\n    "
+        f.write("[]" if element_separator == "[\n    " else "\n  ]")
+    f.write("\n}")
+
+
+def _iter_with_crs(content: str) -> Iterator[tuple[str, Any]]:
+    yield from iter_overpass(content)
+    yield "crs", CRS_MEMBER
+
+
 VIEW_URL = r"https://www.openstreetmap.org/"
-INCLUDE_META = ["type", "id", "version"]
+META_COLUMNS = ["_type", "_id", "_version", "_timestamp", "_url_nwr"]
+# tags selected by the washroom queries (get_current_washrooms and get_washrooms_query)
+WASHROOM_TAGS = {"amenity": "toilets", "building": "toilets"}
 
 
-def feature_from_element(element: dict) -> dict:
-    geometry: dict
-    if "lon" in element and "lat" in element:
-        coords: tuple = (element["lon"], element["lat"])
-        geometry = {
-            "type": "Point",
-            "coordinates": coords,
-        }
-    elif "center" in element:
-        coords: tuple = (element["center"]["lon"], element["center"]["lat"])
-        geometry = {
-            "type": "Point",
-            "coordinates": coords,
-        }
-    elif "geometry" in element:
-        geometry = {
-            "type": "Polygon",
-            "coordinates": [[[e["lon"], e["lat"]] for e in element["geometry"]]],
-        }
-    else:
-        raise KeyError(
-            f"""Unable to find coordinates ("lon", "lat", "center", or "geometry") in element {element["type"] + "/" + str(element["id"])}"""
+def get_relation_geometry(element: dict) -> shapely.Geometry:
+    """Builds the area of a relation from the geometry of its way members (as returned by "out geom"), falling back to its center or the center of its bounds"""
+    lines = [
+        shapely.linestrings([[e["lon"], e["lat"]] for e in member["geometry"]])
+        for member in element.get("members", [])
+        if member["type"] == "way" and len(member.get("geometry") or []) > 1
+    ]
+    if lines:
+        area = shapely.build_area(shapely.geometrycollections(lines))
+        if not area.is_empty:
+            return area
+    if "center" in element:
+        return shapely.Point(element["center"]["lon"], element["center"]["lat"])
+    if "bounds" in element:
+        bounds = element["bounds"]
+        return shapely.Point(
+            (bounds["minlon"] + bounds["maxlon"]) / 2,
+            (bounds["minlat"] + bounds["maxlat"]) / 2,
+        )
+    raise KeyError(
+        f"""Unable to find coordinates ("members", "center", or "bounds") in element relation/{element["id"]}"""
+    )
+
+
+def elements_to_gdf(elements: Iterable[dict], crs: str = CRS) -> gpd.GeoDataFrame:
+    """Converts Overpass elements (e.g. from iter_overpass) into a GeoDataFrame with one column per tag followed by the META_COLUMNS. Nodes and elements with a center become points and ways with a geometry become polygons, built from coordinate buffers with shapely's array constructors; relations become the area of their way members.
+
+    Columns are in the same order as GeoDataFrame.from_features would give them: geometry, the first element's tags, then the META_COLUMNS, then any other tags in order of first appearance.
+    """
+
+    types, ids, versions, timestamps, tags = [], [], [], [], []
+    point_rows, point_coords = [], []
+    ring_rows, ring_coords, ring_lengths = [], [], []
+    relation_rows, relation_geometries = [], []
+    for row, element in enumerate(elements):
+        types.append(element["type"])
+        ids.append(element["id"])
+        versions.append(element.get("version"))
+        timestamps.append(element.get("timestamp"))
+        tags.append(element.get("tags", {}))
+        if element["type"] == "relation":
+            relation_rows.append(row)
+            relation_geometries.append(get_relation_geometry(element))
+        elif "lon" in element and "lat" in element:
+            point_rows.append(row)
+            point_coords.append((element["lon"], element["lat"]))
+        elif "center" in element:
+            point_rows.append(row)
+            point_coords.append((element["center"]["lon"], element["center"]["lat"]))
+        elif "geometry" in element:
+            ring_rows.append(row)
+            ring_coords.extend((e["lon"], e["lat"]) for e in element["geometry"])
+            ring_lengths.append(len(element["geometry"]))
+        else:
+            raise KeyError(
+                f"""Unable to find coordinates ("lon", "lat", "center", or "geometry") in element {element["type"] + "/" + str(element["id"])}"""
+            )
+
+    geometry = np.empty(len(types), dtype=object)
+    geometry[point_rows] = shapely.points(np.array(point_coords).reshape(-1, 2))
+    geometry[ring_rows] = shapely.polygons(
+        shapely.linearrings(
+            np.array(ring_coords).reshape(-1, 2),
+            indices=np.repeat(np.arange(len(ring_lengths)), ring_lengths),
         )
+    )
+    geometry[relation_rows] = relation_geometries
+
+    tag_columns = pd.DataFrame(tags, index=pd.RangeIndex(len(tags)))
+    meta_columns = pd.DataFrame(
+        {
+            "_type": types,
+            "_id": ids,
+            "_version": versions,
+            # convert "Z" suffix to "+00:00"
+            "_timestamp": pd.Series(timestamps, dtype=object).str.replace(
+                r"Z$", "+00:00", regex=True
+            ),
+            "_url_nwr": [f"{VIEW_URL}{type}/{id}" for (type, id) in zip(types, ids)],
+        }
+    )
+    first_tags = list(tags[0]) if tags else []
+    columns = [
+        "geometry",
+        *first_tags,
+        *META_COLUMNS,
+        *[x for x in tag_columns.columns if x not in first_tags],
+    ]
+    return gpd.GeoDataFrame(
+        pd.concat(
+            [pd.Series(geometry, name="geometry"), tag_columns, meta_columns], axis=1
+        )[columns],
+        geometry="geometry",
+        crs=crs,
+    )
+
+
+def iter_features(
+    elements: Iterable[dict], tags: dict[str, str] | None = None
+) -> Iterator[dict]:
+    """Yields the elements that have tags, once each. Skips untagged elements (e.g. the nodes of ways, output by "(._;>;)" or ">;") and elements output again as members. If tags is given, only elements with at least one of those tag values are yielded, so that tagged members output by ">;" (e.g. the entrance node of a building=toilets way) are skipped as well."""
+    seen = set()
+    for element in elements:
+        key = (element["type"], element["id"])
+        element_tags = element.get("tags")
+        if element_tags is None or key in seen:
+            continue
+        if tags is not None and not any(
+            element_tags.get(k) == v for k, v in tags.items()
+        ):
+            continue
+        seen.add(key)
+        yield element
+
 
-    meta_properties = {
-        "_" + key: value for (key, value) in element.items() if key in INCLUDE_META
-    }
-    # convert "Z" suffix to "+00:00"
-    timestamp = {
-        "_timestamp": datetime.fromisoformat(element["timestamp"]).isoformat(),
-    }
-    view_url = {"_url_nwr": VIEW_URL + element["type"] + "/" + str(element["id"])}
-
-    return {
-        "type": "Feature",
-        "properties": {
-            **element["tags"],
-            **meta_properties,
-            **timestamp,
-            **view_url,
-        },
-        "geometry": geometry,
-    }
+def overpass_to_gdf(
+    content: str, tags: dict[str, str] | None = None
+) -> gpd.GeoDataFrame:
+    """Converts the features (see iter_features, with the optional tags filter) in the body of an Overpass JSON response (e.g. from query_overpass_content) into a GeoDataFrame with elements_to_gdf, decoding one element at a time"""
+    for key, value in iter_overpass(content):
+        if key == "elements":
+            return elements_to_gdf(iter_features(value, tags))
+    return elements_to_gdf([])
@@ -0,0 +1,105 @@
+from typing import Iterator, TextIO, TypedDict
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from resources.conflation import REVIEW_TAGS
+from resources.osm_store import TYPE_ORDER, OSMStore
+from resources.osm_xml import write_osm, write_osmchange
+
+# OpenStreetMap stores coordinates to 7 decimal places
+COORDINATE_PRECISION = 7
+
+
+class OSMChanges(TypedDict):
+    create: list[dict]
+    modify: list[dict]
+
+
+def get_import_tags(gdf: gpd.GeoDataFrame) -> list[dict[str, str]]:
+    """Returns the OpenStreetMap tags of each feature: every non-missing value, except for the geometry and DELETE_ columns"""
+    columns = [
+        c for c in gdf.columns if c != gdf.geometry.name and not c.startswith("DELETE_")
+    ]
+    values = gdf[columns].astype(object)
+    values = values.where(values.notna(), None).to_numpy(dtype=object)
+    return [
+        {k: str(v) for k, v in zip(columns, row) if v is not None} for row in values
+    ]
+
+
+def get_changes(gdf: gpd.GeoDataFrame, store: OSMStore) -> OSMChanges:
+    """Converts conflated washrooms (with the DELETE_match_* columns from conflate) into OpenStreetMap changes.
+
+    New washrooms become nodes with negative ids (-1, -2, ... in row order). Matched elements keep their id, version, and existing tag values, and only gain the washroom's tags that they do not have yet (except REVIEW_TAGS such as the survey prompts in note); those whose tags would not change are left out. Conflicting values are listed in DELETE_match_conflicts in the matches layer for review. Ambiguous matches are left out for review in the matches layer, as are matches to elements that are no longer in the store.
+    """
+
+    tags = get_import_tags(gdf)
+    points = shapely.centroid(gdf.geometry.to_crs("EPSG:4326").to_numpy())
+    coords = np.round(shapely.get_coordinates(points), COORDINATE_PRECISION)
+    changes: OSMChanges = {"create": [], "modify": []}
+    for row, (status, key) in enumerate(
+        zip(gdf["DELETE_match_status"], gdf["DELETE_match_osm"])
+    ):
+        if status == "new":
+            changes["create"].append(
+                {
+                    "type": "node",
+                    "id": -len(changes["create"]) - 1,
+                    "lon": coords[row, 0],
+                    "lat": coords[row, 1],
+                    "tags": tags[row],
+                }
+            )
+            continue
+        element = store.get(key) if status != "ambiguous" else None
+        if element is None:
+            continue
+        existing = element.get("tags", {})
+        added = {
+            k: v
+            for k, v in tags[row].items()
+            if k not in existing and k not in REVIEW_TAGS
+        }
+        if added:
+            changes["modify"].append({**element, "tags": {**existing, **added}})
+    return changes
+
+
+def iter_import_elements(
+    changes: OSMChanges, store: OSMStore, bbox: tuple[float, float, float, float]
+) -> Iterator[dict]:
+    """Yields the existing elements in bbox (see OSMStore.query) with the changes applied and marked for JOSM, followed by new nodes, sorted as nodes, ways, then relations"""
+    elements = {(x["type"], x["id"]): x for x in store.query(bbox)}
+    for element in changes["modify"]:
+        elements[(element["type"], element["id"])] = {**element, "action": "modify"}
+        if element["type"] == "way":
+            for node in store.get_way_nodes(element):
+                elements.setdefault(("node", node["id"]), node)
+    for element in changes["create"]:
+        elements[("node", element["id"])] = {**element, "action": "modify"}
+    # new nodes after existing ones, as JOSM saves them
+    order = sorted(elements, key=lambda k: (TYPE_ORDER[k[0]], k[1] < 0, abs(k[1])))
+    for key in order:
+        yield elements[key]
+
+
+def write_import_osm(
+    f: TextIO,
+    changes: OSMChanges,
+    store: OSMStore,
+    bbox: tuple[float, float, float, float],
+):
+    """Writes a JOSM data layer with the changes applied to the existing toilets in bbox, ready to review and upload"""
+    write_osm(
+        f,
+        iter_import_elements(changes, store, bbox),
+        bounds=bbox,
+        origin=None if store.timestamp is None else f"Overpass API {store.timestamp}",
+    )
+
+
+def write_import_osmchange(f: TextIO, changes: OSMChanges):
+    """Writes the changes as an osmChange file"""
+    write_osmchange(f, create=changes["create"], modify=changes["modify"])
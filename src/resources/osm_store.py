@@ -0,0 +1,86 @@
+from typing import TextIO
+
+import numpy as np
+import shapely
+
+from resources.openstreetmap import WASHROOM_TAGS, iter_features, iter_overpass
+from resources.osm_xml import write_osm
+
+TYPE_ORDER = {"node": 0, "way": 1, "relation": 2}
+
+
+def get_element_geometry(element: dict) -> shapely.Geometry:
+    """Returns the geometry that Overpass would test against a bounding box: a node's point, a way's line (from "out geom"), or a relation's bounds"""
+    if "lat" in element and "lon" in element:
+        return shapely.Point(element["lon"], element["lat"])
+    coords = [(e["lon"], e["lat"]) for e in element.get("geometry") or [] if e]
+    if len(coords) > 1:
+        return shapely.LineString(coords)
+    if len(coords) == 1:
+        return shapely.Point(coords[0])
+    if "center" in element:
+        return shapely.Point(element["center"]["lon"], element["center"]["lat"])
+    bounds = element["bounds"]
+    return shapely.box(
+        bounds["minlon"], bounds["minlat"], bounds["maxlon"], bounds["maxlat"]
+    )
+
+
+class OSMStore:
+    """A local copy of amenity=toilets and building=toilets in OpenStreetMap, built from the citywide Overpass response of get_current_washrooms, with a spatial index so that each changeset's bounding box can be queried without another request to Overpass.
+
+    query() gives the same elements as get_washrooms_query: the features (elements tagged amenity=toilets or building=toilets) that intersect the bounding box plus the nodes of any ways among them (like "(._;>;)"). Other tagged members, such as the entrance node of a building=toilets way, are only kept as way nodes. Way nodes come from the response where it includes them (">;"); otherwise they are rebuilt from the way's "out geom" coordinates, without the version that JOSM needs to upload changes to them.
+    """
+
+    def __init__(self, elements: list[dict], timestamp: str | None = None):
+        self.features = list(iter_features(elements, WASHROOM_TAGS))
+        self.index = {f"{x['type']}/{x['id']}": x for x in self.features}
+        self.nodes = {x["id"]: x for x in elements if x["type"] == "node"}
+        self.timestamp = timestamp
+        self.tree = shapely.STRtree([get_element_geometry(x) for x in self.features])
+
+    @classmethod
+    def from_overpass(cls, content: str) -> "OSMStore":
+        """Builds a store from the body of an Overpass JSON response, decoding one element at a time"""
+        elements, timestamp = [], None
+        for key, value in iter_overpass(content):
+            if key == "elements":
+                elements = list(value)
+            elif key == "osm3s":
+                timestamp = value.get("timestamp_osm_base")
+        return cls(elements, timestamp)
+
+    def get(self, key: str) -> dict | None:
+        """Returns a feature by its "type/id" key (as in DELETE_match_osm), or None if it is not in the store"""
+        return self.index.get(key)
+
+    def get_way_nodes(self, way: dict) -> list[dict]:
+        """Returns the nodes of a way, from the response if included, or else from the way's coordinates"""
+        return [
+            self.nodes.get(ref)
+            or {"type": "node", "id": ref, "lat": coords["lat"], "lon": coords["lon"]}
+            for ref, coords in zip(way.get("nodes", []), way.get("geometry", []))
+            if ref in self.nodes or coords
+        ]
+
+    def query(self, bbox: tuple[float, float, float, float]) -> list[dict]:
+        """Returns the features that intersect bbox (minx, miny, maxx, maxy) and the nodes of any ways among them, once each, sorted as nodes, ways, then relations by id"""
+        matches = [
+            self.features[i]
+            for i in np.sort(self.tree.query(shapely.box(*bbox), "intersects"))
+        ]
+        found = {(x["type"], x["id"]): x for x in matches}
+        for element in matches:
+            if element["type"] == "way":
+                for node in self.get_way_nodes(element):
+                    found.setdefault(("node", node["id"]), node)
+        return [found[k] for k in sorted(found, key=lambda k: (TYPE_ORDER[k[0]], k[1]))]
+
+    def write_osm(self, f: TextIO, bbox: tuple[float, float, float, float]):
+        """Writes the result of query(bbox) as an OSM XML file for JOSM, like the response to get_washrooms_query"""
+        write_osm(
+            f,
+            self.query(bbox),
+            bounds=bbox,
+            origin=None if self.timestamp is None else f"Overpass API {self.timestamp}",
+        )
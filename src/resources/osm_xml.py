@@ -0,0 +1,116 @@
+import filecmp
+import os
+import threading
+from typing import Callable, Iterable, TextIO
+from xml.sax.saxutils import escape
+
+GENERATOR = "toronto-osm-washroom-import"
+META_ATTRIBUTES = ["timestamp", "uid", "user", "visible", "version", "changeset"]
+
+
+def quote(value) -> str:
+    """Formats a value as a single-quoted XML attribute value, as JOSM writes them"""
+    return "'" + escape(str(value), {"'": "&apos;", '"': "&quot;", "\n": "&#10;"}) + "'"
+
+
+def write_element(
+    f: TextIO,
+    element: dict,
+    indent: str = "  ",
+    meta: Iterable[str] = META_ATTRIBUTES,
+):
+    """Writes one node, way, or relation in Overpass JSON form (type, id, optional metadata, lat/lon, nodes, members, and tags) as OSM XML. An "action" key (e.g. "modify") is written as JOSM's action attribute. Only the metadata attributes in meta are written."""
+    attributes = [("id", element["id"])]
+    if "action" in element:
+        attributes.append(("action", element["action"]))
+    for key in meta:
+        if key == "visible":
+            attributes.append((key, str(element.get(key, True)).lower()))
+        elif key in element:
+            attributes.append((key, element[key]))
+    if element["type"] == "node":
+        attributes.extend([("lat", element["lat"]), ("lon", element["lon"])])
+    f.write(
+        f"{indent}<{element['type']} "
+        + " ".join(f"{k}={quote(v)}" for k, v in attributes)
+    )
+    children = [
+        *[f"<nd ref={quote(ref)} />" for ref in element.get("nodes", [])],
+        *[
+            f"<member type={quote(m['type'])} ref={quote(m['ref'])} role={quote(m.get('role', ''))} />"
+            for m in element.get("members", [])
+        ],
+        *[
+            f"<tag k={quote(k)} v={quote(v)} />"
+            for k, v in element.get("tags", {}).items()
+        ],
+    ]
+    if not children:
+        f.write(" />\n")
+        return
+    f.write(">\n")
+    for child in children:
+        f.write(f"{indent}  {child}\n")
+    f.write(f"{indent}</{element['type']}>\n")
+
+
+def write_osm(
+    f: TextIO,
+    elements: Iterable[dict],
+    bounds: tuple[float, float, float, float] | None = None,
+    origin: str | None = None,
+    upload: bool = True,
+):
+    """Writes elements (in Overpass JSON form) as an OSM XML file that JOSM can open, one element at a time. Elements should be sorted as nodes, then ways, then relations. bounds are (minx, miny, maxx, maxy). With upload=False, JOSM will refuse to upload the layer."""
+    f.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+    f.write(
+        f"<osm version='0.6' generator={quote(GENERATOR)}"
+        + ("" if upload else " upload='never'")
+        + ">\n"
+    )
+    if bounds is not None:
+        minx, miny, maxx, maxy = bounds
+        f.write(
+            f"  <bounds minlat={quote(miny)} minlon={quote(minx)} maxlat={quote(maxy)} maxlon={quote(maxx)}"
+            + ("" if origin is None else f" origin={quote(origin)}")
+            + " />\n"
+        )
+    for element in elements:
+        write_element(f, element)
+    f.write("</osm>\n")
+
+
+def write_osmchange(
+    f: TextIO,
+    create: Iterable[dict] = (),
+    modify: Iterable[dict] = (),
+    delete: Iterable[dict] = (),
+):
+    """Writes elements (in Overpass JSON form) as an osmChange file, one element at a time. Only versions are written, since changeset ids are assigned when the file is uploaded (e.g. with JOSM or osmium)."""
+    f.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+    f.write(f"<osmChange version='0.6' generator={quote(GENERATOR)}>\n")
+    for action, elements in [
+        ("create", create),
+        ("modify", modify),
+        ("delete", delete),
+    ]:
+        f.write(f"<{action}>\n")
+        for element in elements:
+            write_element(f, element, meta=["version"])
+        f.write(f"</{action}>\n")
+    f.write("</osmChange>\n")
+
+
+def save_xml(path: str, write: Callable[[TextIO], None]) -> bool:
+    """Streams XML to a temporary file next to path with the given write function, then replaces path only if the content changed, so unchanged files keep their modification times. Returns whether the file was written."""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            write(f)
+        if os.path.exists(path) and filecmp.cmp(tmp_path, path, shallow=False):
+            return False
+        os.replace(tmp_path, path)
+        return True
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,182 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from resources.conflation import PROJECTED_CRS
+
+PARTITION_NAME = "partition_name"
+PARTITION_BBOX = "partition_bbox"
+PARTITION_COLUMNS = [PARTITION_NAME, PARTITION_BBOX]
+DEFAULT_CELL_SIZE = 2000  # metres
+
+
+def get_bbox(minx: float, miny: float, maxx: float, maxy: float) -> str:
+    """Formats bounds as an Overpass bounding box (south,west,north,east)"""
+    return f"{miny},{minx},{maxy},{maxx}"
+
+
+def parse_bbox(bbox: str) -> tuple[float, float, float, float]:
+    """Converts an Overpass bounding box back into (minx, miny, maxx, maxy) bounds"""
+    miny, minx, maxy, maxx = [float(x) for x in bbox.split(",")]
+    return minx, miny, maxx, maxy
+
+
+def get_boundaries(gdf: gpd.GeoDataFrame, name_column: str) -> gpd.GeoDataFrame:
+    """Converts any boundary layer (e.g. wards, neighbourhoods, or community councils) into a partition layer with a name and Overpass bounding box for each area"""
+    return gpd.GeoDataFrame(
+        {
+            PARTITION_NAME: gdf[name_column].astype(str).to_numpy(),
+            PARTITION_BBOX: [get_bbox(*x) for x in gdf.bounds.itertuples(index=False)],
+        },
+        geometry=gdf.geometry.to_numpy(),
+        crs=gdf.crs,
+    )
+
+
+def get_grid(
+    gdf: gpd.GeoDataFrame, cell_size: float = DEFAULT_CELL_SIZE
+) -> gpd.GeoDataFrame:
+    """Generates a partition layer of square grid cells (cell_size metres wide) covering the features in gdf. Only cells that contain at least one feature are included, named by row and column from the south-west corner."""
+
+    points = shapely.get_coordinates(
+        gdf.geometry.to_crs(PROJECTED_CRS).centroid.to_numpy()
+    )
+    origin = np.floor(points.min(axis=0) / cell_size) * cell_size
+    cells = np.unique(np.floor((points - origin) / cell_size).astype(int), axis=0)
+    cols, rows = cells[:, 0], cells[:, 1]
+    boxes = gpd.GeoSeries(
+        shapely.box(
+            origin[0] + cols * cell_size,
+            origin[1] + rows * cell_size,
+            origin[0] + (cols + 1) * cell_size,
+            origin[1] + (rows + 1) * cell_size,
+        ),
+        crs=PROJECTED_CRS,
+    ).to_crs(gdf.crs)
+    width = len(str(max(rows.max(), cols.max())))
+    return get_boundaries(
+        gpd.GeoDataFrame(
+            {"name": [f"Grid {r:0{width}d}-{c:0{width}d}" for r, c in cells[:, ::-1]]},
+            geometry=boxes.to_numpy(),
+            crs=gdf.crs,
+        ),
+        "name",
+    )
+
+
+class BoundaryIndex:
+    """A partition layer (as returned by get_boundaries or get_grid) with a spatial index and prepared geometries for fast batched lookups. Can be pickled; geometries are prepared again when unpickled."""
+
+    def __init__(self, boundaries: gpd.GeoDataFrame):
+        self.boundaries = boundaries[[*PARTITION_COLUMNS, "geometry"]]
+        self.tree = shapely.STRtree(self.boundaries.geometry.to_numpy())
+        self._prepare()
+
+    def _prepare(self):
+        self._geometries = self.boundaries.geometry.to_numpy()
+        shapely.prepare(self._geometries)
+
+    def __getstate__(self):
+        return {"boundaries": self.boundaries, "tree": self.tree}
+
+    def __setstate__(self, state):
+        self.boundaries = state["boundaries"]
+        self.tree = state["tree"]
+        self._prepare()
+
+    def lookup(self, geometries: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """Finds the boundary areas that each geometry intersects. Returns (geometry, boundary) positional index pairs sorted by geometry, which may include several boundaries per geometry (in spatial index order, as with a spatial join) if areas overlap."""
+        geometry_pos, boundary_pos = self.tree.query(geometries)
+        hits = shapely.intersects(
+            self._geometries[boundary_pos], geometries[geometry_pos]
+        )
+        order = np.argsort(geometry_pos[hits], kind="stable")
+        return geometry_pos[hits][order], boundary_pos[hits][order]
+
+
+def split_bounds(
+    points: np.ndarray,
+    bounds: tuple[float, float, float, float],
+    max_size: int,
+) -> list[tuple[np.ndarray, tuple[float, float, float, float]]]:
+    """Recursively splits points (an array of lon/lat coordinates) at the median of the longer side of their bounds until each part has at most max_size points, like a k-d tree. Returns the positions of the points in each part along with the part's bounds, which together cover the original bounds."""
+
+    positions = np.arange(len(points))
+    if len(points) <= max_size:
+        return [(positions, bounds)]
+
+    minx, miny, maxx, maxy = bounds
+    # compare sides in metres rather than degrees
+    width = (maxx - minx) * np.cos(np.radians((miny + maxy) / 2))
+    axis = 0 if width >= maxy - miny else 1
+    order = np.argsort(points[:, axis], kind="stable")
+    half = len(points) // 2
+    left, right = order[:half], order[half:]
+    split = (points[left[-1], axis] + points[right[0], axis]) / 2
+    if axis == 0:
+        left_bounds, right_bounds = (minx, miny, split, maxy), (split, miny, maxx, maxy)
+    else:
+        left_bounds, right_bounds = (minx, miny, maxx, split), (minx, split, maxx, maxy)
+
+    parts = []
+    for side, side_bounds in [(left, left_bounds), (right, right_bounds)]:
+        side = np.sort(side)
+        for sub_positions, sub_bounds in split_bounds(
+            points[side], side_bounds, max_size
+        ):
+            parts.append((side[sub_positions], sub_bounds))
+    return parts
+
+
+def split_oversized(gdf: gpd.GeoDataFrame, max_size: int) -> gpd.GeoDataFrame:
+    """Splits partitions with more than max_size features into balanced parts named "<partition> - <n>", each with the bounding box of its part of the original partition"""
+
+    names = gdf[PARTITION_NAME].to_numpy(dtype=object).copy()
+    bboxes = gdf[PARTITION_BBOX].to_numpy(dtype=object).copy()
+    points = shapely.get_coordinates(shapely.centroid(gdf.geometry.to_numpy()))
+    for name, positions in gdf.groupby(PARTITION_NAME).indices.items():
+        if len(positions) <= max_size:
+            continue
+        parts = split_bounds(
+            points[positions], parse_bbox(bboxes[positions[0]]), max_size
+        )
+        width = len(str(len(parts)))
+        for i, (part_positions, part_bounds) in enumerate(parts, start=1):
+            names[positions[part_positions]] = f"{name} - {i:0{width}d}"
+            bboxes[positions[part_positions]] = get_bbox(*part_bounds)
+    return gdf.assign(**{PARTITION_NAME: names, PARTITION_BBOX: bboxes})
+
+
+def assign_partitions(
+    gdf: gpd.GeoDataFrame,
+    boundaries: BoundaryIndex | gpd.GeoDataFrame,
+    max_size: int | None = None,
+) -> gpd.GeoDataFrame:
+    """Adds partition_name and partition_bbox columns to gdf from the boundary areas (a BoundaryIndex, or a layer as returned by get_boundaries or get_grid) that each feature falls in, splitting partitions with more than max_size features. Like a left spatial join, features in overlapping areas are repeated and features outside every boundary have no partition."""
+
+    if not isinstance(boundaries, BoundaryIndex):
+        boundaries = BoundaryIndex(boundaries)
+    feature_pos, boundary_pos = boundaries.lookup(
+        gdf.geometry.to_crs(boundaries.boundaries.crs).to_numpy()
+    )
+
+    # keep features without any boundary, in their original order
+    missing = np.setdiff1d(np.arange(len(gdf)), feature_pos)
+    order = np.argsort(np.concatenate([feature_pos, missing]), kind="stable")
+    feature_pos = np.concatenate([feature_pos, missing])[order]
+    boundary_pos = np.concatenate([boundary_pos, np.full(len(missing), -1)])[order]
+
+    partitioned = gdf.iloc[feature_pos]
+    for column in PARTITION_COLUMNS:
+        values = boundaries.boundaries[column].to_numpy(dtype=object)[boundary_pos]
+        values[boundary_pos == -1] = None
+        partitioned = partitioned.assign(**{column: values})
+    if max_size is not None:
+        partitioned = split_oversized(partitioned, max_size)
+    return partitioned
+
+
+def group_partitions(gdf: gpd.GeoDataFrame) -> dict[str, gpd.GeoDataFrame]:
+    """Splits the output of assign_partitions into a GeoDataFrame for each partition, sorted by name"""
+    # observed=True so that unused categories of a categorical partition_name are not grouped
+    return {k: v for k, v in gdf.groupby(PARTITION_NAME, observed=True)}
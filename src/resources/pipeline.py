@@ -0,0 +1,229 @@
+import glob
+import hashlib
+import json
+import os
+import pickle
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from types import ModuleType
+from typing import Any, Callable, Iterable, TypedDict
+
+import pandas as pd
+
+from resources.incremental import code_version
+from resources.instrumentation import RunReport
+from resources.validation import content_hash
+
+STAGES_DIR = "source_data/cache/stages"
+
+
+class Stage(TypedDict):
+    fn: Callable[..., Any]
+    inputs: list[str]
+    code: list[ModuleType | Callable | str]
+    params: dict[str, Any]
+    persist: bool
+    key: Callable[[Any], str] | None
+    detail: Callable[[Any], dict] | None
+
+
+def fingerprint_value(value: Any) -> str:
+    """Hashes a stage output by content: text as is, DataFrames with validation.content_hash, mappings and sequences item by item, and anything else by its pickle"""
+    digest = hashlib.sha256()
+    if isinstance(value, str):
+        digest.update(b"s" + value.encode("utf-8"))
+    elif isinstance(value, pd.DataFrame):
+        digest.update(b"d" + content_hash(value).encode("utf-8"))
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            digest.update(f"k{k}\x1f{fingerprint_value(v)}".encode("utf-8"))
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            digest.update(f"i{fingerprint_value(v)}".encode("utf-8"))
+    else:
+        digest.update(b"p" + pickle.dumps(value))
+    return digest.hexdigest()
+
+
+def count_rows(value: Any) -> int | None:
+    """Counts the rows of a stage output: a DataFrame, the first item of a tuple, or all DataFrames in a dict"""
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, tuple) and value:
+        return count_rows(value[0])
+    if isinstance(value, dict):
+        frames = [x for x in value.values() if isinstance(x, pd.DataFrame)]
+        return sum(len(x) for x in frames) if frames else None
+    return None
+
+
+class Pipeline:
+    """A DAG of named stages, each a function of the outputs of the stages it names as inputs.
+
+    A stage's output is persisted under path, keyed by a hash of its name, its code (the stage function and any given modules, functions, or data files), its params, and the keys of its inputs. With reuse=True, a stage whose key is unchanged is loaded from disk instead of run, and its inputs are only run or loaded if something else needs them, so a re-run only executes the stages invalidated by changed inputs or code. Stages without inputs (e.g. downloads) always run, and are keyed by a hash of their output. Stages with persist=False (e.g. those that save files) always run when needed.
+
+    Independent stages run in parallel in a thread pool of workers threads. Each stage is recorded in the run report, where stages loaded from disk are marked as cached; stages that overlap others have no peak memory of their own (see RunReport), so run with workers=1 to measure every stage.
+
+    Persisted outputs are also kept in memo, by name with their key. A long-running process can pass the same memo to each run, so that unchanged stages are reused from memory rather than loaded from disk.
+    """
+
+    def __init__(
+        self,
+        report: RunReport,
+        reuse: bool = True,
+        workers: int | None = None,
+        path: str = STAGES_DIR,
+        memo: dict[str, tuple[str, Any]] | None = None,
+    ):
+        self.report = report
+        self.reuse = reuse
+        self.workers = workers
+        self.path = path
+        self.memo = {} if memo is None else memo
+        self.stages: dict[str, Stage] = {}
+
+    def add(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        inputs: Iterable[str] = (),
+        code: Iterable[ModuleType | Callable | str] = (),
+        params: dict[str, Any] | None = None,
+        persist: bool = True,
+        key: Callable[[Any], str] | None = None,
+        detail: Callable[[Any], dict] | None = None,
+    ):
+        """Adds a stage, called as fn(*outputs of inputs). Inputs must already be added. key (for stages without inputs) hashes the output, defaulting to fingerprint_value, and detail returns extra information about the output for the run report."""
+        inputs = list(inputs)
+        missing = [x for x in inputs if x not in self.stages]
+        if missing:
+            raise ValueError(f"Stage {name} has unknown inputs: {missing}")
+        self.stages[name] = {
+            "fn": fn,
+            "inputs": inputs,
+            "code": list(code),
+            "params": params or {},
+            "persist": persist,
+            "key": key,
+            "detail": detail,
+        }
+
+    def get_key(self, name: str, keys: dict[str, str]) -> str:
+        stage = self.stages[name]
+        digest = hashlib.sha256()
+        digest.update(name.encode("utf-8"))
+        digest.update(code_version(stage["fn"], *stage["code"]).encode("utf-8"))
+        digest.update(
+            json.dumps(stage["params"], sort_keys=True, default=str).encode("utf-8")
+        )
+        for input_name in stage["inputs"]:
+            digest.update(keys[input_name].encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_path(self, name: str, key: str) -> str:
+        return os.path.join(self.path, f"{name}-{key[:20]}.pkl")
+
+    def save(self, name: str, key: str, value: Any):
+        """Persists a stage output, replacing outputs saved with other keys"""
+        os.makedirs(self.path, exist_ok=True)
+        path = self.get_path(name, key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        pd.to_pickle(value, tmp_path)
+        os.replace(tmp_path, path)
+        for previous in glob.glob(
+            os.path.join(glob.escape(self.path), f"{name}-*.pkl")
+        ):
+            if previous != path:
+                os.remove(previous)
+
+    def is_saved(self, name: str, key: str) -> bool:
+        return self.memo.get(name, ("",))[0] == key or os.path.exists(
+            self.get_path(name, key)
+        )
+
+    def execute(self, name: str, inputs: list[Any] | None, key: str | None) -> Any:
+        """Runs a stage (or loads it from memo or disk, if inputs is None) as a stage of the run report"""
+        stage = self.stages[name]
+        rows_in = count_rows(inputs[0]) if inputs else None
+        with self.report.stage(name, rows_in=rows_in) as record:
+            if inputs is None:
+                if self.memo.get(name, ("",))[0] == key:
+                    value = self.memo[name][1]
+                else:
+                    value = pd.read_pickle(self.get_path(name, key))
+                record["cached"] = True
+            else:
+                value = stage["fn"](*inputs)
+                if key is not None and stage["persist"]:
+                    self.save(name, key, value)
+            if key is not None and stage["persist"]:
+                self.memo[name] = (key, value)
+            record["rows_out"] = count_rows(value)
+            if stage["detail"] is not None:
+                record["detail"] = stage["detail"](value)
+        return value
+
+    def run(self, targets: Iterable[str]) -> dict[str, Any]:
+        """Runs or loads the target stages and whatever they need, returning the outputs of every stage that was run or loaded, keyed by stage name"""
+
+        # stages that the targets depend on, in the order they were added
+        targets = list(targets)
+        needed = set(targets)
+        for name in reversed(self.stages):
+            if name in needed:
+                needed.update(self.stages[name]["inputs"])
+        order = [x for x in self.stages if x in needed]
+
+        # stages without inputs run first, since the other keys depend on their output
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {
+                name: executor.submit(self.execute, name, [], None)
+                for name in order
+                if not self.stages[name]["inputs"]
+            }
+            values = {name: future.result() for name, future in futures.items()}
+        keys = {
+            name: (self.stages[name]["key"] or fingerprint_value)(values[name])
+            for name in values
+        }
+        for name in order:
+            if name not in keys:
+                keys[name] = self.get_key(name, keys)
+
+        # work backwards from the targets to find which stages can be loaded
+        plan: dict[str, str] = {}
+        wanted = set(targets)
+        for name in reversed(order):
+            if name not in wanted or name in values:
+                continue
+            stage = self.stages[name]
+            if self.reuse and stage["persist"] and self.is_saved(name, keys[name]):
+                plan[name] = "load"
+            else:
+                plan[name] = "run"
+                wanted.update(stage["inputs"])
+
+        # run each stage as soon as the stages it needs are done
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            running: dict[Future, str] = {}
+            try:
+                while plan or running:
+                    for name in [x for x in order if x in plan]:
+                        inputs = self.stages[name]["inputs"]
+                        if plan[name] == "load":
+                            args = None
+                        elif all(x in values for x in inputs):
+                            args = [values[x] for x in inputs]
+                        else:
+                            continue
+                        del plan[name]
+                        future = executor.submit(self.execute, name, args, keys[name])
+                        running[future] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        values[running.pop(future)] = future.result()
+            except BaseException:
+                for future in running:
+                    future.cancel()
+                raise
+        return values
@@ -0,0 +1,43 @@
+import os
+import threading
+
+import geopandas as gpd
+import pyarrow.parquet as pq
+import pyogrio
+
+SNAPSHOT_EXTENSION = ".parquet"
+
+
+def save_snapshot(gdf: gpd.GeoDataFrame, path: str):
+    """Saves a GeoDataFrame as a GeoParquet snapshot with typed columns and WKB geometry, written to a temporary file and renamed into place"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    gdf.to_parquet(tmp_path, index=False, write_covering_bbox=True)
+    os.replace(tmp_path, path)
+
+
+def read_snapshot(
+    path: str,
+    columns: list[str] | None = None,
+    bbox: tuple[float, float, float, float] | None = None,
+) -> gpd.GeoDataFrame:
+    """Loads a GeoParquet snapshot saved by save_snapshot, memory mapped and reading only the given columns (plus geometry) and the row groups that intersect bbox"""
+    if columns is not None and "geometry" not in columns:
+        columns = [*columns, "geometry"]
+    return gpd.read_parquet(path, columns=columns, bbox=bbox, memory_map=True)
+
+
+def get_source_columns(path: str) -> list[str]:
+    """Lists the attribute columns of a source_data file without loading it"""
+    if path.endswith(SNAPSHOT_EXTENSION):
+        return [x for x in pq.read_schema(path).names if x != "geometry"]
+    return list(pyogrio.read_info(path)["fields"])
+
+
+def read_source(
+    path: str,
+    columns: list[str] | None = None,
+) -> gpd.GeoDataFrame:
+    """Loads a source_data file, either a GeoParquet snapshot or any format readable by geopandas (e.g. the GeoJSON copies), optionally reading only the given columns"""
+    if path.endswith(SNAPSHOT_EXTENSION):
+        return read_snapshot(path, columns)
+    return gpd.read_file(path, columns=columns)
@@ -0,0 +1,83 @@
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+
+class TextRepair:
+    """Applies lists of regex fixes (mapping pattern to replacement, e.g. encoding_fixes and spelling_fixes) to the string columns of a DataFrame.
+
+    Fix lists are applied in order, so e.g. spelling fixes see the text produced by encoding fixes, as with successive DataFrame.replace calls. The patterns of each list are compiled into one alternation, so each value is scanned once per list however many fixes it has. Within a list, where fixes match at the same position the one listed first wins, and a fix cannot match text produced by another fix of the same list. Unlike DataFrame.replace, which leaves "string" columns with missing values unchanged, every string value is repaired. Repairs are memoized per distinct value, and the number of replacements made by each fix is counted in fired.
+    """
+
+    def __init__(self, *fix_lists: dict[str, str]):
+        self.fixes = [(k, v) for fixes in fix_lists for (k, v) in fixes.items()]
+        self.patterns = [re.compile(pattern) for (pattern, _) in self.fixes]
+        # one alternation per fix list, with groups numbered by position in self.fixes
+        self.passes: list[re.Pattern] = []
+        start = 0
+        for fixes in fix_lists:
+            if fixes:
+                self.passes.append(
+                    re.compile(
+                        "|".join(
+                            f"(?P<_{start + i}>{pattern})"
+                            for i, pattern in enumerate(fixes)
+                        )
+                    )
+                )
+            start += len(fixes)
+        self.memo: dict[str, tuple[str, Counter]] = {}
+        self.fired: Counter = Counter()
+
+    def repair_value(self, value: str) -> tuple[str, Counter]:
+        """Repairs one string, returning the repaired string and the number of replacements made by each fix"""
+        if value in self.memo:
+            return self.memo[value]
+        fired = Counter()
+
+        def replace(match: re.Match) -> str:
+            i = int(match.lastgroup[1:])
+            fired[self.fixes[i][0]] += 1
+            # substitute with the fix's own pattern so that backreferences work
+            return self.patterns[i].sub(self.fixes[i][1], match.group(), count=1)
+
+        repaired = value
+        for combined in self.passes:
+            repaired = combined.sub(replace, repaired)
+        result = (repaired, fired)
+        self.memo[value] = result
+        return result
+
+    def repair_series(self, s: pd.Series) -> pd.Series:
+        """Repairs every distinct string value in a Series once, leaving other values (e.g. missing values) unchanged"""
+        codes, uniques = pd.factorize(s, use_na_sentinel=True)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        repaired = np.empty(len(uniques), dtype=object)
+        changed = False
+        for i, value in enumerate(uniques):
+            if not isinstance(value, str):
+                repaired[i] = value
+                continue
+            repaired[i], fired = self.repair_value(value)
+            changed = changed or repaired[i] != value
+            for pattern, n in fired.items():
+                self.fired[pattern] += n * int(counts[i])
+        if not changed:
+            return s
+        values = s.to_numpy(dtype=object, copy=True)
+        present = codes >= 0
+        values[present] = repaired[codes[present]]
+        return pd.Series(values, index=s.index, name=s.name).astype(s.dtype)
+
+    def repair(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Repairs the string columns (object or string dtype) of a DataFrame, leaving other columns untouched"""
+        return df.assign(
+            **{
+                name: self.repair_series(column)
+                for name, column in df.items()
+                if pd.api.types.is_object_dtype(column.dtype)
+                or pd.api.types.is_string_dtype(column.dtype)
+            }
+        )
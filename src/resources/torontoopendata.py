@@ -1,11 +1,17 @@
-import requests
+import io
+import json
+import os
 from typing import TypedDict
 
 import geopandas as gpd
 import pandas as pd
 
+from resources.cache import HTTPCache, cache_key, get_cache
 
-BASE_URL = "https://ckan0.cf.opendata.inter.prod-toronto.ca"
+
+BASE_URL = os.environ.get(
+    "TORONTO_OPEN_DATA_URL", "https://ckan0.cf.opendata.inter.prod-toronto.ca"
+)
 PACKAGE_URL = BASE_URL + "/api/3/action/package_show"
 
 
@@ -14,14 +20,50 @@ class TODResponse(TypedDict):
     metadata: dict
 
 
-def request_tod_gdf(dataset_name: str, resource_id: str) -> TODResponse:
+def request_tod_metadata(
+    dataset_name: str,
+    resource_id: str,
+    cache: HTTPCache | None = None,
+    timeout: float | None = None,
+    ttl: float | None = None,
+) -> dict:
+    """Retrieves the CKAN metadata for a single resource of an open.toronto.ca dataset. Cached metadata is revalidated once it is older than ttl (default: the cache's TTL)."""
+    cache = cache or get_cache()
     meta_params = {"id": dataset_name}
-    meta_all = requests.get(PACKAGE_URL, params=meta_params).json()
+    meta_all = json.loads(
+        cache.fetch(
+            cache_key("ckan", "package_show", PACKAGE_URL, dataset_name),
+            "GET",
+            PACKAGE_URL,
+            params=meta_params,
+            ttl=ttl,
+            timeout=timeout,
+        )
+    )
     [meta_resource] = [
         rs for rs in meta_all["result"]["resources"] if rs["id"] == resource_id
     ]
+    return meta_resource
+
+
+def request_tod_gdf(
+    dataset_name: str,
+    resource_id: str,
+    cache: HTTPCache | None = None,
+    timeout: float | None = None,
+) -> TODResponse:
+    cache = cache or get_cache()
+    meta_resource = request_tod_metadata(dataset_name, resource_id, cache, timeout)
+    # resource content only needs to be downloaded again if last_modified changes
+    content = cache.fetch(
+        cache_key("ckan", "resource", resource_id),
+        "GET",
+        meta_resource["url"],
+        version=meta_resource["last_modified"],
+        timeout=timeout,
+    )
     gdf: gpd.GeoDataFrame = (
-        gpd.read_file(meta_resource["url"]).replace("None", pd.NA).convert_dtypes()
+        gpd.read_file(io.BytesIO(content)).replace("None", pd.NA).convert_dtypes()
     )
     return {
         "gdf": gdf,
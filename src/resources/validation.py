@@ -0,0 +1,193 @@
+import hashlib
+import inspect
+import json
+import os
+import threading
+import time
+from types import FunctionType
+from typing import Callable, Literal
+
+import numpy as np
+import pandas as pd
+import pandera as pa
+import shapely
+from geopandas.array import GeometryDtype
+
+from resources.dtypes import expand_categoricals
+
+VALIDATION_CACHE_PATH = "source_data/cache/validation.json"
+DEFAULT_SAMPLE_SIZE = 10000
+
+ValidationMode = Literal["full", "sample"]
+
+
+def check_list_values(
+    known_values: list[str], sep: str = ", "
+) -> Callable[[pd.Series], pd.Series]:
+    """Returns a vectorized check for columns of sep-separated lists, passing rows where every list item is in known_values. The column is split and exploded once instead of building a Series per row. Empty and missing items pass."""
+
+    def check(s: pd.Series) -> pd.Series:
+        items = s.reset_index(drop=True).replace("", pd.NA).str.split(sep).explode()
+        passed = items.isna() | items.isin(known_values)
+        return pd.Series(
+            passed.groupby(level=0).all().to_numpy(dtype=bool), index=s.index
+        )
+
+    return check
+
+
+def check_any_tag(tags: dict[str, str]) -> Callable[[pd.DataFrame], pd.Series]:
+    """Returns a vectorized check for DataFrames of OpenStreetMap features (one column per tag key), passing rows that have at least one of the given tag values. Tag keys without a column are treated as missing."""
+
+    def check(df: pd.DataFrame) -> pd.Series:
+        passed = pd.Series(False, index=df.index)
+        for k, v in tags.items():
+            if k in df.columns:
+                passed |= (df[k] == v).fillna(False).astype(bool)
+        return passed
+
+    return check
+
+
+def check_num_geometries(n: int = 1) -> Callable[[pd.Series], pd.Series]:
+    """Returns a vectorized check that each (multi-part) geometry has exactly n parts, e.g. one coordinate pair per MultiPoint"""
+
+    def check(s: pd.Series) -> pd.Series:
+        return pd.Series(shapely.get_num_geometries(s.to_numpy()) == n, index=s.index)
+
+    return check
+
+
+def content_hash(df: pd.DataFrame) -> str:
+    """Hashes the column names, dtypes, and values (geometries as WKB) of a DataFrame, ignoring the index"""
+    digest = hashlib.sha256()
+    digest.update(str(len(df)).encode("utf-8"))
+    for name, column in df.items():
+        digest.update(f"\x1f{name}\x1f{column.dtype}\x1f".encode("utf-8"))
+        if isinstance(column.dtype, GeometryDtype):
+            values = pd.Series(shapely.to_wkb(column.to_numpy()))
+        else:
+            values = column.astype(str)
+        digest.update(pd.util.hash_pandas_object(values, index=False).to_numpy())
+    return digest.hexdigest()
+
+
+def describe_check(check: pa.Check) -> str:
+    fn = check._check_fn
+    if not isinstance(fn, FunctionType):
+        # built-in checks are described fully by their name and statistics
+        return f"{check.name}{check.statistics}"
+    try:
+        source = inspect.getsource(fn)
+    except OSError:
+        source = fn.__qualname__
+    closure = [cell.cell_contents for cell in fn.__closure__ or []]
+    return f"{check.name}{check.statistics}{source}{closure!r}"
+
+
+def schema_hash(schema: pa.DataFrameSchema) -> str:
+    """Hashes a schema's columns, dtypes, and checks (including the source code and captured values of custom checks), so that cached results are discarded when a schema changes"""
+    digest = hashlib.sha256()
+    digest.update(repr(schema).encode("utf-8"))
+    for name, column in schema.columns.items():
+        digest.update(
+            f"\x1f{name}{column.dtype}{column.nullable}{column.unique}{column.required}".encode(
+                "utf-8"
+            )
+        )
+        for check in column.checks:
+            digest.update(describe_check(check).encode("utf-8"))
+    for check in schema.checks:
+        digest.update(describe_check(check).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class Validator:
+    """Validates DataFrames with pandera schemas, skipping validation entirely when the same schema has already passed on the same content.
+
+    Results are remembered under source_data/cache/validation.json, keyed by a name for each validation step, so each step only keeps its most recent passing input. The time taken by each step in this process (including hashing) is kept in records. In "sample" mode, inputs with more than sample_size rows are validated on a reproducible random sample of rows (so uniqueness is only checked within the sample).
+    """
+
+    def __init__(
+        self,
+        mode: ValidationMode = "full",
+        sample_size: int = DEFAULT_SAMPLE_SIZE,
+        path: str = VALIDATION_CACHE_PATH,
+    ):
+        self.mode = mode
+        self.sample_size = sample_size
+        self.path = path
+        self.lock = threading.Lock()
+        self.records: list[dict] = []
+
+    def load(self) -> dict[str, str]:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def save(self, results: dict[str, str]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def validate(
+        self,
+        schema: pa.DataFrameSchema,
+        df: pd.DataFrame,
+        name: str,
+        lazy: bool = False,
+    ) -> bool:
+        """Validates the columns of df that are in the schema (or a sample of its rows), raising pandera's errors if validation fails. Categorical columns (see resources.dtypes) are validated as their categories' dtype, so compact and uncompacted inputs validate (and are cached) alike. Returns False if validation was skipped because this content already passed."""
+
+        subset = df[[x for x in df.columns if x in schema.columns]]
+        if self.mode == "sample" and len(subset) > self.sample_size:
+            subset = subset.iloc[
+                np.sort(
+                    np.random.default_rng(0).choice(
+                        len(subset), self.sample_size, replace=False
+                    )
+                )
+            ]
+        start = time.perf_counter()
+        subset = expand_categoricals(subset)
+        key = f"{schema_hash(schema)}:{content_hash(subset)}"
+        with self.lock:
+            skipped = self.load().get(name) == key
+        if not skipped:
+            schema.validate(subset, lazy=lazy)
+        with self.lock:
+            if not skipped:
+                results = self.load()
+                results[name] = key
+                self.save(results)
+            self.records.append(
+                {
+                    "name": name,
+                    "rows": len(subset),
+                    "skipped": skipped,
+                    "seconds": round(time.perf_counter() - start, 4),
+                }
+            )
+        return not skipped
+
+
+_default_validator: Validator | None = None
+
+
+def get_validator() -> Validator:
+    """Returns the shared validator used by generate_imports, creating it with default settings if needed"""
+    global _default_validator
+    if _default_validator is None:
+        _default_validator = Validator()
+    return _default_validator
+
+
+def configure_validation(**kwargs) -> Validator:
+    """Replaces the shared validator, e.g. configure_validation(mode="sample")"""
+    global _default_validator
+    _default_validator = Validator(**kwargs)
+    return _default_validator
@@ -0,0 +1,62 @@
+import time
+import traceback
+from datetime import datetime
+from typing import Callable
+
+from resources.cache import HTTPCache, get_cache
+from resources.openstreetmap import get_timestamp_osm_base
+from resources.torontoopendata import request_tod_metadata
+
+
+def poll_versions(
+    ckan_sources: dict[str, dict[str, str]],
+    cache: HTTPCache | None = None,
+    timeout: float | None = None,
+) -> dict[str, str]:
+    """Returns the current version of each source: the last_modified value of each CKAN resource (given as dataset_name and resource_id keyword arguments by source name) and the timestamp_osm_base of Overpass (as "overpass"). Only metadata is requested, and cached metadata is always revalidated, which costs a 304 response when it has not changed."""
+    cache = cache or get_cache()
+    versions = {
+        name: request_tod_metadata(**source, cache=cache, timeout=timeout, ttl=0)[
+            "last_modified"
+        ]
+        for name, source in ckan_sources.items()
+    }
+    versions["overpass"] = get_timestamp_osm_base(cache, timeout)
+    return versions
+
+
+def log(message: str):
+    print(f"[{datetime.now().isoformat(timespec='seconds')}] {message}", flush=True)
+
+
+def watch(
+    poll: Callable[[], dict[str, str]],
+    rebuild: Callable[[], None],
+    interval: float,
+    max_polls: int | None = None,
+    sleep: Callable[[float], None] = time.sleep,
+):
+    """Calls poll every interval seconds and rebuild whenever the versions it returns change, starting with a rebuild on the first poll. Poll errors (e.g. a server that is down or returns malformed metadata) and rebuild errors are logged and retried on the next poll, so the loop keeps running; a failed rebuild is retried even if nothing changed again. Stops after max_polls polls, if given."""
+    built: dict[str, str] | None = None
+    polls = 0
+    while max_polls is None or polls < max_polls:
+        if polls > 0:
+            sleep(interval)
+        polls += 1
+        try:
+            versions = poll()
+        except Exception as e:
+            # e.g. a server that is down, or one that returns unexpected JSON
+            log(f"Poll failed, retrying in {interval:g} seconds: {e!r}")
+            continue
+        if versions == built:
+            continue
+        changed = [k for k, v in versions.items() if built is None or built.get(k) != v]
+        log(f"Rebuilding; changed: {', '.join(changed)}")
+        try:
+            rebuild()
+        except Exception:
+            log(f"Rebuild failed:\n{traceback.format_exc()}")
+            continue
+        built = versions
+        log(f"Rebuilt; next poll in {interval:g} seconds")
@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import threading
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# each step sets what the stand-in server returns before a poll, and whether a rebuild is expected
+SCENARIO = [
+    ("first poll", {}, True),
+    ("unchanged", {}, False),
+    ("malformed JSON", {"package_show": "malformed"}, False),
+    ("missing result", {"package_show": "missing"}, False),
+    ("server error", {"package_show": "error"}, False),
+    ("changed last_modified", {"last_modified": "2025-02-16T10:00:00"}, True),
+    ("unchanged after change", {}, False),
+    ("changed Overpass timestamp", {"timestamp": "2025-02-16T11:00:00Z"}, True),
+]
+
+
+class StandIn(BaseHTTPRequestHandler):
+    """Answers package_show for the watched CKAN datasets and Overpass timestamp queries from the server's state"""
+
+    def send(self, status: int, body: str):
+        encoded = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def do_GET(self):
+        state = self.server.state
+        url = urlparse(self.path)
+        if not url.path.endswith("/package_show"):
+            return self.send(404, "{}")
+        mode = state.get("package_show")
+        if mode == "malformed":
+            return self.send(200, "<html>not json</html>")
+        if mode == "missing":
+            return self.send(200, json.dumps({"success": True}))
+        if mode == "error":
+            return self.send(500, "{}")
+        [dataset_name] = parse_qs(url.query)["id"]
+        resource_id = state["resource_ids"][dataset_name]
+        resource = {"id": resource_id, "last_modified": state["last_modified"]}
+        self.send(200, json.dumps({"result": {"resources": [resource]}}))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send(
+            200,
+            json.dumps(
+                {"osm3s": {"timestamp_osm_base": self.server.state["timestamp"]}}
+            ),
+        )
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = ArgumentParser(
+        description="Drives the --watch loop against a local stand-in CKAN and Overpass server through changed, unchanged, and failed polls, without building the import. Exits with an error if a rebuild is missed or unexpected."
+    )
+    parser.add_argument("--port", type=int, default=0, help="Default: any free port")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    # the server URLs are read when these modules are imported
+    os.environ["TORONTO_OPEN_DATA_URL"] = url
+    os.environ["OVERPASS_API_URL"] = f"{url}/api/interpreter"
+    from resources.cache import HTTPCache
+    from resources.watch import log, poll_versions, watch
+
+    from generate_imports import CKAN_SOURCES, WATCHED_SOURCES
+
+    sources = {name: CKAN_SOURCES[name] for name in WATCHED_SOURCES}
+    server.state = {
+        "resource_ids": {x["dataset_name"]: x["resource_id"] for x in sources.values()},
+        "last_modified": "2025-02-15T10:00:00",
+        "timestamp": "2025-02-15T10:00:00Z",
+    }
+    steps = iter(SCENARIO)
+    expected, rebuilt = [], []
+
+    def poll() -> dict[str, str]:
+        name, changes, rebuild = next(steps)
+        server.state.pop("package_show", None)
+        server.state.update(changes)
+        log(f"Step: {name}")
+        expected.append(rebuild)
+        rebuilt.append(False)
+        return poll_versions(sources, cache)
+
+    def rebuild():
+        rebuilt[-1] = True
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = HTTPCache(cache_dir=cache_dir, ttl=0)
+        watch(poll, rebuild, interval=0, max_polls=len(SCENARIO), sleep=lambda _: None)
+    server.shutdown()
+
+    if rebuilt != expected:
+        missed = [s[0] for s, e, r in zip(SCENARIO, expected, rebuilt) if e != r]
+        raise SystemExit(f"Unexpected rebuilds (or missed rebuilds) at: {missed}")
+    log(f"All {len(SCENARIO)} polls behaved as expected")
+
+
+if __name__ == "__main__":
+    main()